@@ -0,0 +1,54 @@
+import random
+
+import fitz  # PyMuPDF
+
+LOREM = (
+    "cache memory latency bandwidth pipeline register branch predictor "
+    "virtual address translation page table scheduler thread process "
+    "lock contention throughput queue buffer interrupt kernel"
+).split()
+
+# Named text densities for benchmarks: title-ish slides up to code dumps
+DENSITIES = {
+    "light": {"bullets": 3},
+    "normal": {"bullets": 6},
+    "dense": {"bullets": 14},
+    "code": {"bullets": 1, "code_lines": 24},
+    "buildup": {"bullets": 5, "builds": 5},
+}
+
+def make_deck(path, pages=40, bullets=6, seed=0, code_lines=0, scan_kb=0, builds=0):
+    """Write a synthetic lecture deck: a title line plus `bullets` bullet
+    points (and optionally `code_lines` of monospace code) and a couple of
+    shapes per page, at 16:9 slide size. `scan_kb` adds an incompressible
+    image of roughly that size to every page, like a scanned deck. With
+    `builds`, pages come in runs of that many that reveal the bullets one
+    more at a time, like a PowerPoint build-up."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    rows = bullets + code_lines
+    spacing = min(50, 380 / max(1, rows))
+    fontsize = min(18, spacing * 0.7)
+    for n in range(pages):
+        page = doc.new_page(width=960, height=540)
+        step = n % builds if builds else 0
+        if step == 0:
+            title = f"Lecture slide {n + 1}: {' '.join(rng.sample(LOREM, 3)).title()}"
+            lines = ["- " + " ".join(rng.choice(LOREM) for _ in range(rng.randint(5, 12))) for _ in range(bullets)]
+        page.insert_text((60, 80), title, fontsize=28)
+        shown = bullets - (builds - 1 - step) if builds else bullets
+        for b, text in enumerate(lines[:max(1, shown)]):
+            page.insert_text((80, 140 + b * spacing), text, fontsize=fontsize)
+        for c in range(code_lines):
+            a, b = rng.sample(LOREM, 2)
+            text = f"    {a}_{c} = {b}(buf[{c}], n={rng.randint(1, 64)})  # {rng.choice(LOREM)}"
+            page.insert_text((80, 140 + (bullets + c) * spacing), text, fontsize=fontsize, fontname="cour")
+        page.draw_rect(fitz.Rect(700, 140, 900, 300), color=(0.2, 0.4, 0.8), fill=(0.85, 0.9, 1.0))
+        page.draw_circle(fitz.Point(800, 400), 60, color=(0.8, 0.3, 0.2))
+        if scan_kb:
+            side = max(8, int((scan_kb * 1024 / 3) ** 0.5))
+            noise = fitz.Pixmap(fitz.csRGB, side, side, rng.randbytes(side * side * 3), False)
+            page.insert_image(fitz.Rect(60, 330, 260, 530), pixmap=noise)
+    doc.save(path)
+    doc.close()
+    return path
@@ -0,0 +1,104 @@
+"""
+Study-guide export timing. Starts the stand-in LLM and a fresh backend,
+ingests a synthetic deck, expands it once through /expand/batch so every
+slide has a cached expansion, then exports it through /export/pdf and
+reports time to first byte, total time, time per output page and the peak
+RSS of the backend and its render workers.
+
+    python -m bench.export --pages 200 --layout vertical
+    python -m bench.export --pages 200 --start 50 --end 80
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from bench.decks import make_deck
+from bench.run import BACKEND_DIR, free_port, wait_for, peak_rss_mb
+
+def count_pdf_pages(data):
+    import fitz
+    with fitz.open("pdf", data) as doc:
+        return doc.page_count
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--start", type=int, default=1)
+    parser.add_argument("--end", type=int, default=None)
+    parser.add_argument("--layout", default="vertical", choices=["vertical", "horizontal"])
+    parser.add_argument("--tokens", type=int, default=400, help="tokens per stand-in expansion")
+    args = parser.parse_args()
+
+    llm_port, api_port = free_port(), free_port()
+    llm = f"http://127.0.0.1:{llm_port}"
+    base = f"http://127.0.0.1:{api_port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"{llm}/v1",
+            "ASSET_STORE_DIR": os.path.join(tmp, "assets"),
+            "EXPANSION_CACHE_DIR": os.path.join(tmp, "cache"),
+            "SESSION_STORE_DIR": os.path.join(tmp, "sessions"),
+            "JOBS_DIR": os.path.join(tmp, "jobs"),
+            "PREFETCH_AHEAD": "0",
+        }
+        procs = [
+            subprocess.Popen([
+                sys.executable, "-m", "bench.fake_llm", "--port", str(llm_port), "--ttft-ms", "5",
+                "--tokens-per-sec", "100000", "--tokens", str(args.tokens), "--seed", "0"
+            ], cwd=BACKEND_DIR, env=env),
+            subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ),
+        ]
+        try:
+            wait_for(f"{llm}/stats")
+            wait_for(f"{base}/health")
+            deck = make_deck(os.path.join(tmp, "deck.pdf"), pages=args.pages, seed=1)
+            with open(deck, "rb") as f:
+                manifest = httpx.post(
+                    f"{base}/api/v1/upload/pdf", files={"file": ("deck.pdf", f, "application/pdf")}, timeout=600
+                ).json()
+            with httpx.stream("POST", f"{base}/api/v1/expand/batch", json={
+                "doc_id": manifest["doc_id"], "include_text": False, "api_key": "bench", "provider": "openai"
+            }, timeout=600) as response:
+                for _ in response.iter_lines():
+                    pass
+
+            body = {
+                "deck_id": manifest["deck_id"], "start": args.start, "end": args.end,
+                "layout": args.layout, "provider": "openai"
+            }
+            started = time.perf_counter()
+            ttfb = None
+            data = bytearray()
+            with httpx.stream("POST", f"{base}/api/v1/export/pdf", json=body, timeout=600) as response:
+                response.raise_for_status()
+                for chunk in response.iter_bytes():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - started
+                    data += chunk
+            elapsed = time.perf_counter() - started
+            rss = peak_rss_mb(procs[1].pid)
+        finally:
+            for proc in procs:
+                proc.terminate()
+                proc.wait()
+
+    slides = min(args.end or args.pages, args.pages) - args.start + 1
+    pages = count_pdf_pages(bytes(data))
+    print(
+        f"export {slides} slides -> {pages} pages, {len(data) / 1e6:.1f} MB  "
+        f"first byte {ttfb * 1000:.0f}ms  total {elapsed:.2f}s  "
+        f"{elapsed * 1000 / pages:.1f} ms/page  {elapsed * 1000 / slides:.1f} ms/slide"
+    )
+    print(f"peak rss: api {rss['api']}MB, {rss['workers']} workers {rss['workers_total']}MB")
+
+if __name__ == "__main__":
+    main()
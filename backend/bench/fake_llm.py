@@ -0,0 +1,150 @@
+"""
+Stand-in for an OpenAI-compatible chat completions API, so the backend can be
+benchmarked offline. Streams `--tokens` tokens after `--ttft-ms`, at
+`--tokens-per-sec`, and can inject failures:
+
+    --fail-rate      share of requests answered with HTTP 500
+    --throttle-rate  share answered with HTTP 429 (with retry-after)
+    --drop-rate      share cut off halfway through the stream
+    --rpm            enforce a requests-per-minute token bucket (with --burst
+                     capacity): x-ratelimit-* headers on every response, 429
+                     with retry-after once it runs dry
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:PORT/v1 and/or
+GROQ_BASE_URL=http://127.0.0.1:PORT (Groq's SDK appends /openai/v1/...).
+
+    python -m bench.fake_llm --port 8900 --ttft-ms 300 --tokens-per-sec 80
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "The <mark data-id=\"0\">cache</mark> keeps recently used data close to the "
+    "processor, so a hit avoids a slow trip to main memory. Each level trades "
+    "size for latency. When the working set outgrows it, misses dominate and "
+    "throughput drops. Prefetching and locality help hide that cost."
+).split(" ")
+
+def create_app(ttft_ms=300, tokens_per_sec=80.0, tokens=200, fail_rate=0.0,
+               throttle_rate=0.0, drop_rate=0.0, seed=None, rpm=0.0, burst=None):
+    app = FastAPI()
+    rng = random.Random(seed)
+    capacity = float(burst or rpm)
+    bucket = {"level": capacity, "updated": time.monotonic()}
+    # "cancelled": streams the caller hung up on before the end
+    stats = {"requests": 0, "failed": 0, "throttled": 0, "dropped": 0, "cancelled": 0}
+
+    def chunk(model, content=None, finish=None):
+        return "data: " + json.dumps({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": {"content": content} if content is not None else {},
+                "finish_reason": finish
+            }]
+        }) + "\n\n"
+
+    async def completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "bench")
+        stats["requests"] += 1
+        headers = {"x-ratelimit-limit-requests": "10000", "x-ratelimit-remaining-requests": "9999"}
+        if rpm > 0:
+            now = time.monotonic()
+            rate = rpm / 60
+            bucket["level"] = min(capacity, bucket["level"] + (now - bucket["updated"]) * rate)
+            bucket["updated"] = now
+            if bucket["level"] < 1:
+                stats["throttled"] += 1
+                return JSONResponse(
+                    {"error": {"message": "rate limit reached", "type": "rate_limit_error"}},
+                    status_code=429,
+                    headers={"retry-after": f"{(1 - bucket['level']) / rate:.3f}"}
+                )
+            bucket["level"] -= 1
+            headers = {
+                "x-ratelimit-limit-requests": str(int(capacity)),
+                "x-ratelimit-remaining-requests": str(int(bucket["level"])),
+                # Time until the bucket is full again, in OpenAI's format
+                "x-ratelimit-reset-requests": f"{(capacity - bucket['level']) / rate:.3f}s",
+            }
+        roll = rng.random()
+        if roll < fail_rate:
+            stats["failed"] += 1
+            return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=500)
+        if roll < fail_rate + throttle_rate:
+            stats["throttled"] += 1
+            return JSONResponse(
+                {"error": {"message": "injected rate limit", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"retry-after": "1", "x-ratelimit-remaining-requests": "0"}
+            )
+        drop = roll < fail_rate + throttle_rate + drop_rate
+
+        async def stream():
+            try:
+                await asyncio.sleep(ttft_ms / 1000)
+                interval = 1 / tokens_per_sec if tokens_per_sec > 0 else 0
+                started = time.perf_counter()
+                for i in range(tokens):
+                    if drop and i == tokens // 2:
+                        stats["dropped"] += 1
+                        raise ConnectionError("injected mid-stream drop")
+                    yield chunk(model, WORDS[i % len(WORDS)] + " ")
+                    # Pace against the clock rather than sleeping a fixed interval,
+                    # so event-loop lag doesn't lower the effective rate
+                    delay = started + (i + 1) * interval - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                yield chunk(model, finish="stop")
+                yield "data: [DONE]\n\n"
+            except (asyncio.CancelledError, GeneratorExit):
+                stats["cancelled"] += 1
+                raise
+
+        return StreamingResponse(
+            stream(),
+            media_type="text/event-stream",
+            headers=headers
+        )
+
+    # OpenAI (base_url .../v1) and Groq (base_url ..., SDK adds /openai/v1)
+    app.post("/v1/chat/completions")(completions)
+    app.post("/openai/v1/chat/completions")(completions)
+    app.get("/stats")(lambda: stats)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-sec", type=float, default=80)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--rpm", type=float, default=0.0)
+    parser.add_argument("--burst", type=float, default=None)
+    args = parser.parse_args()
+
+    app = create_app(
+        ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec, tokens=args.tokens,
+        fail_rate=args.fail_rate, throttle_rate=args.throttle_rate,
+        drop_rate=args.drop_rate, seed=args.seed, rpm=args.rpm, burst=args.burst
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Cold-start import report: runs `python -X importtime -c "import main"` in a
+fresh interpreter and totals the time per top-level package, so heavy
+imports that sneak back onto the startup path are easy to spot.
+
+    python -m bench.import_times
+    python -m bench.import_times --module main --top 15 --json out.json
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_times(module):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time: <self> | <cumulative> | <indented name>"
+        parts = line[len("import time:"):].split("|")
+        self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2]
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((depth, name.strip(), self_us, cumulative_us))
+    return rows
+
+def by_package(rows):
+    # Self time summed per top-level package; our own modules stay separate
+    totals = {}
+    for _, name, self_us, _ in rows:
+        top = name if name.split(".")[0] in ("services", "routers") else name.split(".")[0]
+        totals[top] = totals.get(top, 0) + self_us
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", default=None, help="also write the report here")
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    total_us = max((r[3] for r in rows if r[1] == args.module), default=0)
+    packages = sorted(by_package(rows).items(), key=lambda item: -item[1])
+
+    print(f"import {args.module}: {total_us / 1000:.0f}ms total")
+    for name, us in packages[:args.top]:
+        print(f"  {name:<32} {us / 1000:8.1f}ms")
+    heavy = ["google", "openai", "groq", "fitz", "pymupdf", "PIL", "grpc"]
+    loaded = [name for name in heavy if any(r[1].split(".")[0] == name for r in rows)]
+    print(f"heavy packages on the startup path: {', '.join(loaded) or 'none'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "module": args.module,
+                "total_ms": total_us / 1000,
+                "packages_ms": {name: us / 1000 for name, us in packages},
+                "heavy_loaded": loaded
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measure ingest throughput (pages/sec) as the render pool grows from 1 to N
+worker processes.
+
+    python -m bench.ingest_scaling --pages 120 --max-workers 8
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from bench.decks import make_deck
+from services.pdf import iter_slides, page_count
+from services.store import LocalAssetStore
+
+async def run(path, store, workers, chunk_pages):
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        # Warm the pool so process start-up isn't billed to the first run
+        await asyncio.gather(*[
+            asyncio.get_running_loop().run_in_executor(executor, page_count, path)
+            for _ in range(workers)
+        ])
+        start = time.perf_counter()
+        pages = 0
+        async for _ in iter_slides(path, store, executor=executor, chunk_pages=chunk_pages):
+            pages += 1
+        return pages / (time.perf_counter() - start)
+    finally:
+        executor.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-pages", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_deck(os.path.join(tmp, "deck.pdf"), pages=args.pages)
+        print(f"{args.pages} pages, chunk={args.chunk_pages}, cpus={os.cpu_count()}")
+        baseline = None
+        workers = 1
+        while workers <= args.max_workers:
+            rate = asyncio.run(run(path, LocalAssetStore(os.path.join(tmp, "assets")), workers, args.chunk_pages))
+            baseline = baseline or rate
+            print(f"workers={workers:<3} {rate:8.1f} pages/s  x{rate / baseline:.2f}")
+            workers *= 2
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Interactive latency under a provider rate limit. Starts the stand-in LLM with
+a requests-per-minute bucket (--rpm, --burst) and a backend, kicks off a
+whole-deck /expand/batch, and while it runs asks /chat questions every
+--chat-every-ms. Reports chat time-to-first-token and failures, how many
+batch slides finished, and how many 429s the stand-in sent - with the
+scheduler on and off (SCHEDULER_ENABLED).
+
+    python -m bench.rate_limits --rpm 60 --burst 4 --pages 16 --chats 6
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import httpx
+
+from bench.decks import make_deck
+from bench.run import BACKEND_DIR, free_port, wait_for, percentile
+
+def scheduler_metrics(base):
+    counts = {}
+    for line in httpx.get(f"{base}/metrics").text.splitlines():
+        for name in ("unslide_scheduler_rejected_total", "unslide_llm_rate_limited_total"):
+            if line.startswith(name + "{"):
+                counts[name] = counts.get(name, 0) + float(line.rsplit(" ", 1)[1])
+    return counts
+
+def run_batch(base, doc_id, result):
+    body = {"doc_id": doc_id, "include_text": False, "api_key": "bench", "provider": "openai"}
+    done = failed = 0
+    with httpx.stream("POST", f"{base}/api/v1/expand/batch", json=body, timeout=300) as response:
+        for line in response.iter_lines():
+            record = json.loads(line)
+            done += record["type"] == "done"
+            failed += record["type"] == "error"
+    result.update(done=done, failed=failed)
+
+def ask(client, number):
+    body = {
+        "question": "Why does locality matter?", "slide_content": "Caches", "slide_number": number,
+        "api_key": "bench", "provider": "openai"
+    }
+    started = time.perf_counter()
+    ttft = None
+    text = ""
+    try:
+        with client.stream("POST", "/api/v1/chat", json=body) as response:
+            for chunk in response.iter_text():
+                if chunk and not text:
+                    ttft = time.perf_counter() - started
+                text += chunk
+    except httpx.HTTPError:
+        # The stream is aborted when every backend failed
+        return None
+    return ttft if response.status_code == 200 else None
+
+def run(args, tmp, enabled):
+    llm_port, api_port = free_port(), free_port()
+    llm = f"http://127.0.0.1:{llm_port}"
+    base = f"http://127.0.0.1:{api_port}"
+    tag = "on" if enabled else "off"
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"{llm}/v1",
+        "ASSET_STORE_DIR": os.path.join(tmp, f"assets-{tag}"),
+        "EXPANSION_CACHE_DIR": os.path.join(tmp, f"cache-{tag}"),
+        "SESSION_STORE_DIR": os.path.join(tmp, f"sessions-{tag}"),
+        "JOBS_DIR": os.path.join(tmp, f"jobs-{tag}"),
+        "SCHEDULER_ENABLED": "1" if enabled else "0",
+    }
+    fake = [
+        sys.executable, "-m", "bench.fake_llm", "--port", str(llm_port), "--ttft-ms", str(args.ttft_ms),
+        "--tokens-per-sec", "400", "--tokens", "60", "--seed", "0", "--rpm", str(args.rpm)
+    ]
+    if args.burst:
+        fake += ["--burst", str(args.burst)]
+    procs = [
+        subprocess.Popen(fake, cwd=BACKEND_DIR, env=env),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ),
+    ]
+    try:
+        wait_for(f"{llm}/stats")
+        wait_for(f"{base}/health")
+        deck = make_deck(os.path.join(tmp, "deck.pdf"), pages=args.pages, seed=1)
+        with open(deck, "rb") as f:
+            manifest = httpx.post(
+                f"{base}/api/v1/upload/pdf", files={"file": ("deck.pdf", f, "application/pdf")}, timeout=120
+            ).json()
+
+        batch = {}
+        worker = threading.Thread(target=run_batch, args=(base, manifest["doc_id"], batch))
+        worker.start()
+        ttfts = []
+        with httpx.Client(base_url=base, timeout=60) as client:
+            for i in range(args.chats):
+                time.sleep(args.chat_every_ms / 1000)
+                ttfts.append(ask(client, i + 1))
+        worker.join()
+        counts = scheduler_metrics(base)
+        throttled = httpx.get(f"{llm}/stats").json()["throttled"]
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+    answered = [t for t in ttfts if t is not None]
+    return {
+        "scheduler": tag,
+        "chat_ok": f"{len(answered)}/{len(ttfts)}",
+        "chat_ttft_p50_ms": round(percentile(answered, 50) * 1000, 1) if answered else None,
+        "chat_ttft_max_ms": round(max(answered) * 1000, 1) if answered else None,
+        "batch_done": batch.get("done"),
+        "batch_failed": batch.get("failed"),
+        "upstream_429": throttled,
+        "rejected": int(counts.get("unslide_scheduler_rejected_total", 0)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rpm", type=float, default=60)
+    parser.add_argument("--burst", type=float, default=4)
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--chats", type=int, default=6)
+    parser.add_argument("--chat-every-ms", type=float, default=1500)
+    parser.add_argument("--ttft-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for enabled in (False, True):
+            r = run(args, tmp, enabled)
+            print("  ".join(f"{k}={v}" for k, v in r.items()))
+
+if __name__ == "__main__":
+    main()
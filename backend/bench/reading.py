@@ -0,0 +1,124 @@
+"""
+Simulated reader for tuning speculative pre-expansion (PREFETCH_AHEAD).
+For each look-ahead k, starts the stand-in LLM and a fresh backend, ingests
+a deck and reads it front to back: open a slide, read its expansion, dwell,
+move on, jumping to a random slide now and then. Reports time-to-first-token
+per slide, the prefetch hit and waste ratios from /metrics, and how many
+upstream calls were made per slide read.
+
+    python -m bench.reading --ahead 0 1 2 4 --pages 12 --dwell-ms 1500 --jump-rate 0.1
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from bench.decks import make_deck
+from bench.run import BACKEND_DIR, free_port, wait_for, percentile
+
+def prefetch_counts(base):
+    counts = {}
+    for line in httpx.get(f"{base}/metrics").text.splitlines():
+        if line.startswith("unslide_prefetch_total{"):
+            result = line.split('result="', 1)[1].split('"', 1)[0]
+            counts[result] = float(line.rsplit(" ", 1)[1])
+    return counts
+
+def read_deck(base, deck_id, pages, dwell, jump_rate, seed):
+    rng = random.Random(seed)
+    ttfts = []
+    number = 1
+    with httpx.Client(base_url=base, timeout=120) as client:
+        for _ in range(pages):
+            body = {"deck_id": deck_id, "slide_number": number, "api_key": "bench", "provider": "openai"}
+            started = time.perf_counter()
+            ttft = None
+            with client.stream("POST", "/api/v1/expand", json=body) as response:
+                for text in response.iter_text():
+                    if text and ttft is None:
+                        ttft = time.perf_counter() - started
+            ttfts.append(ttft or 0.0)
+            time.sleep(dwell)
+            number = rng.randint(1, pages) if rng.random() < jump_rate else number % pages + 1
+    return ttfts
+
+def run(args, tmp, ahead):
+    llm_port, api_port = free_port(), free_port()
+    llm = f"http://127.0.0.1:{llm_port}"
+    base = f"http://127.0.0.1:{api_port}"
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"{llm}/v1",
+        "ASSET_STORE_DIR": os.path.join(tmp, f"assets-{ahead}"),
+        "EXPANSION_CACHE_DIR": os.path.join(tmp, f"cache-{ahead}"),
+        "SESSION_STORE_DIR": os.path.join(tmp, f"sessions-{ahead}"),
+        "JOBS_DIR": os.path.join(tmp, f"jobs-{ahead}"),
+        "PREFETCH_AHEAD": str(ahead),
+    }
+    procs = [
+        subprocess.Popen([
+            sys.executable, "-m", "bench.fake_llm", "--port", str(llm_port), "--ttft-ms", str(args.ttft_ms),
+            "--tokens-per-sec", str(args.tokens_per_sec), "--tokens", str(args.tokens), "--seed", "0"
+        ], cwd=BACKEND_DIR, env=env),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ),
+    ]
+    try:
+        wait_for(f"{llm}/stats")
+        wait_for(f"{base}/health")
+        deck = make_deck(os.path.join(tmp, "deck.pdf"), pages=args.pages, seed=1)
+        with open(deck, "rb") as f:
+            manifest = httpx.post(
+                f"{base}/api/v1/upload/pdf", files={"file": ("deck.pdf", f, "application/pdf")}, timeout=120
+            ).json()
+        ttfts = read_deck(base, manifest["deck_id"], args.pages, args.dwell_ms / 1000, args.jump_rate, args.seed)
+        counts = prefetch_counts(base)
+        upstream = httpx.get(f"{llm}/stats").json()["requests"]
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+    started = counts.get("started", 0)
+    return {
+        "ahead": ahead,
+        "ttft_p50_ms": round(percentile(ttfts, 50) * 1000, 1),
+        "ttft_p90_ms": round(percentile(ttfts, 90) * 1000, 1),
+        "prefetched": int(started),
+        "hit_ratio": round(counts.get("hit", 0) / started, 2) if started else None,
+        # At the end of the run, any prefetch that wasn't read was wasted
+        # (the server only counts "unused" once it stops tracking one)
+        "waste_ratio": round((started - counts.get("hit", 0)) / started, 2) if started else None,
+        "upstream_per_slide": round(upstream / len(ttfts), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ahead", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--dwell-ms", type=float, default=1500)
+    parser.add_argument("--jump-rate", type=float, default=0.1)
+    parser.add_argument("--ttft-ms", type=float, default=800)
+    parser.add_argument("--tokens-per-sec", type=float, default=300)
+    parser.add_argument("--tokens", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for ahead in args.ahead:
+            r = run(args, tmp, ahead)
+            print(
+                f"ahead={r['ahead']:<2} ttft p50 {r['ttft_p50_ms']:>7.1f}ms p90 {r['ttft_p90_ms']:>7.1f}ms  "
+                f"prefetched {r['prefetched']:>3}  hit {r['hit_ratio']}  waste {r['waste_ratio']}  "
+                f"upstream/slide {r['upstream_per_slide']}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+End-to-end benchmark against a local stand-in LLM (bench/fake_llm.py), so it
+runs offline and without API keys. Starts the stand-in and the backend as
+subprocesses with throwaway stores, then measures:
+
+  - ingest pages/sec for synthetic decks of several sizes and densities
+  - /expand and /chat time-to-first-token, tokens/sec and p50/p90/p99 latency
+    under --clients concurrent clients (and /expand again, from the cache)
+  - peak RSS of the backend and its render workers
+
+Results go to bench/results/<timestamp>-<commit>.json; pass --baseline with an
+earlier result to print the deltas.
+
+    python -m bench.run --clients 8 --requests 4 --pages 60
+    python -m bench.run --baseline bench/results/20250101-120000-abc1234.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import httpx
+
+from bench.decks import make_deck, DENSITIES
+from services.tokens import estimate_tokens
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+def _status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(c) for c in f.read().split()]
+    except OSError:
+        return []
+
+def peak_rss_mb(pid):
+    # High-water marks from /proc (Linux only; 0 elsewhere): API process and
+    # the render workers it spawned
+    workers = [_status_kb(c, "VmHWM") for c in _children(pid)]
+    return {
+        "api": round(_status_kb(pid, "VmHWM") / 1024, 1),
+        "workers_total": round(sum(workers) / 1024, 1),
+        "workers": len(workers),
+    }
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def summarize(samples, wall):
+    ok = [s for s in samples if s["ok"]]
+    ttft = [s["ttft"] for s in ok]
+    total = [s["total"] for s in ok]
+    rates = [s["tokens"] / (s["total"] - s["ttft"]) for s in ok if s["total"] > s["ttft"]]
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "ttft_ms": {"p50": ms(percentile(ttft, 50)), "p90": ms(percentile(ttft, 90)), "p99": ms(percentile(ttft, 99))},
+        "latency_ms": {"p50": ms(percentile(total, 50)), "p90": ms(percentile(total, 90)), "p99": ms(percentile(total, 99))},
+        "tokens_per_sec_per_stream": round(sum(rates) / len(rates), 1) if rates else None,
+        "tokens_per_sec_total": round(sum(s["tokens"] for s in ok) / wall, 1) if wall else None,
+        "wall_s": round(wall, 3),
+    }
+
+async def timed_stream(client, url, body):
+    started = time.perf_counter()
+    ttft = None
+    parts = []
+    try:
+        async with client.stream("POST", url, json=body) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return {"ok": False, "status": response.status_code}
+            async for text in response.aiter_text():
+                if text and ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(text)
+        total = time.perf_counter() - started
+        return {
+            "ok": ttft is not None,
+            "ttft": ttft,
+            "total": total,
+            "tokens": estimate_tokens("".join(parts)),
+            "cache": response.headers.get("x-cache"),
+        }
+    except httpx.HTTPError as e:
+        return {"ok": False, "error": str(e)}
+
+async def load_phase(base, path, bodies, clients):
+    """Run `bodies` through `clients` concurrent connections; returns summary."""
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+    samples = []
+
+    async def worker():
+        async with httpx.AsyncClient(base_url=base, timeout=120) as client:
+            while not queue.empty():
+                samples.append(await timed_stream(client, path, queue.get_nowait()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(clients)])
+    return summarize(samples, time.perf_counter() - started)
+
+def ingest(base, tmp, pages, density, seed):
+    path = make_deck(os.path.join(tmp, f"deck-{density}-{pages}-{seed}.pdf"), pages=pages, seed=seed, **DENSITIES[density])
+    with open(path, "rb") as f:
+        started = time.perf_counter()
+        response = httpx.post(
+            f"{base}/api/v1/upload/pdf",
+            files={"file": (os.path.basename(path), f, "application/pdf")},
+            data={"course_topic": "Computer Architecture"},
+            timeout=600
+        )
+        elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    manifest = response.json()
+    return manifest, {
+        "pages": pages,
+        "density": density,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1),
+        "bytes": os.path.getsize(path),
+        "buildup_pages": sum(1 for slide in manifest["slides"] if slide.get("builds_on")),
+    }
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip())
+        return commit or "unknown", dirty
+    except OSError:
+        return "unknown", False
+
+def compare(result, baseline):
+    # Print the headline numbers side by side; lower is better except rates
+    def rows(r):
+        out = {}
+        for item in r["ingest"]:
+            out[f"ingest {item['density']}/{item['pages']}p pages/s"] = item["pages_per_sec"]
+        for phase in ("expand", "expand_cached", "chat"):
+            if phase in r:
+                out[f"{phase} ttft p50 ms"] = r[phase]["ttft_ms"]["p50"]
+                out[f"{phase} ttft p99 ms"] = r[phase]["ttft_ms"]["p99"]
+                out[f"{phase} latency p99 ms"] = r[phase]["latency_ms"]["p99"]
+                out[f"{phase} tokens/s total"] = r[phase]["tokens_per_sec_total"]
+        out["peak rss api MB"] = r["rss_peak_mb"]["api"]
+        return out
+
+    new, old = rows(result), rows(baseline)
+    print(f"\nvs {baseline['commit']} ({baseline['timestamp']}):")
+    for name, value in new.items():
+        before = old.get(name)
+        if value is None or not before:
+            continue
+        print(f"  {name:<34} {before:>10} -> {value:<10} ({(value - before) / before * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=4, help="requests per client per phase")
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-sec", type=float, default=120)
+    parser.add_argument("--tokens", type=int, default=150)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--provider", default="openai", choices=["openai", "groq"])
+    parser.add_argument("--out", default=None, help="result file (default: bench/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier result to compare against")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    llm_port, api_port = free_port(), free_port()
+    llm = f"http://127.0.0.1:{llm_port}"
+    base = f"http://127.0.0.1:{api_port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"{llm}/v1",
+            "GROQ_BASE_URL": llm,
+            "ASSET_STORE_DIR": os.path.join(tmp, "assets"),
+            "EXPANSION_CACHE_DIR": os.path.join(tmp, "cache"),
+            "SESSION_STORE_DIR": os.path.join(tmp, "sessions"),
+        }
+        log = open(os.path.join(tmp, "backend.log"), "w")
+        procs = [
+            subprocess.Popen([
+                sys.executable, "-m", "bench.fake_llm", "--port", str(llm_port),
+                "--ttft-ms", str(args.ttft_ms), "--tokens-per-sec", str(args.tokens_per_sec),
+                "--tokens", str(args.tokens), "--fail-rate", str(args.fail_rate),
+                "--throttle-rate", str(args.throttle_rate), "--drop-rate", str(args.drop_rate), "--seed", "0"
+            ], cwd=BACKEND_DIR, env=env),
+            subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+            ),
+        ]
+        api_pid = procs[1].pid
+        try:
+            wait_for(f"{llm}/stats")
+            wait_for(f"{base}/health")
+
+            print(f"commit {commit}{' (dirty)' if dirty else ''}, cpus={os.cpu_count()}")
+            ingest_results = []
+            main_deck = None
+            decks = [(max(10, args.pages // 3), "light"), (args.pages, "normal"), (args.pages, "dense"), (max(10, args.pages // 3), "code"), (max(10, args.pages // 3), "buildup")]
+            for seed, (pages, density) in enumerate(decks):
+                manifest, stats = ingest(base, tmp, pages, density, seed)
+                ingest_results.append(stats)
+                print(
+                    f"ingest {density:<7} {pages:>4} pages  {stats['pages_per_sec']:>7.1f} pages/s  "
+                    f"{stats['buildup_pages']} build-up"
+                )
+                if density == "normal":
+                    main_deck = manifest
+            rss_after_ingest = peak_rss_mb(api_pid)
+
+            total = main_deck["total_slides"]
+            count = args.clients * args.requests
+            numbers = [i % total + 1 for i in range(count)]
+            common = {"deck_id": main_deck["deck_id"], "api_key": "bench", "provider": args.provider}
+
+            results = {}
+            results["expand"] = asyncio.run(load_phase(base, "/api/v1/expand", [
+                {**common, "slide_number": n} for n in numbers
+            ], args.clients))
+            results["expand_cached"] = asyncio.run(load_phase(base, "/api/v1/expand", [
+                {**common, "slide_number": n} for n in numbers
+            ], args.clients))
+            results["chat"] = asyncio.run(load_phase(base, "/api/v1/chat", [
+                {**common, "slide_number": n, "question": f"How does this relate to slide {max(1, n - 2)}?"}
+                for n in numbers
+            ], args.clients))
+            for phase, summary in results.items():
+                print(
+                    f"{phase:<14} ttft p50 {summary['ttft_ms']['p50']}ms p99 {summary['ttft_ms']['p99']}ms  "
+                    f"latency p99 {summary['latency_ms']['p99']}ms  {summary['tokens_per_sec_total']} tok/s  "
+                    f"errors {summary['errors']}/{summary['requests']}"
+                )
+
+            result = {
+                "commit": commit,
+                "dirty": dirty,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "host": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+                "config": vars(args),
+                "ingest": ingest_results,
+                **results,
+                "rss_peak_mb": {**peak_rss_mb(api_pid), "after_ingest": rss_after_ingest},
+                "fake_llm": httpx.get(f"{llm}/stats").json(),
+            }
+            print(f"peak rss: api {result['rss_peak_mb']['api']}MB, {result['rss_peak_mb']['workers']} workers {result['rss_peak_mb']['workers_total']}MB")
+        finally:
+            for proc in procs:
+                proc.terminate()
+            for proc in procs:
+                proc.wait(timeout=10)
+            log.close()
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"wrote {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Peak memory of the backend while ingesting ever larger "scanned" decks. Each
+size gets a fresh backend process, so the /proc high-water marks belong to
+that upload alone. Uploads are spooled to disk and rendered page range by
+page range, so the API process's peak RSS should stay flat as the page count
+grows; exits non-zero if it grows by more than --tolerance-mb.
+
+    python -m bench.upload_memory --pages 25 100 400 --scan-kb 256
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from bench.decks import make_deck
+from bench.run import BACKEND_DIR, free_port, wait_for, peak_rss_mb
+
+def measure(tmp, deck, pages, workers):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "ASSET_STORE_DIR": os.path.join(tmp, f"assets-{pages}"),
+        "SESSION_STORE_DIR": os.path.join(tmp, f"sessions-{pages}"),
+        "INGEST_WORKERS": str(workers),
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for(f"{base}/health")
+        idle = peak_rss_mb(proc.pid)["api"]
+        started = time.perf_counter()
+        received = 0
+        with open(deck, "rb") as f, httpx.Client(base_url=base, timeout=600) as client:
+            files = {"file": ("deck.pdf", f, "application/pdf")}
+            with client.stream("POST", "/api/v1/upload/pdf/stream", files=files) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line and json.loads(line).get("type") == "slide":
+                        received += 1
+        elapsed = time.perf_counter() - started
+        peak = peak_rss_mb(proc.pid)
+        return {
+            "pages": received,
+            "mb": round(os.path.getsize(deck) / (1024 * 1024), 1),
+            "seconds": round(elapsed, 2),
+            "api_idle_mb": idle,
+            "api_peak_mb": peak["api"],
+            "workers_peak_mb": peak["workers_total"],
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[25, 100, 400])
+    parser.add_argument("--scan-kb", type=int, default=256, help="incompressible image bytes per page")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--tolerance-mb", type=float, default=40)
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in sorted(args.pages):
+            deck = make_deck(os.path.join(tmp, f"deck-{pages}.pdf"), pages=pages, scan_kb=args.scan_kb)
+            row = measure(tmp, deck, pages, args.workers)
+            os.remove(deck)
+            rows.append(row)
+            print(
+                f"{row['pages']:>5} pages {row['mb']:>7.1f} MB  {row['seconds']:>7.2f}s  "
+                f"api idle {row['api_idle_mb']}MB peak {row['api_peak_mb']}MB  "
+                f"workers peak {row['workers_peak_mb']}MB"
+            )
+
+    growth = rows[-1]["api_peak_mb"] - rows[0]["api_peak_mb"]
+    print(f"api peak growth from {rows[0]['pages']} to {rows[-1]['pages']} pages: {growth:+.1f}MB")
+    if growth > args.tolerance_mb:
+        print(f"FAIL: more than {args.tolerance_mb}MB")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
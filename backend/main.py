@@ -1,23 +1,77 @@
+import time
+
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import ingest, process, chat
+from fastapi.responses import PlainTextResponse
+from contextlib import asynccontextmanager
+from routers import ingest, process, chat, assets, jobs, export
+from services.pdf import shutdown_executor, warm_executor
+from services.clients import registry
+from services.providers import warm_up, open_clients
+from services.jobs import start_workers, stop_workers
+from services.prefetch import prefetcher
+from services.metrics import RequestMetricsMiddleware, configure_logging, log_event, render_metrics
+from services.uploads import UploadLimitMiddleware
 from dotenv import load_dotenv
 import os
+import asyncio
 
 load_dotenv()
+configure_logging()
+
+# Which server-side keys are configured (never the keys themselves)
+log_event(
+    "startup",
+    openai_api_key=bool(os.getenv("OPENAI_API_KEY")),
+    google_api_key=bool(os.getenv("GOOGLE_API_KEY")),
+    groq_api_key=bool(os.getenv("GROQ_API_KEY")),
+    import_ms=(time.perf_counter() - _import_started) * 1000
+)
+
+# Provider SDKs and PyMuPDF are imported on first use to keep cold starts
+# short. STARTUP_WARMUP moves that cost back to startup for the configured
+# server-default providers and the render pool:
+#   off        - nothing (default)
+#   background - warm up after the server starts accepting requests
+#   blocking   - finish warming up before the first request is served
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "off")
 
-# Debug: Check API Keys
-if os.getenv("OPENAI_API_KEY"):
-    print("✅ OPENAI_API_KEY found")
-else:
-    print("❌ OPENAI_API_KEY not found")
+async def warm():
+    started = time.perf_counter()
+    try:
+        # Imports and process spawns in threads; clients on the loop itself
+        providers = await asyncio.to_thread(warm_up)
+        open_clients(providers)
+        workers = await asyncio.to_thread(warm_executor)
+    except Exception as e:
+        log_event("warmup_failed", error=str(e))
+        return
+    log_event(
+        "warmup",
+        providers=",".join(providers) or "none",
+        render_workers=workers,
+        ms=(time.perf_counter() - started) * 1000
+    )
 
-if os.getenv("GOOGLE_API_KEY"):
-    print("✅ GOOGLE_API_KEY found")
-else:
-    print("❌ GOOGLE_API_KEY not found")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warming = None
+    if STARTUP_WARMUP == "blocking":
+        await warm()
+    elif STARTUP_WARMUP == "background":
+        warming = asyncio.create_task(warm())
+    await start_workers()
+    yield
+    await stop_workers()
+    await prefetcher.aclose()
+    if warming is not None and not warming.done():
+        await warming
+    shutdown_executor()
+    await registry.aclose()
 
-app = FastAPI(title="UnSlide API", version="0.1.0")
+app = FastAPI(title="UnSlide API", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,11 +79,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Cache"],
 )
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
 
 app.include_router(ingest.router, prefix="/api/v1", tags=["ingestion"])
+app.include_router(jobs.router, prefix="/api/v1", tags=["ingestion"])
 app.include_router(process.router, prefix="/api/v1", tags=["processing"])
 app.include_router(chat.router, prefix="/api/v1", tags=["chat"])
+app.include_router(assets.router, prefix="/api/v1", tags=["assets"])
+app.include_router(export.router, prefix="/api/v1", tags=["export"])
 
 @app.get("/")
 def read_root():
@@ -38,3 +98,8 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from services.store import get_store, guess_media_type, is_digest
+
+router = APIRouter()
+
+@router.get("/assets/{digest}")
+async def get_asset(digest: str, request: Request):
+    if not is_digest(digest):
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    # Content-addressed: the digest is the ETag and the bytes never change
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    data = get_store().get(digest)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    return Response(content=data, media_type=guess_media_type(data), headers=headers)
@@ -2,13 +2,20 @@ from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-from services.chat import chat_with_slide
+from services.chat import chat_with_slide, chat_in_session
+from services.sessions import load_deck
+from services.streaming import coalesce, StreamStats
+from services.metrics import log_event
+from services.scheduler import priority
+import logging
 
 router = APIRouter()
 
 class ChatRequest(BaseModel):
     question: str
-    slide_content: str
+    # With deck_id, the slide content and history come from the server session
+    deck_id: str | None = None
+    slide_content: str = ""
     course_topic: str = "General"
     slide_number: int
     history: List[Dict[str, str]] = []
@@ -18,18 +25,36 @@ class ChatRequest(BaseModel):
 
 @router.post("/chat")
 async def chat_endpoint(request: ChatRequest):
+    # A student is waiting on the answer: ahead of everything in the upstream queues
+    priority.set("interactive")
+    if request.deck_id:
+        try:
+            session, manifest, index = load_deck(request.deck_id, request.slide_number)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=e.args[0])
+        stream = chat_in_session(
+            session, manifest, index,
+            question=request.question,
+            api_key=request.api_key,
+            provider=request.provider,
+            model=request.model
+        )
+    else:
+        stream = chat_with_slide(
+            question=request.question,
+            slide_content=request.slide_content,
+            course_topic=request.course_topic,
+            slide_number=request.slide_number,
+            history=request.history,
+            api_key=request.api_key,
+            provider=request.provider,
+            model=request.model
+        )
+
     try:
+        stats = StreamStats(route="chat", label=f"slide={request.slide_number}")
         return StreamingResponse(
-            chat_with_slide(
-                question=request.question,
-                slide_content=request.slide_content,
-                course_topic=request.course_topic,
-                slide_number=request.slide_number,
-                history=request.history,
-                api_key=request.api_key,
-                provider=request.provider,
-                model=request.model
-            ),
+            coalesce(stream, stats=stats),
             media_type="text/plain",
             headers={
                 "Cache-Control": "no-cache",
@@ -38,5 +63,5 @@ async def chat_endpoint(request: ChatRequest):
             }
         )
     except Exception as e:
-        print(f"Error in chat: {e}")
+        log_event("chat_failed", logging.ERROR, slide=request.slide_number, error=str(e))
         raise HTTPException(status_code=500, detail=f"Error in chat: {str(e)}")
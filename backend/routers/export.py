@@ -0,0 +1,68 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Literal
+from urllib.parse import quote
+import os
+from services.store import get_store
+from services.sessions import get_session_store
+from services.export import guide_indices, stream_study_guide
+from services.metrics import log_event
+
+router = APIRouter()
+
+class ExportRequest(BaseModel):
+    # Either a deck session or an ingested document (+ the topic it was expanded with)
+    deck_id: str | None = None
+    doc_id: str | None = None
+    course_topic: str = "General"
+    start: int = 1
+    end: int | None = None
+    layout: Literal["vertical", "horizontal"] = "vertical"
+    title: str | None = None
+    # Expansions the client already holds (e.g. edited notes), by slide
+    # number; other slides use the cached expansion for provider/model
+    expansions: dict[int, str] = {}
+    provider: str | None = None
+    model: str | None = None
+
+@router.post("/export/pdf")
+async def export_pdf(request: ExportRequest):
+    """
+    Study guide for slides [start, end] as a PDF: each slide image followed
+    by its expansion. The file is streamed while later slides are still
+    being laid out.
+    """
+    doc_id, course_topic = request.doc_id, request.course_topic
+    if request.deck_id:
+        session = get_session_store().get(request.deck_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired deck session")
+        doc_id, course_topic = session.doc_id, session.course_topic
+    if not doc_id:
+        raise HTTPException(status_code=400, detail="deck_id or doc_id is required")
+    store = get_store()
+    manifest = store.get_manifest(doc_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Unknown document")
+
+    # Texts are looked up chunk by chunk while the file streams, not up front
+    indices = guide_indices(manifest["slides"], request.start, request.end)
+    if not indices:
+        raise HTTPException(status_code=400, detail="No slides in the requested range")
+    log_event("export_started", doc_id=doc_id, slides=len(indices), layout=request.layout)
+
+    name = os.path.splitext(manifest.get("filename") or "Untitled")[0]
+    filename = f"{name}_notes.pdf"
+    return StreamingResponse(
+        stream_study_guide(
+            manifest["slides"], indices, store, request.layout, request.title or name, course_topic,
+            request.expansions, request.provider, request.model
+        ),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+            "Cache-Control": "no-cache",
+            "X-Content-Type-Options": "nosniff"
+        }
+    )
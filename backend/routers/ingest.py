@@ -1,70 +1,150 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import fitz  # PyMuPDF
-import io
-import base64
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+import json
+from concurrent.futures.process import BrokenProcessPool
+from services.pdf import iter_slides, count_pages, UnreadablePDF
+from services.store import get_store
+from services.sessions import get_session_store
+from services.jobs import build_manifest
+from services.revisions import previous_manifest, reusable_pages, diff_summary
+from services.uploads import UploadRejected, spool_upload
 
 router = APIRouter()
 
-@router.post("/upload/pdf")
-async def upload_pdf(file: UploadFile = File(...)):
+def rejection(e: UploadRejected):
+    headers = {"Retry-After": "10"} if e.status_code == 503 else None
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+
+async def open_upload(file: UploadFile, store):
+    """
+    Park the upload on disk (worker processes open the document by path) and
+    return it with the manifest if this PDF was ingested before. Checks the
+    size and page caps first, so rejections are plain 413/503 responses.
+    """
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDF allowed.")
-    
     try:
-        contents = await file.read()
-        # PyMuPDF expects a stream or bytes
-        doc = fitz.open(stream=contents, filetype="pdf")
-        
-        slides_data = []
-        for i, page in enumerate(doc):
-            # Extract text blocks with coordinates
-            # blocks format: (x0, y0, x1, y1, "lines", block_no, block_type)
-            text_blocks = page.get_text("blocks")
-            
-            elements = []
-            full_text = ""
-            
-            page_width = page.rect.width
-            page_height = page.rect.height
-            
-            for b_idx, block in enumerate(text_blocks):
-                # block[4] is the text content
-                text_content = block[4].strip()
-                if not text_content:
-                    continue
-                    
-                full_text += text_content + "\n\n"
-                
-                # Normalize coordinates to 0-1000
-                x0, y0, x1, y1 = block[0], block[1], block[2], block[3]
-                norm_box = [
-                    int((y0 / page_height) * 1000),
-                    int((x0 / page_width) * 1000),
-                    int((y1 / page_height) * 1000),
-                    int((x1 / page_width) * 1000)
-                ]
-                
-                elements.append({
-                    "id": b_idx,
-                    "text": text_content,
-                    "box_2d": norm_box
-                })
+        upload = await spool_upload(file, store)
+    except UploadRejected as e:
+        raise rejection(e)
+    try:
+        manifest = store.get_manifest(upload.doc_id)
+        if manifest is None:
+            upload.check_pages(await count_pages(upload.path))
+    except UploadRejected as e:
+        upload.close()
+        raise rejection(e)
+    except UnreadablePDF as e:
+        upload.close()
+        raise HTTPException(status_code=400, detail=f"Could not open PDF: {str(e)}")
+    except BrokenProcessPool:
+        # Our fault, not the PDF's: the render pool died twice in a row
+        upload.close()
+        raise HTTPException(status_code=503, detail="PDF workers are restarting, try again shortly", headers={"Retry-After": "10"})
+    except BaseException:
+        upload.close()
+        raise
+    return upload, manifest
+
+@router.post("/upload/pdf")
+async def upload_pdf(
+    file: UploadFile = File(...),
+    course_topic: str = Form("General"),
+    previous_doc_id: str | None = Form(None)
+):
+    # previous_doc_id: the doc_id of the revision this upload replaces; its
+    # unchanged pages are reused, and the response carries a "diff"
+    store = get_store()
+    upload, manifest = await open_upload(file, store)
+    with upload:
+        try:
+            cached = manifest is not None
+            previous = previous_manifest(previous_doc_id, upload.doc_id)
+            if not cached:
+                slides_data = [slide async for slide in iter_slides(
+                    upload.path, store, total=upload.pages, previous=reusable_pages(previous)
+                )]
+                manifest = build_manifest(upload.doc_id, file.filename, slides_data, previous)
+                store.put_manifest(upload.doc_id, manifest)
+            diff = diff_summary(previous, manifest["slides"]) if previous else None
+
+            session = get_session_store().create(upload.doc_id, course_topic)
+            return {**manifest, "filename": file.filename, "deck_id": session.deck_id, "cached": cached, "diff": diff}
+
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+
+@router.post("/upload/pdf/stream")
+async def upload_pdf_stream(
+    file: UploadFile = File(...),
+    course_topic: str = Form("General"),
+    previous_doc_id: str | None = Form(None)
+):
+    """
+    Same as /upload/pdf, but emits NDJSON: one {"type": "slide"} record per page
+    as soon as it is rendered, then a final {"type": "summary"} record.
+    """
+    store = get_store()
+    upload, manifest = await open_upload(file, store)
+    doc_id = upload.doc_id
+    filename = file.filename
+
+    async def generate():
+        try:
+            cached = manifest is not None
+            previous = previous_manifest(previous_doc_id, doc_id)
+            if cached:
+                slides_data = manifest["slides"]
+                for slide in slides_data:
+                    yield json.dumps({"type": "slide", **slide}) + "\n"
+            else:
+                slides_data = []
+                pages = iter_slides(upload.path, store, total=upload.pages, previous=reusable_pages(previous))
+                async for slide in pages:
+                    slides_data.append(slide)
+                    yield json.dumps({"type": "slide", **slide}) + "\n"
+                store.put_manifest(doc_id, build_manifest(doc_id, filename, slides_data, previous))
+            diff = diff_summary(previous, slides_data) if previous else None
+            session = get_session_store().create(doc_id, course_topic)
+            yield json.dumps({
+                "type": "summary",
+                "doc_id": doc_id,
+                "deck_id": session.deck_id,
+                "filename": filename,
+                "total_slides": len(slides_data),
+                "cached": cached,
+                "diff": diff
+            }) + "\n"
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield json.dumps({"type": "error", "detail": f"Error processing PDF: {str(e)}"}) + "\n"
+        finally:
+            upload.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Content-Type-Options": "nosniff"
+        },
+        # Also release the upload if the client left before the stream started
+        background=BackgroundTask(upload.close)
+    )
 
-            # Generate image
-            pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
-            img_bytes = pix.tobytes("png")
-            img_base64 = base64.b64encode(img_bytes).decode("utf-8")
+class DeckRequest(BaseModel):
+    doc_id: str
+    course_topic: str = "General"
 
-            slides_data.append({
-                "slide_number": i + 1, 
-                "content": full_text,
-                "elements": elements,
-                "image": f"data:image/png;base64,{img_base64}"
-            })
-            
-        return {"filename": file.filename, "total_slides": len(slides_data), "slides": slides_data}
-    
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+@router.post("/decks")
+async def create_deck(request: DeckRequest):
+    # New session for an already-ingested document (e.g. after the old one expired)
+    if get_store().get_manifest(request.doc_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown document")
+    session = get_session_store().create(request.doc_id, request.course_topic)
+    return {"deck_id": session.deck_id, "doc_id": request.doc_id}
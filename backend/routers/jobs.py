@@ -0,0 +1,86 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from dataclasses import asdict
+import json
+import asyncio
+from routers.ingest import open_upload
+from services.store import get_store
+from services.jobs import FINISHED, get_job_store, submit
+
+router = APIRouter()
+
+# Seconds between SSE keep-alive comments while a job makes no progress
+HEARTBEAT_SECONDS = 15
+
+def get_job_or_404(job_id: str):
+    job = get_job_store().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@router.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    course_topic: str = Form("General"),
+    previous_doc_id: str | None = Form(None)
+):
+    """
+    Queue a PDF for ingestion and return at once. Follow it with
+    GET /jobs/{id} (polling) or GET /jobs/{id}/events (SSE); pages finished
+    so far are at GET /jobs/{id}/slides. With previous_doc_id, pages
+    unchanged since that revision are reused (see services/revisions.py).
+    """
+    upload, manifest = await open_upload(file, get_store())
+    job = await submit(upload, file.filename, course_topic, manifest, previous_doc_id)
+    return asdict(job)
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return asdict(get_job_or_404(job_id))
+
+@router.get("/jobs/{job_id}/slides")
+async def get_job_slides(job_id: str, offset: int = Query(0, ge=0)):
+    job = get_job_or_404(job_id)
+    if job.status == "done":
+        manifest = get_store().get_manifest(job.doc_id) or {"slides": []}
+        slides = manifest["slides"][offset:]
+    else:
+        slides = get_job_store().read_slides(job_id, offset)
+    return {**asdict(job), "offset": offset, "slides": slides}
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events: a "progress" event whenever pages complete, then one
+    final "done" or "failed" event. The job runs on regardless of whether
+    anyone is listening; reconnecting just picks up the current state.
+    """
+    jobs = get_job_store()
+    get_job_or_404(job_id)
+
+    async def generate():
+        sent = None
+        while True:
+            changed = jobs.watch(job_id)
+            job = jobs.get(job_id)
+            if job is None:
+                return
+            state = (job.status, job.completed_pages)
+            if state != sent:
+                sent = state
+                event = job.status if job.status in FINISHED else "progress"
+                yield f"event: {event}\ndata: {json.dumps(asdict(job))}\n\n"
+                if job.status in FINISHED:
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            try:
+                await asyncio.wait_for(changed.wait(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
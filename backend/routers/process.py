@@ -1,7 +1,21 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from services.llm import expand_slide
+import json
+import base64
+import logging
+from services.llm import build_expansion_prompt, stream_expansion
+from services.cache import get_expansion_cache, replay
+from services.streaming import coalesce, StreamStats
+from services.batch import expand_batch
+from services.store import get_store, parse_asset_ref
+from services.images import SlideImage
+from services.sessions import load_deck
+from services.metrics import EXPANSION_CACHE, log_event
+from services.singleflight import expansion_flights
+from services.prefetch import prefetcher
+from services.buildup import slide_prompt, with_earlier_steps
+from services.scheduler import priority
 
 router = APIRouter()
 
@@ -11,42 +25,162 @@ class SlideElement(BaseModel):
     box_2d: list[int]
 
 class ExpandRequest(BaseModel):
-    slide_content: str
+    # With deck_id, only slide_number is needed: the server fills in the rest
+    deck_id: str | None = None
+    slide_content: str = ""
     course_topic: str = "General"
     slide_number: int
     prev_context: str = ""
     next_context: str = ""
-    slide_image: str | None = None
+    slide_image: str | None = None  # legacy: base64 data URI
+    image_ref: str | None = None  # asset digest or /assets/{digest} URL
+    doc_id: str | None = None  # with slide_number, references an ingested page
     elements: list[SlideElement] = []
     api_key: str | None = None
     provider: str | None = None
     model: str | None = None
+    # With deck_id: also expand the next few slides in the background
+    prefetch: bool = True
+
+class BatchExpandRequest(BaseModel):
+    doc_id: str
+    start: int = 1
+    end: int | None = None
+    course_topic: str = "General"
+    completed: list[int] = []  # slides the client already has (resume)
+    include_text: bool = True  # False: only report completion, e.g. to warm the cache
+    api_key: str | None = None
+    provider: str | None = None
+    model: str | None = None
+
+def resolve_slide_image(request: ExpandRequest) -> SlideImage | None:
+    store = get_store()
+    ref = request.image_ref
+    if not ref and request.doc_id:
+        manifest = store.get_manifest(request.doc_id)
+        if manifest is None:
+            raise HTTPException(status_code=404, detail="Unknown document")
+        for slide in manifest["slides"]:
+            if slide["slide_number"] == request.slide_number:
+                ref = slide.get("image_hash")
+                break
+    if not ref and request.slide_image and not request.slide_image.startswith("data:"):
+        # Clients may echo back the /assets URL they got from ingestion
+        ref = request.slide_image
+
+    if ref:
+        # Only check it exists; bytes are read later, if the provider needs them
+        digest = parse_asset_ref(ref)
+        if not digest or not store.exists(digest):
+            raise HTTPException(status_code=404, detail="Slide image not found")
+        return SlideImage(digest)
+
+    if request.slide_image:
+        try:
+            # Remove header if present (e.g., "data:image/png;base64,")
+            slide_image = request.slide_image
+            if "base64," in slide_image:
+                slide_image = slide_image.split("base64,")[1]
+            return SlideImage.from_bytes(base64.b64decode(slide_image))
+        except Exception as e:
+            log_event("image_error", logging.WARNING, error=str(e))
+    return None
 
 @router.post("/expand")
 async def expand_slide_endpoint(request: ExpandRequest):
+    priority.set("foreground")
+    if request.deck_id:
+        try:
+            session, manifest, index = load_deck(request.deck_id, request.slide_number)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=e.args[0])
+        slide = manifest["slides"][index]
+        image = SlideImage(slide["image_hash"]) if slide.get("image_hash") else None
+        prompt = slide_prompt(
+            manifest["slides"], index, session.course_topic, request.provider, request.model
+        )
+    else:
+        image = resolve_slide_image(request)
+        prompt = build_expansion_prompt(
+            slide_content=request.slide_content,
+            course_topic=request.course_topic,
+            slide_number=request.slide_number,
+            prev_context=request.prev_context,
+            next_context=request.next_context,
+            elements=request.elements,
+            provider=request.provider,
+            model=request.model
+        )
+
     try:
-        return StreamingResponse(
-            expand_slide(
-                slide_content=request.slide_content,
-                course_topic=request.course_topic,
-                slide_number=request.slide_number,
-                prev_context=request.prev_context,
-                next_context=request.next_context,
-                slide_image=request.slide_image,
-                elements=request.elements,
+        cache = get_expansion_cache()
+        cache_key = cache.key(prompt, image.digest if image else None, request.provider, request.model)
+        cached = await cache.get(cache_key)
+        EXPANSION_CACHE.inc(result="hit" if cached is not None else "miss")
+        if request.deck_id:
+            prefetcher.claim(cache_key)
+            if request.prefetch:
+                prefetcher.schedule(
+                    request.deck_id, manifest["slides"], index, session.course_topic,
+                    request.api_key, request.provider, request.model
+                )
+        if cached is not None:
+            stream = replay(cached)
+        else:
+            # Identical expansions already in flight are shared, not repeated
+            stream = expansion_flights.stream(cache_key, lambda: cache.record(cache_key, stream_expansion(
+                prompt,
+                image=image,
                 api_key=request.api_key,
                 provider=request.provider,
                 model=request.model
-            ),
+            )))
+        if request.deck_id and slide.get("builds_on"):
+            # A build-up slide's own expansion only covers what it adds
+            stream = with_earlier_steps(
+                manifest["slides"], index, stream, session.course_topic,
+                request.api_key, request.provider, request.model
+            )
+
+        stats = StreamStats(route="expand", label=f"slide={request.slide_number}")
+        return StreamingResponse(
+            coalesce(stream, stats=stats),
             media_type="text/plain",
             headers={
                 "Cache-Control": "no-cache",
                 "X-Content-Type-Options": "nosniff",
-                "Connection": "keep-alive"
+                "Connection": "keep-alive",
+                "X-Cache": "HIT" if cached is not None else "MISS"
             }
         )
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Error expanding slide: {e}")
+        log_event("expand_failed", logging.ERROR, slide=request.slide_number, error=str(e))
         raise HTTPException(status_code=500, detail=f"Error expanding slide: {str(e)}")
+
+@router.post("/expand/batch")
+async def expand_batch_endpoint(request: BatchExpandRequest):
+    if get_store().get_manifest(request.doc_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown document")
+
+    async def generate():
+        async for record in expand_batch(
+            doc_id=request.doc_id,
+            start=request.start,
+            end=request.end,
+            course_topic=request.course_topic,
+            completed=request.completed,
+            include_text=request.include_text,
+            api_key=request.api_key,
+            provider=request.provider,
+            model=request.model
+        ):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Content-Type-Options": "nosniff"
+        }
+    )
@@ -0,0 +1,150 @@
+import os
+import asyncio
+import logging
+
+from services.llm import stream_expansion
+from services.cache import get_expansion_cache, replay
+from services.store import get_store
+from services.images import SlideImage
+from services.streaming import coalesce, StreamStats
+from services.metrics import EXPANSION_CACHE, log_event
+from services.singleflight import expansion_flights
+from services.scheduler import priority
+from services.buildup import slide_prompt, with_earlier_steps
+
+# Whole-deck expansion. Slides are scheduled concurrently but every upstream
+# call holds a per-provider slot, so a 200-slide batch can't flood a provider
+# (and can't starve interactive /expand traffic of the same provider for long).
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+_semaphores = {}
+
+def provider_slots(provider: str | None) -> asyncio.Semaphore:
+    name = (provider or "default").lower()
+    if name not in _semaphores:
+        limit = int(os.getenv(f"BATCH_CONCURRENCY_{name.upper()}", str(BATCH_CONCURRENCY)))
+        _semaphores[name] = asyncio.Semaphore(max(1, limit))
+    return _semaphores[name]
+
+async def slotted(provider, key, upstream):
+    """The single-flight stream for `key`, holding a provider slot while it
+    is read unless it follows someone else's flight."""
+    if expansion_flights.joinable(key):
+        # Someone is already expanding this slide; follow along without
+        # taking a provider slot
+        async for chunk in expansion_flights.stream(key, upstream):
+            yield chunk
+        return
+    async with provider_slots(provider):
+        async for chunk in expansion_flights.stream(key, upstream):
+            yield chunk
+
+async def _expand_one(slides, index, course_topic, api_key, provider, model, include_text, out):
+    # Each slide runs in its own task, so this only affects this slide's calls
+    priority.set("batch")
+    slide = slides[index]
+    number = slide["slide_number"]
+    cache = get_expansion_cache()
+
+    prompt = slide_prompt(slides, index, course_topic, provider, model)
+    image_hash = slide.get("image_hash")
+    key = cache.key(prompt, image_hash, provider, model)
+    cached = await cache.get(key)
+    EXPANSION_CACHE.inc(result="hit" if cached is not None else "miss")
+
+    async def run(stream):
+        if slide.get("builds_on"):
+            # Lead with the earlier steps' explanations (their own batch
+            # entries, shared through the cache / single-flight)
+            stream = with_earlier_steps(
+                slides, index, stream, course_topic, api_key, provider, model, slots=provider_slots(provider)
+            )
+        parts = []
+        async for delta in coalesce(stream, stats=StreamStats(route="batch", label=f"slide={number}")):
+            parts.append(delta)
+            if include_text:
+                await out.put({"type": "delta", "slide_number": number, "text": delta})
+        return "".join(parts)
+
+    try:
+        def upstream():
+            return cache.record(key, stream_expansion(
+                prompt,
+                image=SlideImage(image_hash) if image_hash else None,
+                api_key=api_key,
+                provider=provider,
+                model=model
+            ))
+
+        if cached is not None:
+            text = await run(replay(cached))
+        else:
+            text = await run(slotted(provider, key, upstream))
+        await out.put({
+            "type": "done",
+            "slide_number": number,
+            "cached": cached is not None,
+            "chars": len(text)
+        })
+        return True
+    except Exception as e:
+        log_event("batch_slide_failed", logging.WARNING, slide=number, error=str(e))
+        await out.put({"type": "error", "slide_number": number, "detail": str(e)})
+        return False
+
+async def expand_batch(
+    doc_id: str,
+    start: int = 1,
+    end: int | None = None,
+    course_topic: str = "General",
+    completed: list[int] = [],
+    include_text: bool = True,
+    api_key: str = None,
+    provider: str = None,
+    model: str = None
+):
+    """
+    Expand slides [start, end] of an ingested document, yielding records
+    tagged by slide_number as they are produced, interleaved across slides.
+    Slides listed in `completed` are skipped so an interrupted batch can be
+    resumed; slides that finished upstream before the interruption are also
+    in the expansion cache and replay instantly.
+    """
+    manifest = get_store().get_manifest(doc_id)
+    if manifest is None:
+        raise KeyError(doc_id)
+
+    slides = manifest["slides"]
+    end = min(end or len(slides), len(slides))
+    skip = set(completed)
+    indices = [i for i in range(max(start, 1) - 1, end) if slides[i]["slide_number"] not in skip]
+
+    out = asyncio.Queue()
+    tasks = [
+        asyncio.create_task(_expand_one(slides, i, course_topic, api_key, provider, model, include_text, out))
+        for i in indices
+    ]
+    results_done = asyncio.gather(*tasks)
+
+    try:
+        while not results_done.done() or not out.empty():
+            getter = asyncio.ensure_future(out.get())
+            await asyncio.wait({getter, results_done}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+
+        results = results_done.result()
+        yield {
+            "type": "summary",
+            "doc_id": doc_id,
+            "completed": sorted(slides[i]["slide_number"] for i, ok in zip(indices, results) if ok),
+            "failed": sorted(slides[i]["slide_number"] for i, ok in zip(indices, results) if not ok),
+            "skipped": sorted(skip)
+        }
+    finally:
+        # Client disconnected mid-batch: stop every in-flight expansion
+        for task in tasks:
+            task.cancel()
+        results_done.cancel()
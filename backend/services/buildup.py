@@ -0,0 +1,193 @@
+import os
+import re
+import asyncio
+
+from services.llm import build_deck_prompt, build_buildup_prompt, stream_expansion
+from services.cache import get_expansion_cache
+from services.images import SlideImage
+from services.singleflight import expansion_flights
+
+# Build-up slides. Decks exported from PowerPoint often have runs of pages
+# where each one repeats the previous page and adds a bullet. At ingest a page
+# is marked as building on the one before it ("builds_on", with the ids of
+# what it adds in "new_element_ids") when every element of the earlier page
+# is still there, in the same place, and only a few were added. Such a page
+# is expanded as a delta: the LLM is asked about the new elements only
+# (services.llm.build_buildup_prompt), and the explanations of the earlier
+# steps are replayed in front of it with their <mark data-id> references
+# renumbered to this page's elements.
+BUILDUP_MAX_NEW_ELEMENTS = int(os.getenv("BUILDUP_MAX_NEW_ELEMENTS", "3"))
+# How far (in 0-1000 page units) a repeated element's top-left corner may move
+BUILDUP_BOX_TOLERANCE = 15
+
+_MARK_RE = re.compile(r"<mark\s+data-id=[\"']?(\d+)[\"']?\s*>(.*?)</mark>", re.DOTALL)
+
+def _normalize(text):
+    return " ".join(text.split())
+
+def match_elements(earlier: list, elements: list) -> dict | None:
+    """
+    element id on the earlier page -> id of the same element on this one, if
+    every earlier element reappears: same text (or the same text with more
+    appended, when several bullets share one text block) with its top-left
+    corner in the same place. None otherwise.
+    """
+    mapping = {}
+    used = set()
+    for old in earlier:
+        old_text = _normalize(old["text"])
+        for new in elements:
+            if new["id"] in used:
+                continue
+            if (abs(new["box_2d"][0] - old["box_2d"][0]) <= BUILDUP_BOX_TOLERANCE
+                    and abs(new["box_2d"][1] - old["box_2d"][1]) <= BUILDUP_BOX_TOLERANCE
+                    and _normalize(new["text"]).startswith(old_text)):
+                mapping[old["id"]] = new["id"]
+                used.add(new["id"])
+                break
+        else:
+            return None
+    return mapping
+
+def new_content(earlier: list, elements: list, mapping: dict) -> dict:
+    """id -> the text this page adds: whole new elements, and the appended
+    part of earlier elements that grew."""
+    earlier_text = {mapping[old["id"]]: _normalize(old["text"]) for old in earlier}
+    added = {}
+    for element in elements:
+        text = _normalize(element["text"])
+        if element["id"] not in earlier_text:
+            added[element["id"]] = text
+        elif text != earlier_text[element["id"]]:
+            added[element["id"]] = text[len(earlier_text[element["id"]]):].strip()
+    return added
+
+def annotate_buildup(previous: dict | None, slide: dict) -> dict:
+    """Set or clear `slide`'s builds_on / new_element_ids against the page
+    before it (reused pages may carry stale ones from another revision)."""
+    slide.pop("builds_on", None)
+    slide.pop("new_element_ids", None)
+    if not previous or not previous.get("elements"):
+        return slide
+    mapping = match_elements(previous["elements"], slide["elements"])
+    if mapping is None:
+        return slide
+    added = new_content(previous["elements"], slide["elements"], mapping)
+    if 0 < len(added) <= BUILDUP_MAX_NEW_ELEMENTS:
+        slide["builds_on"] = previous["slide_number"]
+        slide["new_element_ids"] = sorted(added)
+    return slide
+
+def remap_marks(text: str, mapping: dict) -> str:
+    """Renumber <mark data-id> references; marks for ids not in `mapping`
+    are dropped, keeping their text."""
+    def replace(match):
+        new_id = mapping.get(int(match.group(1)))
+        if new_id is None:
+            return match.group(2)
+        return f'<mark data-id="{new_id}">{match.group(2)}</mark>'
+    return _MARK_RE.sub(replace, text)
+
+def slide_prompt(slides: list, index: int, course_topic: str = "General", provider: str = None, model: str = None):
+    """The expansion prompt for slides[index] of a manifest: a delta prompt
+    for build-up slides, the full one (with neighbours) otherwise."""
+    slide = slides[index]
+    if not (index > 0 and slide.get("builds_on") == slides[index - 1]["slide_number"]):
+        return build_deck_prompt(slides, index, course_topic, provider, model)
+    earlier = slides[index - 1]
+    mapping = match_elements(earlier["elements"], slide["elements"]) or {}
+    nxt = slides[index + 1] if index + 1 < len(slides) else None
+    if nxt and nxt.get("builds_on") == slide["slide_number"]:
+        # The next step is this slide again plus a bullet; it would only
+        # tempt the model to explain that bullet early
+        nxt = None
+    return build_buildup_prompt(
+        new_elements=new_content(earlier["elements"], slide["elements"], mapping),
+        earlier_content=earlier["content"],
+        course_topic=course_topic,
+        slide_number=slide["slide_number"],
+        builds_on=earlier["slide_number"],
+        next_context=nxt["content"] if nxt else "",
+        provider=provider,
+        model=model
+    )
+
+def earlier_steps(slides: list, index: int) -> list:
+    """Indices of the pages slides[index] builds up from, first step first."""
+    start = index
+    while start > 0 and slides[start].get("builds_on") == slides[start - 1]["slide_number"]:
+        start -= 1
+    return list(range(start, index))
+
+async def with_earlier_steps(slides, index, stream, course_topic="General", api_key=None, provider=None, model=None, slots=None):
+    """
+    Stream the explanation of a build-up slide: the (cached or freshly
+    expanded) explanations of its earlier steps, renumbered to its own
+    elements, followed by `stream`, its own delta. Uncached steps and the
+    delta are all started at once, so a reader who jumps into the middle of
+    a build-up waits for roughly one call, not one per step. With `slots`
+    (services.batch.provider_slots), every step that goes upstream takes a
+    slot first; `stream` is drained as it arrives, so a slot it holds is
+    never kept waiting on the steps.
+    """
+    steps = earlier_steps(slides, index)
+    if not steps:
+        async for chunk in stream:
+            yield chunk
+        return
+
+    cache = get_expansion_cache()
+    loop = asyncio.get_running_loop()
+
+    # Element ids on step j -> ids on slides[index], composed page by page
+    mappings = {index: {element["id"]: element["id"] for element in slides[index]["elements"]}}
+    for j in reversed(steps):
+        step = match_elements(slides[j]["elements"], slides[j + 1]["elements"]) or {}
+        mappings[j] = {old: mappings[j + 1][new] for old, new in step.items() if new in mappings[j + 1]}
+
+    async def expand(j):
+        prompt = slide_prompt(slides, j, course_topic, provider, model)
+        image_hash = slides[j].get("image_hash")
+        key = cache.key(prompt, image_hash, provider, model)
+        cached = await cache.get(key)
+        if cached is not None:
+            return cached
+
+        def upstream():
+            return cache.record(key, stream_expansion(
+                prompt,
+                image=SlideImage(image_hash) if image_hash else None,
+                api_key=api_key,
+                provider=provider,
+                model=model
+            ))
+
+        if slots is None or expansion_flights.joinable(key):
+            return "".join([chunk async for chunk in expansion_flights.stream(key, upstream)])
+        async with slots:
+            return "".join([chunk async for chunk in expansion_flights.stream(key, upstream)])
+
+    tasks = [loop.create_task(expand(j)) for j in steps]
+    # Run this slide's own call alongside the earlier steps, buffering it
+    own = asyncio.Queue()
+
+    async def drain():
+        try:
+            async for chunk in stream:
+                own.put_nowait(chunk)
+        finally:
+            own.put_nowait(None)
+            await stream.aclose()
+
+    draining = loop.create_task(drain())
+    try:
+        for j, task in zip(steps, tasks):
+            yield remap_marks(await task, mappings[j]).rstrip() + "\n\n"
+        while (chunk := await own.get()) is not None:
+            yield chunk
+        # Surfaces the error, if the call failed
+        await draining
+    finally:
+        for task in (*tasks, draining):
+            task.cancel()
+        await asyncio.gather(*tasks, draining, return_exceptions=True)
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Two-tier cache for finished slide expansions: a small in-memory LRU in front
+# of an on-disk store with a size cap (least recently used files go first)
+# and a TTL. Keys hash everything that determines the output, so a hit can be
+# replayed to any client that would have sent the same upstream request.
+EXPANSION_CACHE_DIR = os.getenv(
+    "EXPANSION_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".unslide", "expansions")
+)
+EXPANSION_CACHE_MEMORY_ITEMS = int(os.getenv("EXPANSION_CACHE_MEMORY_ITEMS", "512"))
+EXPANSION_CACHE_DISK_BYTES = int(os.getenv("EXPANSION_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+EXPANSION_CACHE_TTL = int(os.getenv("EXPANSION_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Size of the pieces a cached expansion is replayed in
+REPLAY_CHUNK_CHARS = 256
+
+_cache = None
+
+class ExpansionCache:
+    def __init__(self, directory, memory_items, disk_bytes, ttl):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (created, text)
+        self._lock = threading.Lock()
+        self._evicting = False
+        os.makedirs(directory, exist_ok=True)
+        self._disk_usage = sum(
+            entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".json")
+        )
+
+    @staticmethod
+    def key(prompt: str, image_digest: str | None, provider: str | None, model: str | None) -> str:
+        h = hashlib.sha256()
+        for part in (prompt, image_digest or "", (provider or "default").lower(), model or ""):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def peek(self, key: str) -> str | None:
+        """The memory tier alone: never touches the disk."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                return entry[1]
+            del self._memory[key]
+            return None
+
+    async def get(self, key: str) -> str | None:
+        text = self.peek(key)
+        if text is None:
+            # Disk reads run in a worker thread, off the event loop
+            text = await asyncio.to_thread(self._read, key)
+        return text
+
+    async def put(self, key: str, text: str):
+        created = time.time()
+        self._remember(key, created, text)
+        if await asyncio.to_thread(self._write, key, created, text) and not self._evicting:
+            # Over the cap: scan and trim the directory in the background
+            # rather than on the request that tipped it over
+            self._evicting = True
+            asyncio.get_running_loop().run_in_executor(None, self._evict_disk)
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if time.time() - record["created"] >= self.ttl:
+            self._remove(path)
+            return None
+
+        # Bump mtime so disk eviction sees this entry as recently used
+        os.utime(path)
+        self._remember(key, record["created"], record["text"])
+        return record["text"]
+
+    def _write(self, key, created, text) -> bool:
+        # Returns whether the disk tier is now over its cap
+        data = json.dumps({"created": created, "text": text}).encode("utf-8")
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        try:
+            previous = os.path.getsize(path)
+        except FileNotFoundError:
+            previous = 0
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_usage += len(data) - previous
+            return self._disk_usage > self.disk_bytes
+
+    def _remember(self, key, created, text):
+        with self._lock:
+            self._memory[key] = (created, text)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._disk_usage -= size
+
+    def _evict_disk(self):
+        # Worker thread. Drop expired entries first, then least recently used
+        # until under the cap
+        try:
+            now = time.time()
+            entries = sorted(
+                (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+                key=lambda entry: entry.stat().st_mtime
+            )
+            target = self.disk_bytes * 0.9
+            for entry in entries:
+                if self._disk_usage <= target and now - entry.stat().st_mtime < self.ttl:
+                    continue
+                self._remove(entry.path)
+        finally:
+            self._evicting = False
+
+    async def record(self, key: str, stream):
+        """Pass `stream` through, storing the full text once it completes.
+        Partial output from a failed or abandoned stream is never cached."""
+        parts = []
+        async for chunk in stream:
+            parts.append(chunk)
+            yield chunk
+        text = "".join(parts)
+        if text:
+            await self.put(key, text)
+
+async def replay(text: str):
+    for i in range(0, len(text), REPLAY_CHUNK_CHARS):
+        yield text[i:i + REPLAY_CHUNK_CHARS]
+        # Let the server flush each piece like a live stream would
+        await asyncio.sleep(0)
+
+def get_expansion_cache() -> ExpansionCache:
+    global _cache
+    if _cache is None:
+        _cache = ExpansionCache(
+            EXPANSION_CACHE_DIR,
+            EXPANSION_CACHE_MEMORY_ITEMS,
+            EXPANSION_CACHE_DISK_BYTES,
+            EXPANSION_CACHE_TTL
+        )
+    return _cache
@@ -0,0 +1,107 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+from services.metrics import log_event
+
+# Long-lived SDK clients, one per (provider, API key). Each client owns an
+# HTTP/gRPC connection pool, so reusing it skips a TLS handshake per request.
+# Keys are only kept as hashes in the registry index.
+#
+# SDKs are imported on first use: together they are most of the API's import
+# time, and a deployment usually talks to only one provider.
+LLM_CLIENT_MAX = int(os.getenv("LLM_CLIENT_MAX", "64"))
+LLM_CLIENT_IDLE_SECONDS = int(os.getenv("LLM_CLIENT_IDLE_SECONDS", "900"))
+# Evicted clients may still be serving a stream; give it time to finish
+CLOSE_GRACE_SECONDS = 120
+
+def _make_client(provider, api_key):
+    # OPENAI_BASE_URL / GROQ_BASE_URL point a provider at another compatible
+    # endpoint (a proxy, a gateway, or the benchmark stand-in in bench/fake_llm.py).
+    # Read per client, so values from .env (loaded after import) still apply.
+    # No SDK-level retries: 429s are waited out by services.scheduler, which
+    # knows the caller's priority, and other failures go to the router's
+    # fallback instead of being retried blind on the same backend.
+    if provider == "openai":
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL") or None, max_retries=0)
+    if provider == "groq":
+        from groq import AsyncGroq
+        return AsyncGroq(api_key=api_key, base_url=os.getenv("GROQ_BASE_URL") or None, max_retries=0)
+    if provider == "gemini":
+        import google.ai.generativelanguage as glm
+        # A per-key client instead of the process-global genai.configure()
+        return glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+    raise ValueError(f"Unknown provider: {provider}")
+
+def preload_sdk(provider):
+    """Import a provider's SDK ahead of the first request (startup warm-up)."""
+    if provider == "openai":
+        import openai  # noqa: F401
+    elif provider == "groq":
+        import groq  # noqa: F401
+    elif provider == "gemini":
+        import google.ai.generativelanguage  # noqa: F401
+
+async def _close_client(client):
+    try:
+        # gRPC clients (Gemini) close through their transport
+        if not hasattr(client, "close"):
+            await client.transport.close()
+        else:
+            await client.close()
+    except Exception as e:
+        log_event("client_close_failed", logging.WARNING, error=str(e))
+
+async def _close_later(client, delay):
+    await asyncio.sleep(delay)
+    await _close_client(client)
+
+class ClientRegistry:
+    def __init__(self, max_clients=LLM_CLIENT_MAX, idle_seconds=LLM_CLIENT_IDLE_SECONDS):
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self._clients = OrderedDict()  # (provider, key hash) -> (last_used, client)
+        self._closing = {}  # close task -> evicted client
+
+    @staticmethod
+    def _key(provider, api_key):
+        return provider, hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, provider: str, api_key: str):
+        key = self._key(provider, api_key)
+        now = time.monotonic()
+        entry = self._clients.pop(key, None)
+        client = entry[1] if entry else _make_client(provider, api_key)
+        self._clients[key] = (now, client)
+        self._evict(now)
+        return client
+
+    def _evict(self, now):
+        stale = [
+            k for k, (last_used, _) in self._clients.items()
+            if now - last_used > self.idle_seconds
+        ]
+        while len(self._clients) - len(stale) > self.max_clients:
+            # OrderedDict is in least-recently-used order
+            oldest = next(k for k in self._clients if k not in stale)
+            stale.append(oldest)
+        for k in stale:
+            _, client = self._clients.pop(k)
+            task = asyncio.get_running_loop().create_task(_close_later(client, CLOSE_GRACE_SECONDS))
+            self._closing[task] = client
+            task.add_done_callback(lambda t: self._closing.pop(t, None))
+
+    async def aclose(self):
+        clients = [client for _, client in self._clients.values()]
+        self._clients.clear()
+        for task, client in list(self._closing.items()):
+            task.cancel()
+            clients.append(client)
+        self._closing.clear()
+        await asyncio.gather(*(_close_client(c) for c in clients))
+
+registry = ClientRegistry()
@@ -0,0 +1,311 @@
+import io
+import os
+import re
+import html
+import time
+import shutil
+import struct
+import asyncio
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+
+from services.pdf import get_executor, shutdown_executor
+from services.cache import get_expansion_cache
+from services.buildup import slide_prompt
+from services.metrics import EXPORT_PAGES, record_span, log_event
+
+# Study-guide export. Slides are laid out in chunks by the render pool, each
+# chunk into a small PDF of its own (slide image, then its expansion flowed
+# over as many pages as it needs). Chunks are appended in order to one file
+# with incremental saves, which only ever add bytes at the end, so whatever
+# has been written can be streamed to the client straight away and neither
+# process holds more than a chunk of the document at a time.
+EXPORT_CHUNK_SLIDES = int(os.getenv("EXPORT_CHUNK_SLIDES", "8"))
+# Bytes per write when streaming the file out
+EXPORT_READ_BYTES = 256 * 1024
+# A slide whose expansion runs past this many pages is cut off there
+EXPORT_MAX_PAGES_PER_SLIDE = 20
+
+MARGIN = 36
+# (page width, page height) in points: A4, portrait or landscape
+PAGE_SIZES = {"vertical": (595, 842), "horizontal": (842, 595)}
+# Share of the width the slide image takes in the horizontal layout
+IMAGE_COLUMN = 0.4
+
+GUIDE_CSS = """
+body { font-family: sans-serif; font-size: 10pt; line-height: 1.5; color: #374151; }
+h1 { font-size: 15pt; color: #111827; }
+h2 { font-size: 13pt; color: #111827; }
+h3, h4, h5, h6 { font-size: 11pt; color: #111827; }
+p, ul, ol, pre { margin-top: 0; margin-bottom: 6pt; }
+pre, code { font-family: monospace; font-size: 8.5pt; }
+b.mark { color: #4338ca; }
+"""
+
+_MARK_RE = re.compile(r"<mark\b[^>]*>(.*?)</mark>", re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+_BULLET_RE = re.compile(r"^\s*[-*+]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^\s*\d+[.)]\s+(.*)$")
+
+def _inline(text):
+    # Annotation marks survive as highlighted words; any other raw HTML is
+    # dropped, like the browser export did
+    text = _MARK_RE.sub(lambda m: "\x01" + m.group(1) + "\x02", text)
+    text = html.escape(_TAG_RE.sub("", text).replace("&nbsp;", " "), quote=False)
+    text = re.sub(r"`([^`]+)`", r"<code>\1</code>", text)
+    text = re.sub(r"\*\*(.+?)\*\*|__(.+?)__", lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = re.sub(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?!\*)", r"<i>\1</i>", text)
+    text = re.sub(r"\[([^\]]+)\]\([^)]*\)", r"\1", text)
+    return text.replace("\x01", '<b class="mark">').replace("\x02", "</b>")
+
+def markdown_to_html(text: str) -> str:
+    """The subset of Markdown expansions use (headings, lists, code blocks,
+    emphasis) as HTML for a PyMuPDF Story."""
+    out = []
+    paragraph = []
+    list_tag = None
+    code = None
+
+    def flush():
+        nonlocal list_tag
+        if paragraph:
+            out.append("<p>" + " ".join(paragraph) + "</p>")
+            paragraph.clear()
+        if list_tag:
+            out.append(f"</{list_tag}>")
+            list_tag = None
+
+    for line in (text or "").splitlines():
+        if code is not None:
+            if line.strip().startswith("```"):
+                out.append("<pre>" + html.escape("\n".join(code), quote=False) + "</pre>")
+                code = None
+            else:
+                code.append(line)
+            continue
+        if line.strip().startswith("```"):
+            flush()
+            code = []
+            continue
+        if not line.strip():
+            flush()
+            continue
+        heading = _HEADING_RE.match(line)
+        bullet = _BULLET_RE.match(line)
+        numbered = _NUMBERED_RE.match(line)
+        if heading:
+            flush()
+            level = min(len(heading.group(1)) + 1, 6)
+            out.append(f"<h{level}>{_inline(heading.group(2))}</h{level}>")
+        elif bullet or numbered:
+            tag = "ul" if bullet else "ol"
+            if paragraph or list_tag != tag:
+                flush()
+                out.append(f"<{tag}>")
+                list_tag = tag
+            out.append("<li>" + _inline((bullet or numbered).group(1)) + "</li>")
+        elif list_tag and line.startswith((" ", "\t")):
+            # Continuation of the previous list item
+            out[-1] = out[-1][:-len("</li>")] + " " + _inline(line.strip()) + "</li>"
+        else:
+            if list_tag:
+                flush()
+            paragraph.append(_inline(line.strip()))
+    if code is not None:
+        out.append("<pre>" + html.escape("\n".join(code), quote=False) + "</pre>")
+    flush()
+    return "\n".join(out)
+
+def _png_size(data):
+    # Page images are the PNGs ingest rendered; their size is in the IHDR chunk
+    if data and data.startswith(b"\x89PNG") and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    return 16, 9
+
+def render_guide_chunk(slides, store, out_path, layout="vertical", title=None):
+    # Runs inside a worker process. `slides` are {"slide_number", "image_hash",
+    # "text"}; with `title`, the chunk opens with a title block. Writes the
+    # chunk to `out_path` and returns (slide_number, pages, seconds) per slide.
+    import fitz
+    width, height = PAGE_SIZES[layout]
+    page_rect = fitz.Rect(0, 0, width, height)
+    body = fitz.Rect(MARGIN, MARGIN, width - MARGIN, height - MARGIN)
+
+    buffer = io.BytesIO()
+    writer = fitz.DocumentWriter(buffer, "compress")
+    placed = []  # (slide, its first page, image rect, image, seconds, pages)
+    page_index = 0
+    for n, slide in enumerate(slides):
+        started = time.perf_counter()
+        image = store.get(slide["image_hash"]) if slide.get("image_hash") else None
+        heading = f"<h2>Slide {slide['slide_number']}</h2>"
+        if title and n == 0:
+            heading = f"<h1>{html.escape(title)}</h1><p>Generated by UnSlide</p>" + heading
+        # Heading first, then the image below it, then the text
+        story = fitz.Story(html=heading, user_css=GUIDE_CSS)
+        dev = writer.begin_page(page_rect)
+        _, filled = story.place(body)
+        story.draw(dev)
+        top = fitz.Rect(filled).y1 + 6
+
+        image_rect = None
+        if image is not None:
+            w, h = _png_size(image)
+            if layout == "horizontal":
+                column = (body.width - 12) * IMAGE_COLUMN
+                image_rect = fitz.Rect(body.x0, top, body.x0 + column, top + column * h / w)
+                first = fitz.Rect(image_rect.x1 + 12, top, body.x1, body.y1)
+            else:
+                image_rect = fitz.Rect(body.x0, top, body.x1, top + min(body.width * h / w, body.height * 0.45))
+                first = fitz.Rect(body.x0, image_rect.y1 + 12, body.x1, body.y1)
+        else:
+            first = fitz.Rect(body.x0, top, body.x1, body.y1)
+
+        story = fitz.Story(html=markdown_to_html(slide["text"]), user_css=GUIDE_CSS)
+        more, _ = story.place(first)
+        story.draw(dev)
+        writer.end_page()
+        pages = 1
+        while more and pages < EXPORT_MAX_PAGES_PER_SLIDE:
+            dev = writer.begin_page(page_rect)
+            more, _ = story.place(body)
+            story.draw(dev)
+            writer.end_page()
+            pages += 1
+        placed.append((slide, page_index, image_rect, image, time.perf_counter() - started, pages))
+        page_index += pages
+    writer.close()
+
+    timings = []
+    with fitz.open("pdf", buffer.getvalue()) as doc:
+        for slide, first_page, image_rect, image, seconds, pages in placed:
+            started = time.perf_counter()
+            if image_rect is not None:
+                doc[first_page].insert_image(image_rect, stream=image, keep_proportion=True)
+            timings.append((slide["slide_number"], pages, seconds + time.perf_counter() - started))
+        # Every chunk embeds its own fonts; keep only the glyphs it uses
+        doc.subset_fonts()
+        doc.save(out_path, garbage=3, deflate=True)
+    fitz.TOOLS.store_shrink(100)
+    return timings
+
+def append_guide_chunk(guide_path, chunk_path):
+    # Runs inside a worker process: the first chunk becomes the file, later
+    # ones are added with an incremental save, which leaves the bytes already
+    # written (and possibly already sent) untouched
+    import fitz
+    if not os.path.exists(guide_path):
+        os.replace(chunk_path, guide_path)
+        return
+    with fitz.open(guide_path) as guide, fitz.open(chunk_path) as chunk:
+        guide.insert_pdf(chunk)
+        guide.saveIncr()
+    os.remove(chunk_path)
+    fitz.TOOLS.store_shrink(100)
+
+def guide_indices(slides, start=1, end=None) -> range:
+    """Indices into a manifest's `slides` of the slides [start, end]."""
+    return range(max(start, 1) - 1, min(end or len(slides), len(slides)))
+
+def _guide_keys(slides, indices, course_topic, expansions, provider, model):
+    # Worker thread: prompt assembly for every slide the client sent no text for
+    cache = get_expansion_cache()
+    return {
+        i: cache.key(slide_prompt(slides, i, course_topic, provider, model), slides[i].get("image_hash"), provider, model)
+        for i in indices if not expansions.get(slides[i]["slide_number"])
+    }
+
+async def guide_slides(slides, indices, course_topic="General", expansions=None, provider=None, model=None, sources=None):
+    """
+    The slides at `indices` of a manifest with the text to print for each:
+    the client's copy of the expansion if it sent one, else the cached
+    expansion for this provider/model, else the slide's own text. Counts
+    where each text came from into `sources`.
+    """
+    cache = get_expansion_cache()
+    expansions = expansions or {}
+    sources = sources if sources is not None else {}
+    keys = await asyncio.to_thread(_guide_keys, slides, indices, course_topic, expansions, provider, model)
+    selected = []
+    for i in indices:
+        slide = slides[i]
+        text = expansions.get(slide["slide_number"])
+        source = "client"
+        if not text:
+            text = await cache.get(keys[i])
+            source = "cache"
+        if not text:
+            text = slide.get("content", "")
+            source = "slide"
+        sources[source] = sources.get(source, 0) + 1
+        selected.append({"slide_number": slide["slide_number"], "image_hash": slide.get("image_hash"), "text": text})
+    return selected
+
+async def stream_study_guide(slides, indices, store, layout="vertical", title=None, course_topic="General",
+                             expansions=None, provider=None, model=None, executor=None, chunk_slides=None):
+    """
+    Lay out the manifest `slides` at `indices` as a PDF study guide, yielding
+    the file's bytes as chunks are appended to it. Each chunk's texts are
+    resolved (guide_slides) as it is scheduled; chunks are rendered in
+    parallel, at most two per worker in flight; appends happen in order.
+    """
+    loop = asyncio.get_running_loop()
+    shared = executor is None
+    executor = executor or get_executor()
+    chunk_slides = max(1, chunk_slides or EXPORT_CHUNK_SLIDES)
+    chunks = [indices[i:i + chunk_slides] for i in range(0, len(indices), chunk_slides)]
+    sources = {"client": 0, "cache": 0, "slide": 0}
+    max_in_flight = max(1, 2 * (getattr(executor, "_max_workers", 0) or 1))
+
+    workdir = tempfile.mkdtemp(prefix="unslide-export-")
+    guide_path = os.path.join(workdir, "guide.pdf")
+    started = time.perf_counter()
+    pending = []
+    next_chunk = 0
+    sent = 0
+    pages = 0
+    try:
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < max_in_flight:
+                chunk_path = os.path.join(workdir, f"chunk-{next_chunk}.pdf")
+                chunk = await guide_slides(
+                    slides, chunks[next_chunk], course_topic, expansions, provider, model, sources
+                )
+                pending.append((chunk_path, loop.run_in_executor(
+                    executor, render_guide_chunk, chunk, store,
+                    chunk_path, layout, title if next_chunk == 0 else None
+                )))
+                next_chunk += 1
+            chunk_path, rendering = pending.pop(0)
+            for number, slide_pages, seconds in await rendering:
+                record_span("export_slide", seconds, page=number, pages=slide_pages)
+                EXPORT_PAGES.inc(slide_pages)
+                pages += slide_pages
+            await loop.run_in_executor(executor, append_guide_chunk, guide_path, chunk_path)
+
+            with open(guide_path, "rb") as f:
+                f.seek(sent)
+                while data := f.read(EXPORT_READ_BYTES):
+                    sent += len(data)
+                    yield data
+    except BrokenProcessPool:
+        # As in services.pdf.iter_slides: give the next export a fresh pool
+        if shared:
+            shutdown_executor()
+        raise
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    log_event(
+        "export_done",
+        slides=len(indices),
+        pages=pages,
+        bytes=sent,
+        ms=elapsed * 1000,
+        ms_per_page=elapsed * 1000 / pages if pages else 0,
+        **sources
+    )
@@ -0,0 +1,118 @@
+import os
+import re
+from dataclasses import dataclass
+
+from services.tokens import estimate_tokens
+
+# Chat history under a token budget. The newest messages are kept verbatim;
+# once they no longer fit, the oldest exchanges are folded, one at a time, into
+# a rolling extractive summary (question + first sentence of the answer). The
+# fold state lives with the caller (the deck session), so each turn only folds
+# the messages that just aged out instead of re-summarizing the whole chat.
+CHAT_MIN_VERBATIM_MESSAGES = int(os.getenv("CHAT_MIN_VERBATIM_MESSAGES", "2"))
+# Share of the history budget the summary may take before its oldest lines drop
+CHAT_SUMMARY_SHARE = float(os.getenv("CHAT_SUMMARY_SHARE", "0.3"))
+SUMMARY_LINE_CHARS = 200
+
+_MARKDOWN_RE = re.compile(r"[#*_`>|]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+
+@dataclass
+class HistoryWindow:
+    text: str
+    full_tokens: int
+    used_tokens: int
+    summarized_messages: int
+
+    @property
+    def saved_tokens(self):
+        return max(0, self.full_tokens - self.used_tokens)
+
+def _role(msg):
+    return "Student" if msg.get("role") == "user" else "Tutor"
+
+def format_message(msg) -> str:
+    return f"{_role(msg)}: {msg.get('content') or ''}"
+
+def _first_sentence(text):
+    text = " ".join(_MARKDOWN_RE.sub("", text or "").split())
+    return _SENTENCE_RE.split(text, 1)[0]
+
+def _clip(text, max_chars):
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+def summarize_exchange(messages) -> str:
+    """One summary line for a question/answer pair (or a lone message)."""
+    slide = next((m.get("slide_number") for m in messages if m.get("slide_number")), None)
+    parts = [
+        ("Q: " if m.get("role") == "user" else "A: ") + _first_sentence(m.get("content"))
+        for m in messages
+    ]
+    prefix = f"Slide {slide} · " if slide else ""
+    return "- " + _clip(prefix + " ".join(parts), SUMMARY_LINE_CHARS)
+
+def _exchange_length(messages, start):
+    # Fold a student question together with the tutor answer that follows it
+    if (start + 1 < len(messages) and messages[start].get("role") == "user"
+            and messages[start + 1].get("role") != "user"):
+        return 2
+    return 1
+
+def compact_history(history: list, budget: int, state: dict | None = None) -> HistoryWindow:
+    """
+    Render `history` for a prompt within `budget` tokens. `state` carries the
+    rolling summary between calls ({"summary", "summarized", "folded_tokens",
+    "dropped"}) and is updated in place; pass the same dict every turn.
+    """
+    state = state if state is not None else {}
+    if state.get("summarized", 0) > len(history):
+        # History was cut or replaced under us: start over
+        state.clear()
+    summary = state.setdefault("summary", [])
+    start = state.setdefault("summarized", 0)
+    state.setdefault("folded_tokens", 0)
+    state.setdefault("dropped", 0)
+
+    tail = history[start:]
+    tail_costs = [estimate_tokens(format_message(m)) + 1 for m in tail]
+    summary_tokens = sum(estimate_tokens(line) + 1 for line in summary)
+    summary_cap = int(budget * CHAT_SUMMARY_SHARE)
+
+    while True:
+        while summary and summary_tokens > summary_cap:
+            summary_tokens -= estimate_tokens(summary.pop(0)) + 1
+            state["dropped"] += 1
+        if len(tail) <= CHAT_MIN_VERBATIM_MESSAGES or sum(tail_costs) + summary_tokens <= budget:
+            break
+        n = min(_exchange_length(tail, 0), len(tail) - CHAT_MIN_VERBATIM_MESSAGES)
+        line = summarize_exchange(tail[:n])
+        summary.append(line)
+        summary_tokens += estimate_tokens(line) + 1
+        state["folded_tokens"] += sum(tail_costs[:n])
+        state["summarized"] += n
+        tail, tail_costs = tail[n:], tail_costs[n:]
+
+    lines = []
+    if summary or state["dropped"]:
+        lines.append("Summary of earlier conversation:")
+        if state["dropped"]:
+            lines.append(f"- ({state['dropped']} earlier exchanges omitted)")
+        lines.extend(summary)
+        lines.append("")
+        lines.append("Recent messages:")
+
+    # The newest messages are kept even if they alone exceed the budget, but
+    # clipped so one pasted wall of text can't blow the prompt up
+    if sum(tail_costs) + summary_tokens > budget:
+        per_message_chars = max(400, budget * 4 // max(1, len(tail)))
+        lines.extend(_clip(format_message(m), per_message_chars) for m in tail)
+    else:
+        lines.extend(format_message(m) for m in tail)
+    text = "\n".join(lines)
+
+    return HistoryWindow(
+        text=text,
+        full_tokens=state["folded_tokens"] + sum(tail_costs),
+        used_tokens=sum(estimate_tokens(line) + 1 for line in lines),
+        summarized_messages=state["summarized"]
+    )
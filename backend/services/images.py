@@ -0,0 +1,135 @@
+import io
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from services.store import digest_bytes, get_store, guess_media_type
+from services.metrics import record_span
+
+# Slide images are only loaded and decoded when the chosen backend actually
+# takes pixels (a text-only Groq model never touches them). Each provider gets
+# a copy scaled to the resolution it works best at and recompressed under a
+# byte budget; results are memoized per (page hash, profile) so a popular
+# slide is encoded once per process, not once per request.
+IMAGE_MEMO_BYTES = int(os.getenv("IMAGE_MEMO_BYTES", str(64 * 1024 * 1024)))
+
+@dataclass(frozen=True)
+class ImageProfile:
+    name: str
+    max_side: int
+    format: str = "JPEG"
+    quality: int = 80
+    max_bytes: int = 512 * 1024
+
+# OpenAI's high-detail mode scales a 16:9 slide down to 1366x768 before tiling,
+# Llama vision models on Groq tile at 560px, Gemini at 768px; pixels beyond
+# that only cost upload time.
+PROFILES = {
+    "openai": ImageProfile("openai", max_side=1366, max_bytes=512 * 1024),
+    "groq": ImageProfile("groq", max_side=1120, max_bytes=512 * 1024),
+    "gemini": ImageProfile("gemini", max_side=1536, max_bytes=768 * 1024),
+}
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+_memo = OrderedDict()  # (digest, profile name) -> (mime, bytes)
+_memo_bytes = 0
+_memo_lock = threading.Lock()
+
+def _memo_get(key):
+    with _memo_lock:
+        value = _memo.get(key)
+        if value is not None:
+            _memo.move_to_end(key)
+        return value
+
+def _memo_put(key, value):
+    global _memo_bytes
+    with _memo_lock:
+        if key in _memo:
+            return
+        _memo[key] = value
+        _memo_bytes += len(value[1])
+        while _memo_bytes > IMAGE_MEMO_BYTES and len(_memo) > 1:
+            _, (_, evicted) = _memo.popitem(last=False)
+            _memo_bytes -= len(evicted)
+
+def encode_for_profile(data: bytes, profile: ImageProfile):
+    from PIL import Image  # late import, keeps Pillow off the startup path
+    started = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    decoded = time.perf_counter()
+    record_span("image_decode", decoded - started, profile.name)
+    original_size = img.size
+    img.thumbnail((profile.max_side, profile.max_side), Image.LANCZOS)
+    resized = img.size != original_size
+    if profile.format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+
+    quality = profile.quality
+    while True:
+        out = io.BytesIO()
+        img.save(out, format=profile.format, quality=quality, optimize=True)
+        encoded = out.getvalue()
+        if len(encoded) <= profile.max_bytes:
+            break
+        # Over budget: trade quality first, then resolution
+        if quality > 50:
+            quality -= 15
+        elif min(img.size) > 256:
+            img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+            resized = True
+        else:
+            break
+    best = (MIME_TYPES[profile.format], encoded)
+
+    # Flat slide graphics often compress better losslessly; keep whichever
+    # candidate is smallest
+    if not resized:
+        if len(data) <= len(encoded):
+            best = (guess_media_type(data), data)
+    else:
+        out = io.BytesIO()
+        img.save(out, format="PNG")
+        if out.tell() < len(best[1]):
+            best = ("image/png", out.getvalue())
+    record_span("image_encode", time.perf_counter() - decoded, profile.name, bytes=len(best[1]))
+    return best
+
+class SlideImage:
+    """A slide image referenced by content hash. Bytes are fetched from the
+    asset store (or held, for legacy inline uploads) only on first use."""
+
+    def __init__(self, digest: str, data: bytes | None = None):
+        self.digest = digest
+        self._data = data
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        return cls(digest_bytes(data), data)
+
+    def raw(self) -> bytes | None:
+        if self._data is None:
+            self._data = get_store().get(self.digest)
+        return self._data
+
+    def _encode(self, profile):
+        data = self.raw()
+        if data is None:
+            raise ValueError(f"Slide image {self.digest} not found")
+        return encode_for_profile(data, profile)
+
+    async def prepare(self, provider: str):
+        """(mime type, bytes) sized for `provider`, memoized per page."""
+        profile = PROFILES[provider]
+        key = (self.digest, profile.name)
+        value = _memo_get(key)
+        if value is None:
+            # Decode/resize/encode is CPU-bound; keep it off the event loop
+            value = await asyncio.to_thread(self._encode, profile)
+            _memo_put(key, value)
+        return value
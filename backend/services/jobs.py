@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, asdict
+
+from services.pdf import iter_slides
+from services.store import get_store
+from services.sessions import get_session_store
+from services.retrieval import index_slides
+from services.revisions import previous_manifest, reusable_pages, diff_summary
+from services.metrics import Counter, log_event
+
+# Background ingest jobs. POST /jobs stores the upload and returns at once;
+# JOB_WORKERS workers take job IDs off a queue and render the pages.
+# Each finished page is appended to <job>.slides.ndjson as it arrives, so
+# progress and partial results can be read while the job runs, and a job
+# interrupted by a restart resumes from its last completed page. The queue is
+# in-process by default; set_job_queue() swaps in another (e.g. a local
+# broker) as long as every API process shares JOBS_DIR and the asset store.
+JOBS_DIR = os.getenv(
+    "JOBS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".unslide", "jobs")
+)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# Finished jobs (and their partial results) are kept this long for polling
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+
+JOBS = Counter("unslide_ingest_jobs_total", "Ingest jobs by outcome", ("status",))
+
+FINISHED = ("done", "failed")
+
+_jobs = None
+_queue = None
+_workers = []
+# Reservations in the upload budget, held until the job finishes
+_uploads = {}
+
+def build_manifest(doc_id, filename, slides, previous=None):
+    manifest = {
+        "doc_id": doc_id,
+        "filename": filename,
+        "total_slides": len(slides),
+        "slides": slides,
+        # Deck-wide search index for chat (services/retrieval.py); a revision
+        # only re-indexes the slides that changed
+        "index_hash": index_slides(slides, previous.get("index_hash") if previous else None)
+    }
+    if previous:
+        manifest["previous_doc_id"] = previous["doc_id"]
+    return manifest
+
+@dataclass
+class IngestJob:
+    job_id: str
+    doc_id: str
+    filename: str
+    course_topic: str = "General"
+    previous_doc_id: str | None = None
+    status: str = "queued"  # queued | running | done | failed
+    total_pages: int = 0
+    completed_pages: int = 0
+    cached: bool = False
+    deck_id: str | None = None
+    error: str | None = None
+    # Changes against previous_doc_id (services.revisions.diff_summary)
+    diff: dict | None = None
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+
+class JobStore:
+    """Job state on disk: <id>.json (status) and <id>.slides.ndjson (pages
+    completed so far). The input PDF is the job's document in the asset
+    store."""
+
+    def __init__(self, directory=JOBS_DIR, ttl=JOB_TTL_SECONDS):
+        self.directory = directory
+        self.ttl = ttl
+        self._changed = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, suffix=".json"):
+        return os.path.join(self.directory, f"{job_id}{suffix}")
+
+    def create(self, upload, filename, course_topic="General", manifest=None, previous_doc_id=None) -> IngestJob:
+        self.sweep()
+        job = IngestJob(
+            job_id=uuid.uuid4().hex,
+            doc_id=upload.doc_id,
+            filename=filename,
+            course_topic=course_topic,
+            previous_doc_id=previous_doc_id,
+            total_pages=manifest["total_slides"] if manifest else upload.pages
+        )
+        if manifest is None:
+            # Keep the upload's budget reserved until the job finishes
+            _uploads[job.job_id] = upload
+        else:
+            upload.close()
+        self.save(job)
+        return job
+
+    def get(self, job_id) -> IngestJob | None:
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                return IngestJob(**json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, job: IngestJob):
+        job.updated = time.time()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(asdict(job), f)
+        os.replace(tmp, self._path(job.job_id))
+        self._notify(job.job_id)
+
+    def append_slide(self, job: IngestJob, slide: dict):
+        with open(self._path(job.job_id, ".slides.ndjson"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(slide) + "\n")
+        job.completed_pages += 1
+        self.save(job)
+
+    def read_slides(self, job_id, offset=0) -> list:
+        try:
+            with open(self._path(job_id, ".slides.ndjson"), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        slides = []
+        for line in lines[offset:]:
+            if not line.endswith("\n"):
+                break  # still being written, or cut off by a crash
+            slides.append(json.loads(line))
+        return slides
+
+    def recover(self, job: IngestJob) -> int:
+        """Drop a page cut off mid-write by a crash; returns pages completed."""
+        slides = self.read_slides(job.job_id)
+        path = self._path(job.job_id, ".slides.ndjson")
+        if os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(slide) + "\n" for slide in slides)
+        job.completed_pages = len(slides)
+        return job.completed_pages
+
+    def finish(self, job: IngestJob):
+        # The manifest has everything now; only the status file stays around
+        try:
+            os.remove(self._path(job.job_id, ".slides.ndjson"))
+        except FileNotFoundError:
+            pass
+        self.save(job)
+
+    def unfinished(self) -> list:
+        jobs = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                job = self.get(entry.name[:-5])
+                if job is not None and job.status not in FINISHED:
+                    jobs.append(job)
+        return sorted(jobs, key=lambda job: job.created)
+
+    def sweep(self):
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json") or now - entry.stat().st_mtime <= self.ttl:
+                continue
+            job = self.get(entry.name[:-5])
+            if job is not None and job.status in FINISHED:
+                os.remove(entry.path)
+                self._changed.pop(job.job_id, None)
+
+    def _notify(self, job_id):
+        changed = self._changed.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+    def watch(self, job_id) -> asyncio.Event:
+        """An event set on the job's next save. Take it before reading the
+        job, so a save in between isn't missed."""
+        return self._changed.setdefault(job_id, asyncio.Event())
+
+class JobQueue(ABC):
+    """Where submitted job IDs wait for a worker."""
+
+    @abstractmethod
+    async def put(self, job_id: str):
+        """Queue a job for the next free worker."""
+
+    @abstractmethod
+    async def get(self) -> str:
+        """Wait for the next queued job ID."""
+
+class InProcessJobQueue(JobQueue):
+    def __init__(self):
+        self._queue = asyncio.Queue()
+
+    async def put(self, job_id):
+        await self._queue.put(job_id)
+
+    async def get(self):
+        return await self._queue.get()
+
+async def run_job(job_id: str):
+    jobs = get_job_store()
+    job = jobs.get(job_id)
+    if job is None or job.status in FINISHED:
+        return
+    store = get_store()
+    try:
+        manifest = store.get_manifest(job.doc_id)
+        previous = previous_manifest(job.previous_doc_id, job.doc_id)
+        if manifest is None:
+            path = store.local_path(job.doc_id)
+            if path is None:
+                raise ValueError("the uploaded PDF is no longer stored")
+            start = jobs.recover(job)
+            job.status = "running"
+            jobs.save(job)
+            if start:
+                log_event("ingest_job_resumed", job_id=job_id, page=start + 1, total=job.total_pages)
+            pages = iter_slides(
+                path, store, total=job.total_pages, start=start,
+                previous=reusable_pages(previous),
+                before=jobs.read_slides(job_id, start - 1)[0] if start else None
+            )
+            async for slide in pages:
+                jobs.append_slide(job, slide)
+            manifest = build_manifest(job.doc_id, job.filename, jobs.read_slides(job_id), previous)
+            store.put_manifest(job.doc_id, manifest)
+        else:
+            job.cached = True
+            job.total_pages = job.completed_pages = manifest["total_slides"]
+        if previous:
+            job.diff = diff_summary(previous, manifest["slides"])
+        job.deck_id = get_session_store().create(job.doc_id, job.course_topic).deck_id
+        job.status = "done"
+    except asyncio.CancelledError:
+        # Shutting down: leave the job "running" so the next start resumes it
+        raise
+    except Exception as e:
+        job.status = "failed"
+        job.error = f"Error processing PDF: {str(e)}"
+        log_event("ingest_job_failed", logging.WARNING, job_id=job_id, error=str(e))
+    finally:
+        upload = _uploads.pop(job_id, None)
+        if upload is not None:
+            upload.close()
+    JOBS.inc(status=job.status)
+    jobs.finish(job)
+
+async def submit(upload, filename, course_topic="General", manifest=None, previous_doc_id=None) -> IngestJob:
+    job = get_job_store().create(upload, filename, course_topic, manifest, previous_doc_id)
+    await get_job_queue().put(job.job_id)
+    return job
+
+async def _worker():
+    queue = get_job_queue()
+    while True:
+        job_id = await queue.get()
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            log_event("ingest_job_error", logging.ERROR, job_id=job_id, error=str(e))
+
+async def start_workers():
+    """Start the job workers and requeue jobs a previous run didn't finish."""
+    for _ in range(max(1, JOB_WORKERS)):
+        _workers.append(asyncio.create_task(_worker()))
+    for job in get_job_store().unfinished():
+        await get_job_queue().put(job.job_id)
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+def get_job_store() -> JobStore:
+    global _jobs
+    if _jobs is None:
+        _jobs = JobStore()
+    return _jobs
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = InProcessJobQueue()
+    return _queue
+
+def set_job_queue(queue: JobQueue):
+    # Hook for swapping in another queue (a local broker, ...)
+    global _queue
+    _queue = queue
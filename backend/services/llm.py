@@ -1,10 +1,14 @@
 import os
-import base64
-import io
-from PIL import Image
-import google.generativeai as genai
-from openai import AsyncOpenAI
-from groq import AsyncGroq
+import time
+
+from services.providers import stream_completion
+from services.images import SlideImage
+from services.tokens import Section, allocate_budget, estimate_tokens, prompt_budget, truncate_to_tokens
+from services.metrics import log_event, record_span
+
+# Neighbour slides only bridge gaps, so each gets at most this many tokens
+# however much budget is left
+EXPANSION_CONTEXT_MAX_TOKENS = int(os.getenv("EXPANSION_CONTEXT_MAX_TOKENS", "300"))
 
 EXPANSION_PROMPT_TEMPLATE = """
 You are an expert tutor helping a student understand a specific lecture slide. Your goal is to explain exactly what is on the slide, defining terms and providing necessary context without overwhelming the student.
@@ -46,185 +50,166 @@ Visual Elements on this Slide:
 {elements_list}
 """
 
-async def expand_slide(
+_TEMPLATE_TOKENS = estimate_tokens(EXPANSION_PROMPT_TEMPLATE)
+
+def build_expansion_prompt(
     slide_content: str, 
     course_topic: str = "General", 
     slide_number: int = 0, 
     prev_context: str = "", 
     next_context: str = "", 
-    slide_image: str = None, 
     elements: list = [],
-    api_key: str = None,
     provider: str = None,
     model: str = None
 ):
-    
+    started = time.perf_counter()
     # Format elements list for prompt
-    elements_str = ""
+    element_lines = []
     for el in elements:
+        # Request models and stored manifests (plain dicts) are both accepted
+        el_id, el_text = (el["id"], el["text"]) if isinstance(el, dict) else (el.id, el.text)
         # Truncate long text for prompt efficiency
-        text_preview = (el.text[:50] + '..') if len(el.text) > 50 else el.text
-        elements_str += f"- ID {el.id}: \"{text_preview}\"\n"
+        text_preview = (el_text[:50] + '..') if len(el_text) > 50 else el_text
+        element_lines.append(f"- ID {el_id}: \"{text_preview}\"")
+
+    # Fit the variable sections into the model's budget: the slide itself
+    # first, then the element IDs the annotations depend on, then neighbours
+    sections = [
+        Section("slide", slide_content, priority=0, min_tokens=1024),
+        Section("elements", "\n".join(element_lines), priority=1, min_tokens=384),
+        Section("prev", prev_context, priority=2, min_tokens=48, max_tokens=EXPANSION_CONTEXT_MAX_TOKENS),
+        Section("next", next_context, priority=3, min_tokens=48, max_tokens=EXPANSION_CONTEXT_MAX_TOKENS),
+    ]
+    budget = prompt_budget(provider, model, _TEMPLATE_TOKENS)
+    allowance = allocate_budget(sections, budget)
+    fitted = {s.name: truncate_to_tokens(s.text, allowance[s.name]) for s in sections}
+
+    if any(fitted[s.name] != s.text for s in sections):
+        # Kept/original token counts per section
+        log_event(
+            "expansion_prompt_truncated",
+            slide=slide_number,
+            budget=budget,
+            **{s.name: f"{estimate_tokens(fitted[s.name])}/{estimate_tokens(s.text)}" for s in sections}
+        )
 
     prompt = EXPANSION_PROMPT_TEMPLATE.format(
         course_topic=course_topic,
         slide_number=slide_number,
-        prev_context=prev_context,
-        next_context=next_context,
-        slide_content=slide_content,
-        elements_list=elements_str
+        prev_context=fitted["prev"],
+        next_context=fitted["next"],
+        slide_content=fitted["slide"],
+        elements_list=fitted["elements"] + "\n" if fitted["elements"] else ""
+    )
+    record_span("prompt_assembly", time.perf_counter() - started, provider, model)
+    return prompt
+
+def build_deck_prompt(slides: list, index: int, course_topic: str = "General", provider: str = None, model: str = None):
+    # Prompt for slides[index] of a stored manifest, with its neighbours as context
+    slide = slides[index]
+    prev = slides[index - 1] if index > 0 else None
+    nxt = slides[index + 1] if index + 1 < len(slides) else None
+    return build_expansion_prompt(
+        slide_content=slide["content"],
+        course_topic=course_topic,
+        slide_number=slide["slide_number"],
+        prev_context=prev["content"] if prev else "",
+        next_context=nxt["content"] if nxt else "",
+        elements=slide["elements"],
+        provider=provider,
+        model=model
+    )
+
+BUILDUP_PROMPT_TEMPLATE = """
+You are an expert tutor helping a student understand a lecture slide. This slide (Slide {slide_number}) repeats Slide {builds_on} and adds new content. The student has just read an explanation of everything on Slide {builds_on}, so explain ONLY what this slide adds.
+
+Context:
+- Course Topic: {course_topic}
+- Already explained (do not explain again): {earlier_content}
+- Next Slide Context: {next_context}
+
+New on this Slide:
+{new_content}
+
+Instructions:
+1. Continue the explanation the student has already read: do not restate, summarize or re-introduce the earlier content, and skip any heading for it.
+2. Explain what the new content means and how it follows from or adds to what came before. Keep it concise.
+3. Use the next slide context only to bridge gaps, not to pre-explain future concepts.
+4. **Visual Annotations**: when you explain one of the new elements, wrap the relevant words **in your explanation** in a raw HTML tag `<mark data-id="ID">text</mark>` (never in backticks or code blocks), where `ID` is the element's id from the list below. Only use those IDs.
+
+Output Format:
+Markdown with HTML tags for annotations.
+
+Visual Elements new on this Slide:
+{elements_list}
+"""
+
+_BUILDUP_TEMPLATE_TOKENS = estimate_tokens(BUILDUP_PROMPT_TEMPLATE)
+
+def build_buildup_prompt(
+    new_elements: dict,
+    earlier_content: str,
+    course_topic: str = "General",
+    slide_number: int = 0,
+    builds_on: int = 0,
+    next_context: str = "",
+    provider: str = None,
+    model: str = None
+):
+    # Delta prompt for a build-up slide (services/buildup.py): `new_elements`
+    # maps element id -> the text it adds
+    started = time.perf_counter()
+    element_lines = []
+    for el_id, el_text in new_elements.items():
+        text_preview = (el_text[:50] + '..') if len(el_text) > 50 else el_text
+        element_lines.append(f"- ID {el_id}: \"{text_preview}\"")
+
+    sections = [
+        Section("new", "\n\n".join(new_elements.values()), priority=0, min_tokens=512),
+        Section("elements", "\n".join(element_lines), priority=1, min_tokens=128),
+        Section("earlier", earlier_content, priority=2, min_tokens=128),
+        Section("next", next_context, priority=3, min_tokens=48, max_tokens=EXPANSION_CONTEXT_MAX_TOKENS),
+    ]
+    budget = prompt_budget(provider, model, _BUILDUP_TEMPLATE_TOKENS)
+    allowance = allocate_budget(sections, budget)
+    fitted = {s.name: truncate_to_tokens(s.text, allowance[s.name]) for s in sections}
+
+    prompt = BUILDUP_PROMPT_TEMPLATE.format(
+        course_topic=course_topic,
+        slide_number=slide_number,
+        builds_on=builds_on,
+        earlier_content=fitted["earlier"],
+        next_context=fitted["next"],
+        new_content=fitted["new"],
+        elements_list=fitted["elements"] + "\n" if fitted["elements"] else ""
     )
+    record_span("prompt_assembly", time.perf_counter() - started, provider, model)
+    return prompt
 
-    inputs = [prompt]
-    
-    # Process image if present
-    pil_image = None
-    if slide_image:
-        try:
-            # Remove header if present (e.g., "data:image/png;base64,")
-            if "base64," in slide_image:
-                slide_image = slide_image.split("base64,")[1]
-            
-            image_data = base64.b64decode(slide_image)
-            pil_image = Image.open(io.BytesIO(image_data))
-            inputs.append(pil_image)
-        except Exception as e:
-            print(f"Error processing image: {e}")
-
-    # --- Helper Functions for Providers ---
-
-    async def call_groq(key, model_name):
-        try:
-            client = AsyncGroq(api_key=key)
-            # Groq supports vision models like llama-3.2-11b-vision-preview
-            # If model supports vision and we have an image, send it.
-            # Otherwise send text only.
-            
-            messages = [{"role": "user", "content": prompt}]
-            
-            if slide_image and "vision" in (model_name or "").lower():
-                 messages = [
-                    {
-                        "role": "user", 
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/jpeg;base64,{slide_image}"}
-                            }
-                        ]
-                    }
-                ]
-
-            stream = await client.chat.completions.create(
-                messages=messages,
-                model=model_name or "llama3-70b-8192",
-                stream=True,
-            )
-            async for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-        except Exception as e:
-            print(f"Groq failed: {e}")
-            raise e
-
-    async def call_gemini(key, model_name):
-        try:
-            genai.configure(api_key=key)
-            # Use provided model or fallback list
-            models = [model_name] if model_name else [
-                'gemini-2.5-flash', 'gemini-2.5-flash-lite', 
-                'gemini-1.5-flash', 'gemini-1.5-pro'
-            ]
-            
-            for m in models:
-                try:
-                    model_instance = genai.GenerativeModel(m)
-                    response = await model_instance.generate_content_async(inputs, stream=True)
-                    async for chunk in response:
-                        if chunk.text:
-                            for char in chunk.text:
-                                yield char
-                    return
-                except Exception as e:
-                    print(f"Google GenAI model {m} failed: {e}")
-                    if m == models[-1]: raise e
-                    continue
-        except Exception as e:
-            print(f"Google GenAI failed: {e}")
-            raise e
-
-    async def call_openai(key, model_name):
-        try:
-            client = AsyncOpenAI(api_key=key)
-            messages = [{"role": "user", "content": prompt}]
-            if slide_image:
-                messages = [
-                    {
-                        "role": "user", 
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/png;base64,{slide_image}"}
-                            }
-                        ]
-                    }
-                ]
-
-            response = await client.chat.completions.create(
-                model=model_name or "gpt-4o",
-                messages=messages,
-                stream=True
-            )
-            async for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-        except Exception as e:
-             print(f"OpenAI failed: {e}")
-             raise e
-
-    # --- Selection Logic ---
-
-    # 1. User Provided Key
-    if api_key and provider:
-        if provider.lower() == "groq":
-            async for chunk in call_groq(api_key, model): yield chunk
-            return
-        elif provider.lower() == "gemini":
-            async for chunk in call_gemini(api_key, model): yield chunk
-            return
-        elif provider.lower() == "openai":
-            async for chunk in call_openai(api_key, model): yield chunk
-            return
-
-    # 2. Server Defaults (Groq -> Google -> OpenAI)
-    
-    # Try Groq (Free Tier)
-    if os.getenv("GROQ_API_KEY"):
-        try:
-            async for chunk in call_groq(os.getenv("GROQ_API_KEY"), os.getenv("GROQ_MODEL", "llama3-70b-8192")):
-                yield chunk
-            return
-        except Exception:
-            pass # Fallthrough
-
-    # Try Google
-    if os.getenv("GOOGLE_API_KEY"):
-        try:
-            async for chunk in call_gemini(os.getenv("GOOGLE_API_KEY"), None):
-                yield chunk
-            return
-        except Exception:
-            pass # Fallthrough
-
-    # Try OpenAI
-    if os.getenv("OPENAI_API_KEY"):
-        try:
-            async for chunk in call_openai(os.getenv("OPENAI_API_KEY"), None):
-                yield chunk
-            return
-        except Exception:
-            pass
-
-    raise ValueError("No working API key found or all LLM calls failed.")
+async def expand_slide(
+    slide_content: str, 
+    course_topic: str = "General", 
+    slide_number: int = 0, 
+    prev_context: str = "", 
+    next_context: str = "", 
+    image: SlideImage = None, 
+    elements: list = [],
+    api_key: str = None,
+    provider: str = None,
+    model: str = None
+):
+    prompt = build_expansion_prompt(
+        slide_content, course_topic, slide_number, prev_context, next_context, elements, provider, model
+    )
+    async for chunk in stream_expansion(prompt, image, api_key, provider, model):
+        yield chunk
+
+async def stream_expansion(
+    prompt: str,
+    image: SlideImage = None,
+    api_key: str = None,
+    provider: str = None,
+    model: str = None
+):
+    async for chunk in stream_completion(prompt, image, api_key, provider, model):
+        yield chunk
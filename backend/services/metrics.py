@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Structured logs, Prometheus metrics and timing spans for the hot paths.
+# Spans feed the unslide_phase_seconds histogram and are logged (at DEBUG)
+# with the request ID, so one slow request can be followed phase by phase.
+# No client library: the text exposition format is small enough to write.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text (key=value) | json
+# Opt-in profiler: with PROFILE_REQUESTS=1, a request carrying "X-Profile: 1"
+# runs under cProfile and the stats land in PROFILE_DIR/<request id>.prof
+# (view as a flame graph with e.g. `snakeviz` or `flameprof`)
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".unslide", "profiles")
+)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("unslide")
+request_id = contextvars.ContextVar("request_id", default=None)
+
+_REQUEST_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+_registry = []
+_profile_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Gauge(Counter):
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, row in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, row):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {row[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {row[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+HTTP_REQUESTS = Counter("unslide_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_SECONDS = Histogram("unslide_http_request_seconds", "HTTP request time including the streamed body", ("method", "route"))
+PHASE_SECONDS = Histogram("unslide_phase_seconds", "Time spent in hot-path phases", ("phase", "provider", "model"))
+LLM_TTFT_SECONDS = Histogram("unslide_llm_ttft_seconds", "Time to first token from the committed backend", ("provider", "model"))
+LLM_STREAM_SECONDS = Histogram("unslide_llm_stream_seconds", "Total upstream stream time", ("provider", "model", "outcome"))
+LLM_ERRORS = Counter("unslide_llm_errors_total", "Upstream LLM failures", ("provider", "model", "stage"))
+LLM_FALLBACK_HOPS = Counter("unslide_llm_fallback_hops_total", "Requests moved on to another backend after this one failed", ("provider", "model"))
+LLM_HEDGES = Counter("unslide_llm_hedges_total", "Backup requests started because this backend was slow", ("provider", "model"))
+STREAM_BYTES = Counter("unslide_stream_bytes_total", "Bytes streamed to clients", ("route",))
+STREAM_WRITES = Counter("unslide_stream_writes_total", "Coalesced writes streamed to clients", ("route",))
+INGEST_PAGES = Counter("unslide_ingest_pages_total", "Pages rendered during ingest")
+INGEST_PAGES_REUSED = Counter("unslide_ingest_pages_reused_total", "Pages taken unchanged from a deck's previous revision")
+EXPORT_PAGES = Counter("unslide_export_pages_total", "Study-guide pages written by /export/pdf")
+EXPANSION_CACHE = Counter("unslide_expansion_cache_total", "Expansion cache lookups", ("result",))
+
+def _fmt(value):
+    if isinstance(value, float):
+        value = round(value, 2)
+    text = str(value)
+    return json.dumps(text) if (not text or any(c in text for c in " =\"")) else text
+
+def log_event(event: str, level=logging.INFO, **fields):
+    """One structured log line: event=... key=value ... (or JSON)."""
+    if not logger.isEnabledFor(level):
+        return
+    rid = request_id.get()
+    if rid:
+        fields = {"request_id": rid, **fields}
+    if LOG_FORMAT == "json":
+        message = json.dumps({"event": event, **fields}, default=str)
+    else:
+        message = " ".join([f"event={event}"] + [f"{k}={_fmt(v)}" for k, v in fields.items()])
+    logger.log(level, message)
+
+def model_label(provider: str = "", model: str = "") -> str:
+    """`model` as a metric label: model names come from clients, so any the
+    provider isn't known to serve are folded into "other"."""
+    if not model:
+        return ""
+    # Late import: providers imports this module
+    from services.providers import KNOWN_MODELS
+    name = model.removeprefix("models/")
+    return name if name in KNOWN_MODELS.get(provider or "", ()) else "other"
+
+def record_span(phase: str, seconds: float, provider: str = "", model: str = "", **fields):
+    PHASE_SECONDS.observe(seconds, phase=phase, provider=provider or "", model=model_label(provider, model))
+    log_event("span", logging.DEBUG, phase=phase, ms=seconds * 1000, provider=provider or "", model=model or "", **fields)
+
+@contextmanager
+def span(phase: str, provider: str = "", model: str = "", **fields):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(phase, time.perf_counter() - started, provider, model, **fields)
+
+def configure_logging():
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    fmt = "%(message)s" if LOG_FORMAT == "json" else "%(asctime)s %(levelname)s %(name)s %(message)s"
+    handler.setFormatter(logging.Formatter(fmt))
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware (no response buffering, so streams stay streams):
+    assigns a request ID, times the whole request including the streamed
+    body, and runs the opt-in profiler."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        rid = headers.get(b"x-request-id", b"").decode("latin-1")
+        if not _REQUEST_ID_RE.fullmatch(rid):
+            rid = uuid.uuid4().hex[:16]
+        token = request_id.set(rid)
+        profiler = None
+        if PROFILE_REQUESTS and headers.get(b"x-profile") == b"1" and _profile_lock.acquire(blocking=False):
+            # cProfile is per-thread and single-instance: one profiled request at a
+            # time, and whatever else the event loop runs meanwhile shows up too
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+            HTTP_SECONDS.observe(elapsed, method=scope["method"], route=route)
+            log_event("request", method=scope["method"], route=route, status=status, ms=elapsed * 1000)
+            if profiler is not None:
+                profiler.disable()
+                _profile_lock.release()
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                path = os.path.join(PROFILE_DIR, f"{rid}.prof")
+                profiler.dump_stats(path)
+                log_event("profile", path=path)
+            request_id.reset(token)
@@ -0,0 +1,229 @@
+import os
+import time
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from services.store import asset_url
+from services.buildup import annotate_buildup
+from services.metrics import INGEST_PAGES, INGEST_PAGES_REUSED, record_span
+
+# Number of worker processes used for page rendering (0 = render in a thread
+# of the API process) and how many pages each worker task handles.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_CHUNK_PAGES = int(os.getenv("INGEST_CHUNK_PAGES", "8"))
+# Scale of the thumbnail hashed into each page's fingerprint: enough to see a
+# changed figure or colour, far cheaper than the full render
+FINGERPRINT_SCALE = 0.2
+
+_executor = None
+
+def page_fingerprint(page, text_blocks):
+    """
+    Identifies a page's content across uploads: its text blocks with their
+    positions, plus a small render for everything that isn't text. A revised
+    deck reuses the extraction and image of every page whose fingerprint it
+    has seen before.
+    """
+    import fitz
+    digest = hashlib.sha256()
+    for block in text_blocks:
+        digest.update(f"{block[0]:.1f},{block[1]:.1f},{block[2]:.1f},{block[3]:.1f}|{block[4]}\x00".encode("utf-8"))
+    thumb = page.get_pixmap(matrix=fitz.Matrix(FINGERPRINT_SCALE, FINGERPRINT_SCALE))
+    digest.update(thumb.samples)
+    return digest.hexdigest()
+
+def extract_slide(page, index, store, text_blocks=None):
+    started = time.perf_counter()
+    # Extract text blocks with coordinates
+    # blocks format: (x0, y0, x1, y1, "lines", block_no, block_type)
+    if text_blocks is None:
+        text_blocks = page.get_text("blocks")
+
+    elements = []
+    full_text = ""
+
+    page_width = page.rect.width
+    page_height = page.rect.height
+
+    for b_idx, block in enumerate(text_blocks):
+        # block[4] is the text content
+        text_content = block[4].strip()
+        if not text_content:
+            continue
+
+        full_text += text_content + "\n\n"
+
+        # Normalize coordinates to 0-1000
+        x0, y0, x1, y1 = block[0], block[1], block[2], block[3]
+        norm_box = [
+            int((y0 / page_height) * 1000),
+            int((x0 / page_width) * 1000),
+            int((y1 / page_height) * 1000),
+            int((x1 / page_width) * 1000)
+        ]
+
+        elements.append({
+            "id": b_idx,
+            "text": text_content,
+            "box_2d": norm_box
+        })
+
+    # Generate image and store it by content hash; the client fetches it by URL
+    extracted = time.perf_counter()
+    import fitz  # PyMuPDF; already loaded by whoever opened `page`
+    pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
+    rendered = time.perf_counter()
+    png = pix.tobytes("png")
+    encoded = time.perf_counter()
+    image_hash = store.put(png)
+
+    return {
+        "slide_number": index + 1,
+        "content": full_text,
+        "elements": elements,
+        "image": asset_url(image_hash),
+        "image_hash": image_hash,
+        # Worker-side phase timings; iter_slides records and strips them
+        "_timings": {
+            "text_extract": extracted - started,
+            "pixmap_render": rendered - extracted,
+            "png_encode": encoded - rendered,
+            "asset_write": time.perf_counter() - encoded
+        }
+    }
+
+class UnreadablePDF(ValueError):
+    """The upload isn't a PDF PyMuPDF can open (raised in a worker, so it
+    carries only the message across the process boundary)."""
+
+# PyMuPDF is imported where it's used: the API process only needs it to count
+# pages, the render workers import it themselves.
+def page_count(path):
+    import fitz
+    try:
+        doc = fitz.open(path)
+    except fitz.FileDataError as e:
+        raise UnreadablePDF(str(e))
+    with doc:
+        return doc.page_count
+
+def render_page_range(path, start, end, store, known=frozenset()):
+    # Runs inside a worker process: each worker opens the document itself so
+    # only the path crosses the process boundary, not the PDF bytes.
+    # Pages whose fingerprint is in `known` aren't rendered; the caller fills
+    # them in from the previous revision of the deck.
+    import fitz
+    slides = []
+    with fitz.open(path) as doc:
+        for i in range(start, end):
+            page = doc[i]
+            text_blocks = page.get_text("blocks")
+            started = time.perf_counter()
+            fingerprint = page_fingerprint(page, text_blocks)
+            timings = {"fingerprint": time.perf_counter() - started}
+            if fingerprint in known:
+                slides.append({"slide_number": i + 1, "fingerprint": fingerprint, "_timings": timings})
+                continue
+            slide = extract_slide(page, i, store, text_blocks)
+            slide["fingerprint"] = fingerprint
+            slide["_timings"].update(timings)
+            slides.append(slide)
+    # MuPDF keeps decoded images in a process-wide store (up to 256 MB) that
+    # outlives the document; empty it so a worker's memory doesn't grow with
+    # the size of the decks it has seen
+    fitz.TOOLS.store_shrink(100)
+    return slides
+
+def get_executor():
+    global _executor
+    if _executor is None and INGEST_WORKERS > 0:
+        # spawn rather than fork: the API process holds gRPC/HTTP client threads
+        _executor = ProcessPoolExecutor(
+            max_workers=INGEST_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _warm_worker():
+    import fitz  # noqa: F401
+    return os.getpid()
+
+def warm_executor():
+    """Spawn the render workers and load PyMuPDF in each of them (blocking)."""
+    executor = get_executor()
+    if executor is None:
+        return 0
+    # One task per worker: spawn processes start as tasks are queued
+    futures = [executor.submit(_warm_worker) for _ in range(INGEST_WORKERS)]
+    return len({f.result() for f in futures})
+
+async def count_pages(path, executor=None):
+    # In a worker, so a huge upload is never parsed in the API process
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor or get_executor(), page_count, path)
+    except BrokenProcessPool:
+        # A worker died since the last upload; as in iter_slides, drop the
+        # pool, then try once more on a fresh one
+        if executor is not None and executor is not _executor:
+            raise
+        shutdown_executor()
+        return await loop.run_in_executor(get_executor(), page_count, path)
+
+async def iter_slides(path, store, executor=None, chunk_pages=None, total=None, start=0, previous=None, before=None):
+    """
+    Render every page of the PDF at `path` (from page index `start`, for
+    resumed jobs), yielding slides in page order. Page ranges are spread
+    across the process pool; at most two chunks per worker are in flight so
+    finished pages don't pile up in memory. `previous` maps fingerprints to
+    slides of an earlier revision; those pages are reused, not re-rendered.
+    Build-up pages are marked against the page before them (services/buildup.py);
+    `before` is the slide preceding `start`, if any.
+    """
+    previous = previous or {}
+    known = frozenset(previous)
+    loop = asyncio.get_running_loop()
+    executor = executor or get_executor()
+    chunk_pages = max(1, chunk_pages or INGEST_CHUNK_PAGES)
+    if total is None:
+        total = await count_pages(path, executor)
+
+    ranges = [(s, min(s + chunk_pages, total)) for s in range(start, total, chunk_pages)]
+    max_in_flight = max(1, 2 * (getattr(executor, "_max_workers", 0) or 1))
+
+    pending = []
+    next_range = 0
+    try:
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                start, end = ranges[next_range]
+                pending.append(loop.run_in_executor(executor, render_page_range, path, start, end, store, known))
+                next_range += 1
+            slides = await pending.pop(0)
+            for slide in slides:
+                for phase, seconds in slide.pop("_timings", {}).items():
+                    record_span(phase, seconds, page=slide["slide_number"])
+                if slide["fingerprint"] in previous and "content" not in slide:
+                    slide = {**previous[slide["fingerprint"]], "slide_number": slide["slide_number"]}
+                    INGEST_PAGES_REUSED.inc()
+                else:
+                    INGEST_PAGES.inc()
+                before = annotate_buildup(before, slide)
+                yield slide
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); drop the pool so the next upload gets a fresh one
+        if executor is _executor:
+            shutdown_executor()
+        raise
+    finally:
+        for fut in pending:
+            fut.cancel()
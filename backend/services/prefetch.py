@@ -0,0 +1,142 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+
+from services.llm import stream_expansion
+from services.cache import get_expansion_cache
+from services.images import SlideImage
+from services.metrics import Counter, log_event
+from services.singleflight import expansion_flights
+from services.scheduler import priority
+from services.buildup import slide_prompt
+
+# Speculative pre-expansion. Students read decks front to back, so while
+# slide N is open the next PREFETCH_AHEAD slides are expanded in the
+# background, into the expansion cache, for an instant replay when the
+# student gets there (or a join of the still-running stream, via
+# single-flight). Prefetches for slides outside the new window are cancelled
+# when the student jumps. PREFETCH_CONCURRENCY bounds the upstream calls
+# spent on speculation across all decks; 0 for PREFETCH_AHEAD turns it off.
+PREFETCH_AHEAD = int(os.getenv("PREFETCH_AHEAD", "2"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+# Finished prefetches remembered until read; the oldest unread one counts
+# as unused when this overflows
+PREFETCH_TRACK_ITEMS = 2048
+
+# Every started prefetch ends as exactly one of hit / cancelled / failed /
+# unused, so hit ratio = hit / started and waste = (cancelled + unused) / started
+PREFETCH = Counter("unslide_prefetch_total", "Speculative expansions by outcome", ("result",))
+
+class Prefetcher:
+    def __init__(self, ahead=PREFETCH_AHEAD, concurrency=PREFETCH_CONCURRENCY, track_items=PREFETCH_TRACK_ITEMS):
+        self.ahead = ahead
+        self.track_items = track_items
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._decks = {}  # deck_id -> {slide_number: task}
+        self._running = {}  # cache key -> read yet?
+        self._unread = OrderedDict()  # cache key -> None, finished and not yet read
+
+    def claim(self, key: str) -> bool:
+        """Called for every foreground expansion: True (and counted as a hit)
+        if it is being served from a prefetch."""
+        if key in self._running:
+            if not self._running[key]:
+                self._running[key] = True
+                PREFETCH.inc(result="hit")
+                return True
+            return False
+        if key in self._unread:
+            del self._unread[key]
+            PREFETCH.inc(result="hit")
+            return True
+        return False
+
+    def schedule(self, deck_id, slides, index, course_topic, api_key=None, provider=None, model=None):
+        """Slide `index` was just opened: prefetch the slides after it and
+        cancel prefetches the reader has moved away from."""
+        if self.ahead <= 0:
+            return
+        window = {
+            slides[i]["slide_number"]: i
+            for i in range(index + 1, min(len(slides), index + 1 + self.ahead))
+        }
+        tasks = self._decks.get(deck_id, {})
+        for number in list(tasks):
+            # The open slide's own prefetch may be feeding the reader right now
+            if number not in window and number != slides[index]["slide_number"]:
+                tasks.pop(number).cancel()
+
+        cache = get_expansion_cache()
+        for number, i in window.items():
+            if number in tasks:
+                continue
+            # Build-up slides only prefetch their delta; earlier steps were read already
+            prompt = slide_prompt(slides, i, course_topic, provider, model)
+            image_hash = slides[i].get("image_hash")
+            key = cache.key(prompt, image_hash, provider, model)
+            # Only the memory tier here; _run checks the disk before starting
+            if key in self._unread or expansion_flights.joinable(key) or cache.peek(key) is not None:
+                continue
+
+            def upstream(key=key, prompt=prompt, image_hash=image_hash):
+                return cache.record(key, stream_expansion(
+                    prompt,
+                    image=SlideImage(image_hash) if image_hash else None,
+                    api_key=api_key,
+                    provider=provider,
+                    model=model
+                ))
+
+            tasks[number] = asyncio.get_running_loop().create_task(self._run(deck_id, number, key, upstream))
+        if tasks:
+            self._decks[deck_id] = tasks
+        else:
+            self._decks.pop(deck_id, None)
+
+    async def _run(self, deck_id, number, key, upstream):
+        # Speculation yields to every request someone is actually waiting on
+        priority.set("prefetch")
+        started = False
+        outcome = "failed"
+        try:
+            async with self._slots:
+                # While this waited for a slot the reader may have got there first
+                if not expansion_flights.joinable(key) and await get_expansion_cache().get(key) is None:
+                    started = True
+                    self._running[key] = False
+                    PREFETCH.inc(result="started")
+                    async for _ in expansion_flights.stream(key, upstream):
+                        pass
+            outcome = "done"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            log_event("prefetch_failed", logging.WARNING, slide=number, error=str(e))
+        finally:
+            tasks = self._decks.get(deck_id, {})
+            if tasks.get(number) is asyncio.current_task():
+                del tasks[number]
+                if not tasks:
+                    del self._decks[deck_id]
+            if started and not self._running.pop(key, False):
+                if outcome == "done":
+                    self._remember_unread(key)
+                else:
+                    PREFETCH.inc(result=outcome)
+
+    def _remember_unread(self, key):
+        self._unread[key] = None
+        while len(self._unread) > self.track_items:
+            self._unread.popitem(last=False)
+            PREFETCH.inc(result="unused")
+
+    async def aclose(self):
+        tasks = [task for deck in self._decks.values() for task in deck.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._decks.clear()
+
+prefetcher = Prefetcher()
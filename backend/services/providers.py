@@ -0,0 +1,211 @@
+import os
+import base64
+import logging
+
+from services.clients import registry, preload_sdk
+from services.routing import Candidate, router
+from services.metrics import log_event, span
+from services.scheduler import request_cost, scheduler
+
+# Shared provider calls for slide expansion and chat. Each helper streams text
+# chunks for a single prompt, optionally with the slide image attached. The
+# image is a services.images.SlideImage and is only prepared if the chosen
+# model will look at it.
+
+DEFAULT_GROQ_MODEL = "llama3-70b-8192"
+DEFAULT_OPENAI_MODEL = "gpt-4o"
+GEMINI_FALLBACK_MODELS = [
+    'gemini-2.5-flash', 'gemini-2.5-flash-lite',
+    'gemini-1.5-flash', 'gemini-1.5-pro'
+]
+# Models metrics are labelled with; anything else a client asks for is
+# counted as "other" (see services.metrics.model_label)
+KNOWN_MODELS = {
+    "groq": [
+        DEFAULT_GROQ_MODEL, "llama3-8b-8192", "llama-3.1-8b-instant", "llama-3.3-70b-versatile",
+        "llama-3.2-11b-vision-preview", "llama-3.2-90b-vision-preview", "mixtral-8x7b-32768", "gemma2-9b-it"
+    ],
+    "openai": [DEFAULT_OPENAI_MODEL, "gpt-4o-mini", "gpt-4.1", "gpt-4.1-mini", "gpt-4-turbo", "gpt-3.5-turbo"],
+    "gemini": GEMINI_FALLBACK_MODELS + ["gemini-2.0-flash"],
+}
+
+async def image_data_url(image, provider):
+    mime, data = await image.prepare(provider)
+    with span("base64_encode", provider, bytes=len(data)):
+        return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+async def call_groq(key, model_name, prompt, image=None):
+    try:
+        client = registry.get("groq", key)
+        # Groq supports vision models like llama-3.2-11b-vision-preview
+        # If model supports vision and we have an image, send it.
+        # Otherwise send text only.
+
+        messages = [{"role": "user", "content": prompt}]
+
+        if image and "vision" in (model_name or "").lower():
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": await image_data_url(image, "groq")}
+                        }
+                    ]
+                }
+            ]
+
+        model_name = model_name or DEFAULT_GROQ_MODEL
+        with span("provider_connect", "groq", model_name):
+            # Raw response so the scheduler sees the rate-limit headers
+            raw = await scheduler.call(
+                "groq", model_name, key, request_cost(prompt),
+                lambda: client.chat.completions.with_raw_response.create(
+                    messages=messages,
+                    model=model_name,
+                    stream=True,
+                )
+            )
+            stream = raw.parse()
+        async for chunk in stream:
+            if chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        log_event("provider_error", logging.WARNING, provider="groq", model=model_name, error=str(e))
+        raise e
+
+async def call_gemini(key, model_name, prompt, image=None):
+    try:
+        # Late import: the Gemini SDK is slow to load and not every deployment uses it
+        import google.ai.generativelanguage as glm
+        parts = [glm.Part(text=prompt)]
+        if image:
+            try:
+                mime, data = await image.prepare("gemini")
+                parts.append(glm.Part(inline_data=glm.Blob(mime_type=mime, data=data)))
+            except Exception as e:
+                log_event("image_error", logging.WARNING, provider="gemini", error=str(e))
+
+        # Call the per-key service client from the registry directly, rather
+        # than through genai.GenerativeModel, which builds its client from the
+        # process-global genai.configure() (racy between BYO keys)
+        client = registry.get("gemini", key)
+        request = glm.GenerateContentRequest(
+            model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+            contents=[glm.Content(role="user", parts=parts)]
+        )
+        with span("provider_connect", "gemini", model_name):
+            response = await scheduler.call(
+                "gemini", model_name, key, request_cost(prompt),
+                lambda: client.stream_generate_content(request)
+            )
+        async for chunk in response:
+            for candidate in chunk.candidates[:1]:
+                text = "".join(part.text for part in candidate.content.parts)
+                if text:
+                    yield text
+    except Exception as e:
+        log_event("provider_error", logging.WARNING, provider="gemini", model=model_name, error=str(e))
+        raise e
+
+async def call_openai(key, model_name, prompt, image=None):
+    try:
+        client = registry.get("openai", key)
+        messages = [{"role": "user", "content": prompt}]
+        if image:
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": await image_data_url(image, "openai")}
+                        }
+                    ]
+                }
+            ]
+
+        model_name = model_name or DEFAULT_OPENAI_MODEL
+        with span("provider_connect", "openai", model_name):
+            # Raw response so the scheduler sees the rate-limit headers
+            raw = await scheduler.call(
+                "openai", model_name, key, request_cost(prompt),
+                lambda: client.chat.completions.with_raw_response.create(
+                    model=model_name,
+                    messages=messages,
+                    stream=True
+                )
+            )
+            response = raw.parse()
+        async for chunk in response:
+            if chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        log_event("provider_error", logging.WARNING, provider="openai", model=model_name, error=str(e))
+        raise e
+
+CALLS = {"groq": call_groq, "gemini": call_gemini, "openai": call_openai}
+
+def candidates_for(provider, key, model, prompt, image):
+    call = CALLS[provider]
+    if provider == "gemini" and not model:
+        # Each fallback model is its own backend with its own health record
+        models = GEMINI_FALLBACK_MODELS
+    elif provider == "groq":
+        models = [model or DEFAULT_GROQ_MODEL]
+    elif provider == "openai":
+        models = [model or DEFAULT_OPENAI_MODEL]
+    else:
+        models = [model]
+    return [
+        Candidate(provider, m, key, lambda m=m: call(key, m, prompt, image))
+        for m in models
+    ]
+
+def server_candidates(prompt, image):
+    # Server Defaults, in preference order (Groq -> Google -> OpenAI); the
+    # router reorders them by observed health and latency
+    candidates = []
+    if os.getenv("GROQ_API_KEY"):
+        candidates += candidates_for("groq", os.getenv("GROQ_API_KEY"), os.getenv("GROQ_MODEL", DEFAULT_GROQ_MODEL), prompt, image)
+    if os.getenv("GOOGLE_API_KEY"):
+        candidates += candidates_for("gemini", os.getenv("GOOGLE_API_KEY"), None, prompt, image)
+    if os.getenv("OPENAI_API_KEY"):
+        candidates += candidates_for("openai", os.getenv("OPENAI_API_KEY"), None, prompt, image)
+    return candidates
+
+SERVER_KEYS = {"groq": "GROQ_API_KEY", "gemini": "GOOGLE_API_KEY", "openai": "OPENAI_API_KEY"}
+
+def warm_up():
+    """Load the SDKs for the server-default providers, so the first request
+    doesn't pay for it (safe to run off the event loop). Returns the providers."""
+    warmed = []
+    for provider, env in SERVER_KEYS.items():
+        if os.getenv(env):
+            preload_sdk(provider)
+            warmed.append(provider)
+    return warmed
+
+def open_clients(providers):
+    """Open the pooled clients for server-default providers. Call on the
+    event loop: gRPC aio channels and httpx async pools bind to the loop
+    they are created on."""
+    for provider in providers:
+        registry.get(provider, os.getenv(SERVER_KEYS[provider]))
+
+async def stream_completion(prompt, image=None, api_key=None, provider=None, model=None):
+    # 1. User Provided Key
+    if api_key and provider and provider.lower() in CALLS:
+        candidates = candidates_for(provider.lower(), api_key, model, prompt, image)
+    # 2. Server Defaults
+    else:
+        candidates = server_candidates(prompt, image)
+
+    if not candidates:
+        raise ValueError("No working API key found or all LLM calls failed.")
+
+    async for chunk in router.stream(candidates):
+        yield chunk
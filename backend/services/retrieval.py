@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import Counter, OrderedDict
+
+from services.store import digest_bytes, get_store
+from services.metrics import record_span
+
+# Per-deck BM25 index over slide text blocks, so chat can quote other slides
+# ("how does this relate to slide 4?") without the client pasting them in.
+# Pure Python: decks are a few thousand short passages at most, and a query
+# only touches the postings of its own terms.
+#
+# The index is serialized into the asset store (content-addressed, like page
+# images) and referenced from the manifest as "index_hash". Per-slide entries
+# carry a digest of the slide text, so re-indexing a changed deck only
+# re-tokenizes the slides that actually changed.
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_MAX_CHARS = int(os.getenv("RETRIEVAL_MAX_CHARS", "1500"))
+SNIPPET_MAX_CHARS = 400
+INDEX_CACHE_ITEMS = 32
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_SLIDE_REF_RE = re.compile(r"\b(?:slide|page)s?\s*#?\s*(\d+)", re.IGNORECASE)
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its
+me my no not of on or our so such that the their then there these they this to was
+we what when where which who why will with you your about also than more most
+""".split())
+
+_cache = OrderedDict()  # index hash -> DeckIndex
+_cache_lock = threading.Lock()
+
+def tokenize(text: str) -> list[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+def slide_passages(slide: dict) -> list[str]:
+    # Text blocks are the natural passages; fall back to the whole page text
+    texts = [e["text"] for e in slide.get("elements") or [] if e.get("text", "").strip()]
+    return texts or ([slide["content"]] if slide.get("content", "").strip() else [])
+
+def _clip(text, max_chars):
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+class DeckIndex:
+    def __init__(self, slides=None, df=None):
+        # slide_number (str, JSON keys) -> {"digest", "passages": [{"text", "tf"}]}
+        self.slides = slides or {}
+        self.df = Counter(df or {})
+        self._postings = None
+
+    @classmethod
+    def build(cls, slides: list, previous: "DeckIndex | None" = None) -> "DeckIndex":
+        index = DeckIndex(dict(previous.slides), previous.df) if previous else DeckIndex()
+        index.update(slides)
+        return index
+
+    def update(self, slides: list) -> int:
+        """Re-index changed slides (and drop vanished ones). Returns how many
+        slides had to be re-tokenized."""
+        seen = set()
+        changed = 0
+        for slide in slides:
+            key = str(slide["slide_number"])
+            seen.add(key)
+            passages = slide_passages(slide)
+            digest = digest_bytes("\x00".join(passages).encode("utf-8"))
+            if key in self.slides and self.slides[key]["digest"] == digest:
+                continue
+            self._remove(key)
+            entries = [{"text": text, "tf": dict(Counter(tokenize(text)))} for text in passages]
+            for entry in entries:
+                self.df.update(entry["tf"].keys())
+            self.slides[key] = {"digest": digest, "passages": entries}
+            changed += 1
+        for key in [k for k in self.slides if k not in seen]:
+            self._remove(key)
+        self._postings = None
+        return changed
+
+    def _remove(self, key):
+        for entry in self.slides.pop(key, {"passages": []})["passages"]:
+            self.df.subtract(entry["tf"].keys())
+        self.df = +self.df  # drop zero counts
+
+    def _build_postings(self):
+        passages = []
+        postings = {}
+        for key, slide in self.slides.items():
+            for entry in slide["passages"]:
+                length = sum(entry["tf"].values())
+                for term, count in entry["tf"].items():
+                    postings.setdefault(term, []).append((len(passages), count))
+                passages.append((int(key), entry["text"], length))
+        avgdl = sum(p[2] for p in passages) / len(passages) if passages else 0.0
+        self._postings = (passages, postings, avgdl)
+        return self._postings
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K, exclude: set = frozenset()):
+        """Top-k slides by BM25 as (score, slide_number, best passage), skipping
+        slides in `exclude`. Each slide appears once, at its best passage."""
+        passages, postings, avgdl = self._postings or self._build_postings()
+        n = len(passages)
+        scores = {}
+        for term in set(tokenize(query)):
+            hits = postings.get(term)
+            if not hits:
+                continue
+            idf = math.log(1 + (n - len(hits) + 0.5) / (len(hits) + 0.5))
+            for i, tf in hits:
+                if passages[i][0] in exclude:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * passages[i][2] / avgdl)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        results = {}
+        for i, score in sorted(scores.items(), key=lambda item: -item[1]):
+            number = passages[i][0]
+            if number not in results:
+                results[number] = (score, number, passages[i][1])
+                if len(results) == k:
+                    break
+        return list(results.values())
+
+    def passages_for(self, slide_number: int) -> list[str]:
+        slide = self.slides.get(str(slide_number))
+        return [entry["text"] for entry in slide["passages"]] if slide else []
+
+    def dumps(self) -> bytes:
+        # Canonical key order: an index updated incrementally hashes the same
+        # as one built from scratch over the same slides
+        return json.dumps({"version": 1, "slides": self.slides, "df": self.df}, sort_keys=True).encode("utf-8")
+
+    @classmethod
+    def loads(cls, data: bytes) -> "DeckIndex":
+        raw = json.loads(data)
+        return cls(raw["slides"], raw["df"])
+
+def _remember(index_hash, index):
+    with _cache_lock:
+        _cache[index_hash] = index
+        _cache.move_to_end(index_hash)
+        while len(_cache) > INDEX_CACHE_ITEMS:
+            _cache.popitem(last=False)
+
+def save_index(index: DeckIndex) -> str:
+    index_hash = get_store().put(index.dumps())
+    _remember(index_hash, index)
+    return index_hash
+
+def load_index(index_hash: str) -> DeckIndex | None:
+    with _cache_lock:
+        index = _cache.get(index_hash)
+        if index is not None:
+            _cache.move_to_end(index_hash)
+            return index
+    data = get_store().get(index_hash)
+    if data is None:
+        return None
+    index = DeckIndex.loads(data)
+    _remember(index_hash, index)
+    return index
+
+def index_slides(slides: list, previous_hash: str | None = None) -> str:
+    """Build (or incrementally update) a deck index and store it; returns its hash."""
+    previous = load_index(previous_hash) if previous_hash else None
+    return save_index(DeckIndex.build(slides, previous))
+
+def deck_index(manifest: dict) -> DeckIndex:
+    # Documents ingested before indexing existed get indexed on first use
+    index = load_index(manifest["index_hash"]) if manifest.get("index_hash") else None
+    if index is None:
+        # A new manifest rather than an edit: `manifest` is the store's cached
+        # copy, which other requests may be reading
+        index_hash = index_slides(manifest["slides"])
+        get_store().put_manifest(manifest["doc_id"], {**manifest, "index_hash": index_hash})
+        index = load_index(index_hash)
+    return index
+
+def related_context(manifest: dict, slide_number: int, question: str,
+                    k: int = RETRIEVAL_TOP_K, max_chars: int = RETRIEVAL_MAX_CHARS) -> str:
+    """Snippets from other slides relevant to `question`, capped at max_chars.
+    Slides the question names explicitly ("slide 4") come first."""
+    started = time.perf_counter()
+    index = deck_index(manifest)
+
+    snippets = []
+    named = [int(n) for n in _SLIDE_REF_RE.findall(question) if int(n) != slide_number]
+    for number in dict.fromkeys(named):
+        text = " ".join(index.passages_for(number))
+        if text:
+            snippets.append((number, text))
+    for _, number, best in index.search(question, k, exclude={slide_number, *named}):
+        # Lead with the matching block, then the rest of the slide for context
+        rest = [text for text in index.passages_for(number) if text != best]
+        snippets.append((number, " ".join([best, *rest])))
+
+    lines = []
+    used = 0
+    for number, text in snippets:
+        line = f"[Slide {number}] {_clip(text, SNIPPET_MAX_CHARS)}"
+        if used + len(line) > max_chars:
+            break
+        lines.append(line)
+        used += len(line) + 1
+
+    record_span("retrieval", time.perf_counter() - started, slide=slide_number, snippets=len(lines))
+    return "\n".join(lines)
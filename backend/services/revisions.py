@@ -0,0 +1,71 @@
+from difflib import SequenceMatcher
+
+from services.store import get_store
+
+# Incremental re-ingest. A revised deck is uploaded with the doc_id of the
+# version it replaces (previous_doc_id); pages whose fingerprint (see
+# services.pdf.page_fingerprint) appears in that version keep its extraction
+# and image instead of being rendered again. Expansions need nothing extra:
+# their cache key is the prompt plus the image digest, so a page whose own
+# text, slide number and neighbours are unchanged hits the cache as before.
+
+def previous_manifest(previous_doc_id: str | None, doc_id: str) -> dict | None:
+    if not previous_doc_id or previous_doc_id == doc_id:
+        return None
+    return get_store().get_manifest(previous_doc_id)
+
+def reusable_pages(manifest: dict | None) -> dict:
+    """fingerprint -> slide for every page of `manifest` that has one
+    (decks ingested before fingerprints existed have none)."""
+    if not manifest:
+        return {}
+    return {slide["fingerprint"]: slide for slide in manifest["slides"] if slide.get("fingerprint")}
+
+def diff_summary(previous: dict, slides: list) -> dict:
+    """
+    What changed between the `previous` manifest and the new `slides`, by
+    aligning their page fingerprints: slide numbers changed or added in the
+    new deck, slide numbers removed from the old one, and which slides will
+    miss the expansion cache - changed ones plus those whose slide number or
+    neighbouring text (prev_context / next_context) moved or changed.
+    """
+    old = previous["slides"]
+    matcher = SequenceMatcher(
+        a=[slide.get("fingerprint") for slide in old],
+        b=[slide.get("fingerprint") for slide in slides],
+        autojunk=False
+    )
+    changed, added, removed = [], [], []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "replace":
+            # Pair pages up in order; any surplus on one side was added/removed
+            pairs = min(i2 - i1, j2 - j1)
+            changed += [slides[j]["slide_number"] for j in range(j1, j1 + pairs)]
+            added += [slides[j]["slide_number"] for j in range(j1 + pairs, j2)]
+            removed += [old[i]["slide_number"] for i in range(i1 + pairs, i2)]
+        elif tag == "insert":
+            added += [slides[j]["slide_number"] for j in range(j1, j2)]
+        elif tag == "delete":
+            removed += [old[i]["slide_number"] for i in range(i1, i2)]
+
+    def content(deck, i):
+        return deck[i]["content"] if 0 <= i < len(deck) else None
+
+    reexpand = []
+    position = {}
+    for i, slide in enumerate(old):
+        position.setdefault(slide.get("fingerprint"), i)
+    for i, slide in enumerate(slides):
+        j = position.get(slide.get("fingerprint")) if slide.get("fingerprint") else None
+        if (j is None or i != j or content(slides, i - 1) != content(old, j - 1)
+                or content(slides, i + 1) != content(old, j + 1)):
+            reexpand.append(slide["slide_number"])
+
+    return {
+        "previous_doc_id": previous["doc_id"],
+        "unchanged": len(slides) - len(changed) - len(added),
+        "changed": changed,
+        "added": added,
+        "removed": removed,
+        "reexpand": reexpand
+    }
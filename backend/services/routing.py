@@ -0,0 +1,231 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+
+from services.metrics import (
+    LLM_ERRORS, LLM_FALLBACK_HOPS, LLM_HEDGES, LLM_STREAM_SECONDS, LLM_TTFT_SECONDS, model_label,
+    log_event, record_span
+)
+from services.scheduler import RateLimited
+
+# Health-aware ordering of LLM backends. Every (provider, model, key) tracks
+# a rolling error rate and an EWMA of time-to-first-token. Backends that keep
+# failing get their circuit opened and are skipped until a cool-down passes;
+# the rest are tried fastest-first. Once a backend has produced a token we
+# are committed to it: a later failure is raised, never retried elsewhere,
+# since the client already has part of the answer.
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "30"))
+CIRCUIT_MAX_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_MAX_COOLDOWN_SECONDS", "900"))
+# Start a second backend if the first hasn't produced a token by then (0 = off)
+HEDGE_AFTER_MS = int(os.getenv("HEDGE_AFTER_MS", "0"))
+
+HEALTH_WINDOW = 20
+TTFT_ALPHA = 0.3
+# Each unit of error rate costs this much in the latency-based ordering
+ERROR_PENALTY_SECONDS = 10.0
+
+@dataclass
+class Candidate:
+    provider: str
+    model: str | None
+    api_key: str
+    open_stream: object  # () -> async generator of text chunks
+
+    @property
+    def health_key(self):
+        key_hash = hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()[:16]
+        return self.provider, self.model or "", key_hash
+
+@dataclass
+class BackendHealth:
+    ttft_ewma: float | None = None
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=HEALTH_WINDOW))
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    cooldown: float = CIRCUIT_COOLDOWN_SECONDS
+    trial_in_flight: bool = False
+
+    @property
+    def error_rate(self):
+        return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def state(self, now):
+        if self.open_until == 0.0:
+            return "closed"
+        return "open" if now < self.open_until else "half-open"
+
+    def available(self, now):
+        state = self.state(now)
+        # Half-open lets a single trial request through
+        return state == "closed" or (state == "half-open" and not self.trial_in_flight)
+
+    def score(self, prior=0.0):
+        ttft = self.ttft_ewma if self.ttft_ewma is not None else prior
+        return ttft + ERROR_PENALTY_SECONDS * self.error_rate
+
+    def record_first_token(self, ttft):
+        self.ttft_ewma = ttft if self.ttft_ewma is None else (
+            TTFT_ALPHA * ttft + (1 - TTFT_ALPHA) * self.ttft_ewma
+        )
+
+    def record_success(self):
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = CIRCUIT_COOLDOWN_SECONDS
+        self.trial_in_flight = False
+
+    def record_failure(self, now):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        was_trial = self.trial_in_flight
+        self.trial_in_flight = False
+        tripped = self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD or (
+            len(self.outcomes) >= HEALTH_WINDOW // 2 and self.error_rate >= 0.5
+        )
+        if was_trial:
+            # Failed probe: back off harder before the next one
+            self.cooldown = min(self.cooldown * 2, CIRCUIT_MAX_COOLDOWN_SECONDS)
+        if tripped or was_trial:
+            self.open_until = now + self.cooldown
+
+class ProviderRouter:
+    def __init__(self, hedge_after_ms=HEDGE_AFTER_MS):
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms > 0 else None
+        self.health = {}
+
+    def _health(self, candidate):
+        return self.health.setdefault(candidate.health_key, BackendHealth())
+
+    def order(self, candidates):
+        now = time.monotonic()
+        available = [c for c in candidates if self._health(c).available(now)]
+        if not available:
+            # Everything is tripped: try the backend whose circuit reopens first
+            return sorted(candidates, key=lambda c: self._health(c).open_until)[:1]
+        # Backends without samples are scored at the median measured TTFT, so
+        # they neither jump ahead of a healthy measured backend nor get starved
+        # behind a slow one. Stable sort: the configured order breaks ties.
+        measured = sorted(
+            self._health(c).ttft_ewma for c in available if self._health(c).ttft_ewma is not None
+        )
+        prior = measured[len(measured) // 2] if measured else 0.0
+        return sorted(available, key=lambda c: self._health(c).score(prior))
+
+    def snapshot(self):
+        now = time.monotonic()
+        return [
+            {
+                "provider": provider,
+                "model": model,
+                "state": h.state(now),
+                "ttft_ewma": h.ttft_ewma,
+                "error_rate": h.error_rate
+            }
+            for (provider, model, _), h in self.health.items()
+        ]
+
+    async def stream(self, candidates):
+        queue = self.order(candidates)
+        racing = {}  # first-chunk task -> (candidate, generator, started)
+        last_error = None
+        hops = 0
+
+        def launch(candidate):
+            health = self._health(candidate)
+            if health.state(time.monotonic()) == "half-open":
+                health.trial_in_flight = True
+            gen = candidate.open_stream()
+            task = asyncio.ensure_future(gen.__anext__())
+            racing[task] = (candidate, gen, time.perf_counter())
+
+        winner = None
+        try:
+            while winner is None:
+                if not racing:
+                    if not queue:
+                        raise last_error or ValueError("No working API key found or all LLM calls failed.")
+                    launch(queue.pop(0))
+
+                hedge = self.hedge_after if (self.hedge_after and len(racing) == 1 and queue) else None
+                done, _ = await asyncio.wait(racing, timeout=hedge, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    candidate = next(iter(racing.values()))[0]
+                    LLM_HEDGES.inc(provider=candidate.provider, model=model_label(candidate.provider, candidate.model))
+                    log_event("hedge", provider=candidate.provider, model=candidate.model, after_ms=hedge * 1000)
+                    launch(queue.pop(0))
+                    continue
+
+                for task in done:
+                    candidate, gen, started = racing.pop(task)
+                    error = task.exception()
+                    if error is None and winner is None:
+                        winner = (candidate, gen, task.result(), started)
+                        continue
+                    if isinstance(error, StopAsyncIteration):
+                        error = ValueError(f"{candidate.provider} returned an empty response")
+                    if error is not None:
+                        LLM_ERRORS.inc(provider=candidate.provider, model=model_label(candidate.provider, candidate.model), stage="before_first_token")
+                        if isinstance(error, RateLimited):
+                            # Out of rate-limit budget, not unhealthy: no strike
+                            # against the circuit (and no half-open probe spent)
+                            self._health(candidate).trial_in_flight = False
+                        else:
+                            self._health(candidate).record_failure(time.monotonic())
+                        last_error = error
+                        if queue or racing:
+                            hops += 1
+                            LLM_FALLBACK_HOPS.inc(provider=candidate.provider, model=model_label(candidate.provider, candidate.model))
+                        log_event(
+                            "backend_failed", logging.WARNING,
+                            provider=candidate.provider, model=candidate.model,
+                            stage="before_first_token", fallback=bool(queue or racing), error=str(error)
+                        )
+                    await gen.aclose()
+        finally:
+            # Losing hedges (or everything, if the client went away) are dropped
+            for task, (_, gen, _) in racing.items():
+                task.cancel()
+                try:
+                    await task
+                except BaseException:
+                    pass
+                await gen.aclose()
+            racing.clear()
+
+        candidate, gen, first, started = winner
+        labels = {"provider": candidate.provider, "model": model_label(candidate.provider, candidate.model)}
+        health = self._health(candidate)
+        ttft = time.perf_counter() - started
+        health.record_first_token(ttft)
+        LLM_TTFT_SECONDS.observe(ttft, **labels)
+        record_span("ttft", ttft, hops=hops, **labels)
+        outcome = "cancelled"
+        try:
+            yield first
+            async for chunk in gen:
+                yield chunk
+            outcome = "completed"
+        except Exception as e:
+            outcome = "failed"
+            health.record_failure(time.monotonic())
+            LLM_ERRORS.inc(stage="mid_stream", **labels)
+            log_event("backend_failed", logging.WARNING, stage="mid_stream", error=str(e), **labels)
+            raise
+        finally:
+            if outcome == "completed":
+                health.record_success()
+            else:
+                # Client went away mid-stream; that says nothing about the backend
+                health.trial_in_flight = False
+            total = time.perf_counter() - started
+            LLM_STREAM_SECONDS.observe(total, outcome=outcome, **labels)
+            record_span("stream_total", total, outcome=outcome, **labels)
+            await gen.aclose()
+
+router = ProviderRouter()
@@ -0,0 +1,311 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import hashlib
+import itertools
+import contextvars
+
+from services.metrics import Counter, Gauge, Histogram, log_event
+from services.tokens import estimate_tokens
+
+# Rate-limit-aware admission for upstream LLM calls. Every (provider, model,
+# key) gets a lane with a request bucket and a token bucket, calibrated from
+# the x-ratelimit-* headers the provider returns (OpenAI and Groq send them;
+# Gemini doesn't, so its lanes only learn from 429s). Calls wait in the lane
+# by priority class, so interactive /chat and foreground /expand go ahead of
+# batch and prefetch work. A call that would wait longer than its class's
+# budget fails fast with RateLimited instead, so the router can fall over to
+# another provider; a 429 whose retry-after fits in the budget is waited out
+# and retried on the same backend.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") != "0"
+PRIORITIES = ("interactive", "foreground", "batch", "prefetch")  # highest first
+MAX_WAIT_SECONDS = {
+    name: float(os.getenv(f"SCHEDULER_MAX_WAIT_{name.upper()}", default))
+    for name, default in (("interactive", "2"), ("foreground", "3"), ("batch", "30"), ("prefetch", "10"))
+}
+# Output tokens assumed per call when charging the token bucket
+SCHEDULER_OUTPUT_TOKENS = int(os.getenv("SCHEDULER_OUTPUT_TOKENS", "512"))
+# Pause after a 429 that came without retry-after (e.g. Gemini)
+SCHEDULER_DEFAULT_BACKOFF = float(os.getenv("SCHEDULER_DEFAULT_BACKOFF", "2"))
+
+QUEUE_DEPTH = Gauge("unslide_scheduler_queue_depth", "Upstream calls waiting for rate-limit budget", ("provider", "priority"))
+QUEUE_WAIT_SECONDS = Histogram("unslide_scheduler_wait_seconds", "Time upstream calls waited for rate-limit budget", ("provider", "priority"))
+SCHEDULER_REJECTED = Counter("unslide_scheduler_rejected_total", "Calls sent elsewhere because the wait would be too long", ("provider", "priority"))
+RATE_LIMITED = Counter("unslide_llm_rate_limited_total", "429 responses from providers", ("provider", "retried"))
+
+# A priority class name, or an Urgency for calls several requests wait on
+priority = contextvars.ContextVar("llm_priority", default="foreground")
+
+_DURATION_RE = re.compile(r"([\d.]+)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def rank(name) -> int:
+    return PRIORITIES.index(name) if name in PRIORITIES else 1
+
+class Urgency:
+    """
+    A priority class that can be raised while its call is queued. A shared
+    upstream call (services.singleflight) takes on the priority of its most
+    urgent subscriber, so a foreground /expand that joins a prefetch isn't
+    left waiting in the prefetch lane.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # The longest wait budget of any class the call has had: raising it
+        # moves it up its lane but never cuts short a wait already under way
+        self.wait_budget = max_wait(name)
+        self.lanes = set()  # lanes a call with this urgency is queued in
+
+    def raise_to(self, name):
+        if rank(name) < rank(self.name):
+            self.name = name
+            self.wait_budget = max(self.wait_budget, max_wait(name))
+            for lane in list(self.lanes):
+                lane.notify()
+
+def current_priority() -> str:
+    value = priority.get()
+    return value.name if isinstance(value, Urgency) else value
+
+def max_wait(name) -> float:
+    return MAX_WAIT_SECONDS.get(name, MAX_WAIT_SECONDS["foreground"])
+
+def wait_budget() -> float:
+    """Seconds the current call may wait for rate-limit budget in total."""
+    value = priority.get()
+    return value.wait_budget if isinstance(value, Urgency) else max_wait(value)
+
+class RateLimited(Exception):
+    def __init__(self, provider, wait):
+        super().__init__(f"{provider} is rate limited for another {wait:.1f}s")
+        self.provider = provider
+        self.wait = wait
+
+def parse_duration(value) -> float | None:
+    """'1s', '6m0s', '20ms', '1h2m3.5s' or plain seconds -> seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    return sum(float(n) * _UNITS[unit] for n, unit in parts) if parts else None
+
+class TokenBucket:
+    """Unlimited until calibrated from response headers."""
+
+    def __init__(self):
+        self.capacity = None
+        self.level = 0.0
+        self.rate = 0.0  # refill per second
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now) -> float:
+        if self.capacity is None:
+            return 0.0
+        self._refill(now)
+        # Never ask for more than a full bucket, or it would wait forever
+        missing = min(amount, self.capacity) - self.level
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount, now):
+        if self.capacity is not None:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+    def calibrate(self, limit, remaining, reset, now):
+        # `reset` is the time until the budget is full again, so whatever is
+        # used up refills over that long
+        if limit is None or remaining is None or limit <= 0:
+            return
+        self.capacity = float(limit)
+        self.level = float(remaining)
+        self.updated = now
+        used = limit - remaining
+        self.rate = used / reset if reset and used > 0 else limit / 60.0
+
+class Lane:
+    def __init__(self, provider):
+        self.provider = provider
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.blocked_until = 0.0
+        self.waiters = []  # heap of [rank, seq]
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def wait_time(self, cost, now) -> float:
+        return max(
+            self.blocked_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(cost, now)
+        )
+
+    def calibrate(self, headers, now):
+        def number(name):
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            bucket.calibrate(
+                number(f"x-ratelimit-limit-{kind}"),
+                number(f"x-ratelimit-remaining-{kind}"),
+                parse_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+                now
+            )
+
+class Scheduler:
+    def __init__(self):
+        self.lanes = {}
+        self._seq = itertools.count()
+
+    def lane(self, provider, model, api_key) -> Lane:
+        key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+        key = (provider, model or "", key_hash)
+        if key not in self.lanes:
+            self.lanes[key] = Lane(provider)
+        return self.lanes[key]
+
+    async def acquire(self, lane: Lane, cost: int, since: float):
+        """Wait for budget in `lane`, behind higher-priority calls. Raises
+        RateLimited if that can't happen within the call's wait budget
+        (wait_budget()), counted from `since` (monotonic)."""
+        value = priority.get()
+        urgency = value if isinstance(value, Urgency) else None
+        name = current_priority()
+        entry = [rank(name), next(self._seq)]
+        now = time.monotonic()
+        ahead = sum(1 for waiter in lane.waiters if waiter < entry)
+        estimate = lane.wait_time(cost * (ahead + 1), now)
+        if now + estimate > since + wait_budget():
+            SCHEDULER_REJECTED.inc(provider=lane.provider, priority=name)
+            raise RateLimited(lane.provider, estimate)
+
+        started = now
+        heapq.heappush(lane.waiters, entry)
+        QUEUE_DEPTH.inc(provider=lane.provider, priority=name)
+        if urgency is not None:
+            urgency.lanes.add(lane)
+        try:
+            while True:
+                if urgency is not None and urgency.name != name:
+                    # A more urgent caller now waits on this call: move it up
+                    QUEUE_DEPTH.dec(provider=lane.provider, priority=name)
+                    name = urgency.name
+                    QUEUE_DEPTH.inc(provider=lane.provider, priority=name)
+                    entry[0] = rank(name)
+                    heapq.heapify(lane.waiters)
+                deadline = since + wait_budget()
+                now = time.monotonic()
+                changed = lane._changed
+                if lane.waiters[0] == entry:
+                    delay = lane.wait_time(cost, now)
+                    if delay <= 0:
+                        lane.requests.take(1, now)
+                        lane.tokens.take(cost, now)
+                        break
+                    expired = now + delay > deadline
+                else:
+                    # Someone more urgent (or earlier) goes first
+                    delay = deadline - now
+                    expired = delay <= 0
+                if expired:
+                    SCHEDULER_REJECTED.inc(provider=lane.provider, priority=name)
+                    raise RateLimited(lane.provider, delay)
+                try:
+                    await asyncio.wait_for(changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if urgency is not None:
+                urgency.lanes.discard(lane)
+            lane.waiters.remove(entry)
+            heapq.heapify(lane.waiters)
+            QUEUE_DEPTH.dec(provider=lane.provider, priority=name)
+            lane.notify()
+        waited = time.monotonic() - started
+        QUEUE_WAIT_SECONDS.observe(waited, provider=lane.provider, priority=name)
+        return waited
+
+    async def call(self, provider, model, api_key, cost, open_call):
+        """
+        Run `open_call()` (which starts the upstream request and returns its
+        response object) once the lane has budget. Responses with .headers
+        recalibrate the lane; a 429 blocks the lane for its retry-after and is
+        retried here if that still fits in this priority's wait budget.
+        """
+        if not SCHEDULER_ENABLED:
+            return await open_call()
+        lane = self.lane(provider, model, api_key)
+        started = time.monotonic()
+        while True:
+            await self.acquire(lane, cost, started)
+            try:
+                response = await open_call()
+            except Exception as e:
+                retry_after = rate_limit_retry_after(e)
+                if retry_after is None:
+                    raise
+                now = time.monotonic()
+                lane.blocked_until = max(lane.blocked_until, now + retry_after)
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                if headers is not None:
+                    lane.calibrate(headers, now)
+                retry = now + retry_after <= started + wait_budget()
+                RATE_LIMITED.inc(provider=provider, retried=str(retry).lower())
+                log_event("rate_limited", provider=provider, model=model, retry_after=retry_after, retry=retry)
+                if not retry:
+                    raise
+                continue
+            headers = getattr(response, "headers", None)
+            if headers is not None:
+                lane.calibrate(headers, time.monotonic())
+            return response
+
+    def snapshot(self):
+        now = time.monotonic()
+        return [
+            {
+                "provider": provider,
+                "model": model,
+                "waiting": len(lane.waiters),
+                "blocked_for": max(0.0, lane.blocked_until - now),
+                "requests": lane.requests.capacity and round(lane.requests.level, 1),
+                "tokens": lane.tokens.capacity and round(lane.tokens.level, 1)
+            }
+            for (provider, model, _), lane in self.lanes.items()
+        ]
+
+def request_cost(prompt: str) -> int:
+    """Tokens to charge against the lane: the prompt plus an output allowance."""
+    return estimate_tokens(prompt) + SCHEDULER_OUTPUT_TOKENS
+
+def rate_limit_retry_after(error) -> float | None:
+    """Seconds to wait if `error` is a 429 from any provider SDK, else None."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = parse_duration(headers.get("retry-after"))
+    if retry_after is None:
+        retry_after = parse_duration(headers.get("x-ratelimit-reset-requests"))
+    return retry_after if retry_after is not None else SCHEDULER_DEFAULT_BACKOFF
+
+scheduler = Scheduler()
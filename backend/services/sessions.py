@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, asdict
+
+from services.store import get_store
+
+# Server-side deck sessions. Ingestion issues a deck_id; /expand and /chat can
+# then send just (deck_id, slide_number[, question]) and the server assembles
+# prompts from the stored manifest and chat history. Sessions idle for longer
+# than SESSION_TTL_SECONDS are dropped.
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")  # memory | disk
+SESSION_STORE_DIR = os.getenv(
+    "SESSION_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".unslide", "sessions")
+)
+
+_store = None
+
+@dataclass
+class DeckSession:
+    deck_id: str
+    doc_id: str
+    course_topic: str = "General"
+    # Deck-wide tutoring conversation: {"role", "content", "slide_number"}
+    history: list = field(default_factory=list)
+    # Rolling summary of the part of `history` that no longer fits the prompt
+    # (see services.history.compact_history)
+    history_summary: dict = field(default_factory=dict)
+    last_access: float = field(default_factory=time.time)
+
+class SessionStore(ABC):
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        self.ttl = ttl
+
+    def create(self, doc_id: str, course_topic: str = "General") -> DeckSession:
+        self.sweep()
+        session = DeckSession(deck_id=uuid.uuid4().hex, doc_id=doc_id, course_topic=course_topic)
+        self.save(session)
+        return session
+
+    @abstractmethod
+    def get(self, deck_id: str) -> DeckSession | None:
+        """The session, refreshing its last access, or None if it is unknown
+        or expired."""
+
+    @abstractmethod
+    def save(self, session: DeckSession):
+        """Store (or replace) `session`."""
+
+    @abstractmethod
+    def delete(self, deck_id: str):
+        """Drop the session, if there is one."""
+
+    @abstractmethod
+    def sweep(self):
+        """Drop sessions idle for longer than the TTL."""
+
+    def _expired(self, last_access, now=None):
+        return (now or time.time()) - last_access > self.ttl
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        super().__init__(ttl)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, deck_id):
+        with self._lock:
+            session = self._sessions.get(deck_id)
+            if session is None:
+                return None
+            if self._expired(session.last_access):
+                del self._sessions[deck_id]
+                return None
+            session.last_access = time.time()
+            return session
+
+    def save(self, session):
+        session.last_access = time.time()
+        with self._lock:
+            self._sessions[session.deck_id] = session
+
+    def delete(self, deck_id):
+        with self._lock:
+            self._sessions.pop(deck_id, None)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            for deck_id in [d for d, s in self._sessions.items() if self._expired(s.last_access, now)]:
+                del self._sessions[deck_id]
+
+class DiskSessionStore(SessionStore):
+    """One JSON file per session, so sessions survive restarts and can be
+    shared by workers on the same volume. mtime doubles as last access."""
+
+    def __init__(self, directory=SESSION_STORE_DIR, ttl=SESSION_TTL_SECONDS):
+        super().__init__(ttl)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, deck_id):
+        return os.path.join(self.directory, f"{deck_id}.json")
+
+    def get(self, deck_id):
+        if not deck_id.isalnum():
+            return None
+        path = self._path(deck_id)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                self.delete(deck_id)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                session = DeckSession(**json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)
+        session.last_access = time.time()
+        return session
+
+    def save(self, session):
+        session.last_access = time.time()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(asdict(session), f)
+        os.replace(tmp, self._path(session.deck_id))
+
+    def delete(self, deck_id):
+        try:
+            os.remove(self._path(deck_id))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json") and self._expired(entry.stat().st_mtime, now):
+                self.delete(entry.name[:-5])
+
+def load_deck(deck_id: str, slide_number: int):
+    """(session, manifest, index of slide_number) for a live deck session.
+    Raises KeyError with a client-facing message if anything is missing."""
+    session = get_session_store().get(deck_id)
+    if session is None:
+        raise KeyError("Unknown or expired deck session")
+    manifest = get_store().get_manifest(session.doc_id)
+    if manifest is None:
+        raise KeyError("Unknown document")
+    for index, slide in enumerate(manifest["slides"]):
+        if slide["slide_number"] == slide_number:
+            return session, manifest, index
+    raise KeyError(f"Slide {slide_number} not found")
+
+def get_session_store() -> SessionStore:
+    global _store
+    if _store is None:
+        _store = DiskSessionStore() if SESSION_STORE == "disk" else MemorySessionStore()
+    return _store
+
+def set_session_store(store: SessionStore):
+    # Hook for swapping in another backend (Redis, a database, ...)
+    global _store
+    _store = store
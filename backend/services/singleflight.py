@@ -0,0 +1,116 @@
+import asyncio
+import logging
+
+from services.metrics import Counter, log_event
+from services.scheduler import priority, current_priority, Urgency
+
+# Single-flight for upstream streams. When a shared deck is opened by a whole
+# class, many identical /expand requests arrive within seconds; only the first
+# goes upstream. Later ones attach to it, get the text produced so far at once
+# and then follow the live tail. The upstream call is cancelled only when
+# every subscriber has gone.
+
+SINGLEFLIGHT = Counter("unslide_singleflight_total", "Streams started (leader) or attached to (joined)", ("result",))
+
+class Flight:
+    def __init__(self, group, key, factory):
+        self.group = group
+        self.key = key
+        self.factory = factory
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.urgency = Urgency(current_priority())
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _drive(self):
+        # Runs in the task's own copy of the context
+        priority.set(self.urgency)
+        try:
+            async for chunk in self.factory():
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self.group._forget(self)
+            self._notify()
+
+    def _release(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and self.task and not self.task.done():
+            # Last listener went away: nobody needs the rest of the answer.
+            # Unlist it first, so nobody joins it while it is dying
+            self.group._forget(self)
+            self.task.cancel()
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+
+    def _forget(self, flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def joinable(self, key) -> bool:
+        flight = self._flights.get(key)
+        return flight is not None and not flight.done
+
+    async def stream(self, key, factory, _retried=False):
+        """
+        Stream the result of `factory()` (an async iterator of text chunks),
+        sharing one upstream call between concurrent callers with the same key.
+        A joiner whose shared call fails before producing anything retries
+        with its own factory, so it isn't failed by someone else's credentials;
+        so does anyone whose flight was cancelled under it before it got any
+        output.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None or flight.done
+        if leader:
+            flight = self._flights[key] = Flight(self, key, factory)
+        SINGLEFLIGHT.inc(result="leader" if leader else "joined")
+        if not leader:
+            log_event("singleflight_join", level=logging.DEBUG, subscribers=flight.subscribers + 1)
+            flight.urgency.raise_to(current_priority())
+
+        flight.subscribers += 1
+        if flight.task is None:
+            flight.task = asyncio.get_running_loop().create_task(flight._drive())
+        sent = 0
+        try:
+            while True:
+                changed = flight._changed
+                while sent < len(flight.chunks):
+                    sent += 1
+                    yield flight.chunks[sent - 1]
+                if flight.done:
+                    break
+                await changed.wait()
+        finally:
+            flight._release()
+
+        if flight.error is not None:
+            # A caller that is itself cancelled never gets here, so a
+            # CancelledError means the flight was stopped by someone else
+            cancelled = isinstance(flight.error, asyncio.CancelledError)
+            if sent == 0 and (cancelled or not leader) and not _retried:
+                async for chunk in self.stream(key, factory, _retried=True):
+                    yield chunk
+                return
+            if isinstance(flight.error, asyncio.CancelledError):
+                # Only happens if every other subscriber left mid-stream
+                raise RuntimeError("Shared upstream stream was cancelled")
+            raise flight.error
+
+expansion_flights = SingleFlight()
@@ -0,0 +1,180 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# Content-addressed storage for uploaded PDFs, rendered page images and the
+# per-document manifests that describe them. Blobs are keyed by the SHA-256
+# of their bytes, so identical uploads and identical pages dedupe for free.
+ASSET_STORE_DIR = os.getenv(
+    "ASSET_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".unslide", "assets")
+)
+ASSET_URL_PREFIX = "/api/v1/assets"
+# Parsed manifests kept in memory; deck sessions read one on every request
+MANIFEST_CACHE_ITEMS = 64
+
+_store = None
+
+def digest_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def is_digest(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+def asset_url(digest: str) -> str:
+    return f"{ASSET_URL_PREFIX}/{digest}"
+
+def parse_asset_ref(ref: str) -> str | None:
+    # Accept either a bare digest or an /assets/{digest} URL
+    digest = ref.rstrip("/").rsplit("/", 1)[-1]
+    return digest if is_digest(digest) else None
+
+def guess_media_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith(b"%PDF"):
+        return "application/pdf"
+    return "application/octet-stream"
+
+class AssetStore(ABC):
+    """Interface for blob + manifest storage. Implementations must be
+    picklable: ingest workers receive the store and write page images
+    directly instead of shipping them back to the API process."""
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Store `data` and return its digest."""
+
+    @abstractmethod
+    def put_file(self, f, digest: str) -> str:
+        """Store the contents of the open binary file `f`, whose SHA-256 the
+        caller already computed, without reading it into memory."""
+
+    @abstractmethod
+    def local_path(self, digest: str) -> str | None:
+        """A local file with the blob's bytes, for worker processes that open
+        documents by path; None if it isn't stored."""
+
+    @abstractmethod
+    def get(self, digest: str) -> bytes | None:
+        """The blob's bytes, or None if it isn't stored."""
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        """Whether a blob with this digest is stored."""
+
+    @abstractmethod
+    def put_manifest(self, doc_id: str, manifest: dict):
+        """Store (or replace) the manifest of document `doc_id`."""
+
+    @abstractmethod
+    def get_manifest(self, doc_id: str) -> dict | None:
+        """The manifest of document `doc_id`, or None if there is none."""
+
+class LocalAssetStore(AssetStore):
+    def __init__(self, root: str):
+        self.root = root
+        self._manifests = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root, "documents"), exist_ok=True)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _manifest_path(self, doc_id):
+        return os.path.join(self.root, "documents", f"{doc_id}.json")
+
+    def _write_atomic(self, path, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put(self, data: bytes) -> str:
+        digest = digest_bytes(data)
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+        return digest
+
+    def put_file(self, f, digest: str) -> str:
+        target = self._blob_path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+            f.seek(0)
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+            os.replace(tmp, target)
+        return digest
+
+    def local_path(self, digest: str) -> str | None:
+        return self._blob_path(digest) if self.exists(digest) else None
+
+    def get(self, digest: str) -> bytes | None:
+        if not is_digest(digest):
+            return None
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, digest: str) -> bool:
+        return is_digest(digest) and os.path.exists(self._blob_path(digest))
+
+    def put_manifest(self, doc_id: str, manifest: dict):
+        self._write_atomic(self._manifest_path(doc_id), json.dumps(manifest).encode("utf-8"))
+        self._remember_manifest(doc_id, manifest)
+
+    def get_manifest(self, doc_id: str) -> dict | None:
+        if not is_digest(doc_id):
+            return None
+        with self._lock:
+            manifest = self._manifests.get(doc_id)
+            if manifest is not None:
+                self._manifests.move_to_end(doc_id)
+                return manifest
+        try:
+            with open(self._manifest_path(doc_id), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        self._remember_manifest(doc_id, manifest)
+        return manifest
+
+    def _remember_manifest(self, doc_id, manifest):
+        with self._lock:
+            self._manifests[doc_id] = manifest
+            self._manifests.move_to_end(doc_id)
+            while len(self._manifests) > MANIFEST_CACHE_ITEMS:
+                self._manifests.popitem(last=False)
+
+    def __getstate__(self):
+        # Sent to ingest workers: they only need the root directory
+        return {"root": self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"])
+
+def get_store() -> AssetStore:
+    global _store
+    if _store is None:
+        _store = LocalAssetStore(ASSET_STORE_DIR)
+    return _store
+
+def set_store(store: AssetStore):
+    # Hook for swapping in another backend (object storage, a shared volume, ...)
+    global _store
+    _store = store
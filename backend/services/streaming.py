@@ -0,0 +1,125 @@
+import os
+import re
+import time
+import asyncio
+from dataclasses import dataclass, field
+
+from services.metrics import STREAM_BYTES, STREAM_WRITES, log_event
+
+# Shared writer stage for LLM token streams. Providers hand us many tiny
+# chunks; every chunk we yield becomes an ASGI send and a write through the
+# Next.js proxy, so we batch them and flush on size, time or a natural
+# boundary (end of sentence/line or a closing </mark> annotation).
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "512"))
+STREAM_FLUSH_MS = int(os.getenv("STREAM_FLUSH_MS", "60"))
+STREAM_FLUSH_ON_BOUNDARY = os.getenv("STREAM_FLUSH_ON_BOUNDARY", "1") == "1"
+
+BOUNDARY_RE = re.compile(r"[.!?:]\s|\n|</mark>")
+
+_END = object()
+
+@dataclass
+class FlushPolicy:
+    max_bytes: int = STREAM_FLUSH_BYTES
+    window_seconds: float = STREAM_FLUSH_MS / 1000
+    on_boundary: bool = STREAM_FLUSH_ON_BOUNDARY
+
+@dataclass
+class StreamStats:
+    route: str = "other"
+    label: str = ""
+    chunks_in: int = 0
+    writes: int = 0
+    bytes_out: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    first_write: float | None = None
+
+    def report(self):
+        STREAM_BYTES.inc(self.bytes_out, route=self.route)
+        STREAM_WRITES.inc(self.writes, route=self.route)
+        log_event(
+            "stream",
+            route=self.route,
+            label=self.label,
+            chunks_in=self.chunks_in,
+            writes=self.writes,
+            bytes=self.bytes_out,
+            first_write_ms=(self.first_write - self.started) * 1000 if self.first_write else None,
+            total_ms=(time.perf_counter() - self.started) * 1000
+        )
+
+async def _pump(stream, queue):
+    try:
+        async for chunk in stream:
+            await queue.put(chunk)
+        await queue.put(_END)
+    except Exception as e:
+        await queue.put(e)
+
+async def coalesce(stream, policy: FlushPolicy = None, stats: StreamStats = None):
+    policy = policy or FlushPolicy()
+    stats = stats if stats is not None else StreamStats()
+    queue = asyncio.Queue()
+    pump = asyncio.get_running_loop().create_task(_pump(stream, queue))
+
+    buffer = ""
+    # UTF-8 size of `buffer`: the flush threshold is in bytes on the wire,
+    # not characters
+    buffered = 0
+    deadline = None
+
+    def take(upto):
+        nonlocal buffer, buffered, deadline
+        out, buffer = buffer[:upto], buffer[upto:]
+        deadline = time.monotonic() + policy.window_seconds if buffer else None
+        size = len(out.encode("utf-8"))
+        buffered -= size
+        stats.writes += 1
+        stats.bytes_out += size
+        if stats.first_write is None:
+            stats.first_write = time.perf_counter()
+        return out
+
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # Upstream stalled: don't sit on buffered text past the window
+                yield take(len(buffer))
+                continue
+
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            stats.chunks_in += 1
+            buffer += item
+            buffered += len(item.encode("utf-8"))
+            if deadline is None:
+                deadline = time.monotonic() + policy.window_seconds
+
+            if stats.writes == 0 or buffered >= policy.max_bytes:
+                # First token goes out immediately to keep time-to-first-token low
+                yield take(len(buffer))
+            elif policy.on_boundary:
+                last = None
+                for last in BOUNDARY_RE.finditer(buffer):
+                    pass
+                if last is not None:
+                    yield take(last.end())
+            if deadline is not None and time.monotonic() >= deadline:
+                yield take(len(buffer))
+
+        if buffer:
+            yield take(len(buffer))
+    finally:
+        # Client went away or we're done: stop pulling from upstream
+        pump.cancel()
+        try:
+            await pump
+        except asyncio.CancelledError:
+            pass
+        stats.report()
@@ -0,0 +1,115 @@
+import os
+import re
+from dataclasses import dataclass
+
+# Cheap, dependency-free token estimates. Prompts are budgeted, not billed, from
+# these numbers, so being within ~10% of the real BPE count is good enough:
+# short words are one token, long words split roughly every 6 characters and
+# punctuation mostly stands alone.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# Context windows (tokens) by model-name prefix, longest prefix wins. Unknown
+# models get the smallest window we route to.
+CONTEXT_WINDOWS = {
+    "llama3-": 8192,
+    "llama-3.1": 131072,
+    "llama-3.2": 131072,
+    "llama-3.3": 131072,
+    "mixtral-8x7b": 32768,
+    "gemma": 8192,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1000000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "gemini-1.5": 1000000,
+    "gemini-2": 1000000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Chat history may use this share of the window, but never more than
+# CHAT_HISTORY_MAX_TOKENS: even on million-token models every extra history
+# token is paid for again on each turn and adds to time-to-first-token.
+CHAT_HISTORY_SHARE = float(os.getenv("CHAT_HISTORY_SHARE", "0.25"))
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "1500"))
+
+# Expansion prompts: the slide, its elements and neighbour context share what
+# is left of the window after the fixed instructions and room for the answer,
+# up to EXPANSION_PROMPT_MAX_TOKENS (dense slides otherwise dominate TTFT).
+EXPANSION_PROMPT_MAX_TOKENS = int(os.getenv("EXPANSION_PROMPT_MAX_TOKENS", "3000"))
+EXPANSION_OUTPUT_RESERVE = int(os.getenv("EXPANSION_OUTPUT_RESERVE", "2048"))
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return sum(1 + (len(word) - 1) // 6 for word in _TOKEN_RE.findall(text))
+
+def context_window(provider: str | None = None, model: str | None = None) -> int:
+    if not model:
+        # Late import: providers pulls in the SDKs
+        from services.providers import DEFAULT_GROQ_MODEL, DEFAULT_OPENAI_MODEL, GEMINI_FALLBACK_MODELS
+        model = {
+            "groq": DEFAULT_GROQ_MODEL,
+            "openai": DEFAULT_OPENAI_MODEL,
+            "gemini": GEMINI_FALLBACK_MODELS[-1],
+        }.get((provider or "").lower())
+    if not model:
+        return DEFAULT_CONTEXT_WINDOW
+    name = model.lower().removeprefix("models/")
+    matches = [prefix for prefix in CONTEXT_WINDOWS if name.startswith(prefix)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+def history_budget(provider: str | None = None, model: str | None = None) -> int:
+    return min(int(context_window(provider, model) * CHAT_HISTORY_SHARE), CHAT_HISTORY_MAX_TOKENS)
+
+def prompt_budget(provider: str | None = None, model: str | None = None, fixed_tokens: int = 0) -> int:
+    available = context_window(provider, model) - fixed_tokens - EXPANSION_OUTPUT_RESERVE
+    return max(256, min(available, EXPANSION_PROMPT_MAX_TOKENS))
+
+# Prompt sections are packed by priority: every section first gets its floor
+# (so, say, the neighbour slides keep at least their titles), then the
+# remaining budget goes to sections in priority order, each up to its cap.
+@dataclass
+class Section:
+    name: str
+    text: str
+    priority: int = 0  # lower is more important
+    min_tokens: int = 0
+    max_tokens: int | None = None
+
+def allocate_budget(sections: list, budget: int) -> dict:
+    """Token allowance per section name for `budget` tokens in total."""
+    costs = {s.name: estimate_tokens(s.text) for s in sections}
+    caps = {s.name: min(costs[s.name], s.max_tokens if s.max_tokens is not None else costs[s.name]) for s in sections}
+    allowance = {}
+    remaining = budget
+    for s in sorted(sections, key=lambda s: s.priority):
+        allowance[s.name] = min(caps[s.name], s.min_tokens, max(0, remaining))
+        remaining -= allowance[s.name]
+    for s in sorted(sections, key=lambda s: s.priority):
+        extra = min(caps[s.name] - allowance[s.name], max(0, remaining))
+        allowance[s.name] += extra
+        remaining -= extra
+    return allowance
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Head of `text` within max_tokens, cut on line boundaries where possible
+    (code and tables stay readable) and marked so the model knows."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            room = max_tokens - used
+            if room > 8 and not kept:
+                # One very long line (minified code, a run-on paragraph): cut mid-line
+                kept.append(line[:max(1, len(line) * room // cost)].rstrip() + " …")
+            break
+        kept.append(line)
+        used += cost
+    omitted = len(lines) - len(kept)
+    if omitted:
+        kept.append(f"[… {omitted} more lines truncated]")
+    return "\n".join(kept)
@@ -0,0 +1,159 @@
+import os
+import asyncio
+import hashlib
+import threading
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+# Upload limits. UploadLimitMiddleware cuts a multipart body off once it passes
+# UPLOAD_MAX_BYTES, so nothing bigger is ever received. The form parser spools
+# the file to disk (never whole in memory); it is hashed and stored from there
+# and PyMuPDF opens the stored copy by path, so memory per upload stays flat
+# however big the deck is. What still grows with the upload is disk and
+# render time, so both are capped per upload and across all uploads being
+# ingested at once:
+#   UPLOAD_MAX_BYTES / UPLOAD_MAX_PAGES           - one upload, else 413
+#   UPLOADS_INFLIGHT_BYTES / UPLOADS_INFLIGHT_PAGES - all in-flight uploads,
+#                                                     else 503 (retry later)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(300 * 1024 * 1024)))
+UPLOAD_MAX_PAGES = int(os.getenv("UPLOAD_MAX_PAGES", "1000"))
+UPLOADS_INFLIGHT_BYTES = int(os.getenv("UPLOADS_INFLIGHT_BYTES", str(1024 * 1024 * 1024)))
+UPLOADS_INFLIGHT_PAGES = int(os.getenv("UPLOADS_INFLIGHT_PAGES", "3000"))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Room in a multipart body for the boundaries and the form's other fields
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+class UploadRejected(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def _mb(n):
+    return f"{n / (1024 * 1024):.0f} MB"
+
+class UploadBudget:
+    """Bytes and pages reserved by uploads that are still being ingested."""
+
+    def __init__(self, max_bytes, max_pages):
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.bytes = 0
+        self.pages = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes=0, pages=0):
+        with self._lock:
+            # A lone upload is always admitted (the per-upload caps bound it)
+            busy = self.bytes > 0 or self.pages > 0
+            if busy and (self.bytes + nbytes > self.max_bytes or self.pages + pages > self.max_pages):
+                raise UploadRejected(503, "Server is busy ingesting other decks, try again shortly")
+            self.bytes += nbytes
+            self.pages += pages
+
+    def release(self, nbytes=0, pages=0):
+        with self._lock:
+            self.bytes -= nbytes
+            self.pages -= pages
+
+budget = UploadBudget(UPLOADS_INFLIGHT_BYTES, UPLOADS_INFLIGHT_PAGES)
+
+class SpooledUpload:
+    """
+    An upload in the asset store, holding its share of the global budget
+    until closed. `path` is a local copy of the stored PDF for the render
+    workers. Use as a context manager:
+
+        with await spool_upload(file, store) as upload:
+            upload.check_pages(page_count(upload.path))
+            ...
+    """
+
+    def __init__(self, path, doc_id, size):
+        self.path = path
+        self.doc_id = doc_id
+        self.size = size
+        self.pages = 0
+
+    def check_pages(self, pages):
+        if pages > UPLOAD_MAX_PAGES:
+            raise UploadRejected(413, f"Deck has {pages} pages; the limit is {UPLOAD_MAX_PAGES}")
+        budget.reserve(pages=pages)
+        self.pages = pages
+
+    def close(self):
+        budget.release(self.size, self.pages)
+        self.size = self.pages = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _hash_file(f):
+    # Worker thread: SHA-256 and size of an open binary file
+    digest = hashlib.sha256()
+    size = 0
+    f.seek(0)
+    while chunk := f.read(UPLOAD_CHUNK_BYTES):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+async def spool_upload(file, store) -> SpooledUpload:
+    """
+    Hash an UploadFile where the form parser spooled it and add it to the
+    asset store; its hash is the document ID. Raises UploadRejected when the
+    upload is too big or the server is already ingesting too much.
+    """
+    if (file.size or 0) > UPLOAD_MAX_BYTES:
+        raise UploadRejected(413, f"Upload is larger than {_mb(UPLOAD_MAX_BYTES)}")
+    digest, size = await asyncio.to_thread(_hash_file, file.file)
+    if size > UPLOAD_MAX_BYTES:
+        raise UploadRejected(413, f"Upload is larger than {_mb(UPLOAD_MAX_BYTES)}")
+    budget.reserve(nbytes=size)
+    upload = SpooledUpload(None, None, size)
+    try:
+        upload.doc_id = await asyncio.to_thread(store.put_file, file.file, digest)
+        upload.path = store.local_path(upload.doc_id)
+        return upload
+    except BaseException:
+        upload.close()
+        raise
+
+class UploadLimitMiddleware:
+    """Pure ASGI middleware capping multipart request bodies at UPLOAD_MAX_BYTES
+    (plus the form overhead) while they are received: a declared
+    Content-Length over the cap is refused before reading anything, and a
+    body that runs past it is cut off with a 413 as soon as it does."""
+
+    def __init__(self, app, max_bytes=UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        headers = dict(scope.get("headers") or []) if scope["type"] == "http" else {}
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        detail = f"Upload is larger than {_mb(UPLOAD_MAX_BYTES)}"
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside the form parser; FastAPI passes it through
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
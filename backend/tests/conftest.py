@@ -0,0 +1,2 @@
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: starts backend processes; deselect with -m 'not slow'")
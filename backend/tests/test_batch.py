@@ -0,0 +1,63 @@
+import asyncio
+
+from services import batch, buildup
+from services.buildup import annotate_buildup
+
+def buildup_deck(runs, steps):
+    # `runs` build-ups of `steps` pages, each page adding one bullet
+    slides = []
+    previous = None
+    for r in range(runs):
+        for s in range(steps):
+            number = len(slides) + 1
+            elements = [{"id": 0, "text": f"Title {r}", "box_2d": [50, 50, 80, 900]}] + [
+                {"id": b + 1, "text": f"run {r} bullet {b}", "box_2d": [150 + 50 * b, 80, 180 + 50 * b, 900]}
+                for b in range(s + 1)
+            ]
+            slide = {
+                "slide_number": number,
+                "content": "\n\n".join(e["text"] for e in elements),
+                "elements": elements,
+            }
+            previous = annotate_buildup(previous, slide)
+            slides.append(slide)
+    return slides
+
+def test_buildup_steps_respect_batch_concurrency(monkeypatch, tmp_path):
+    slides = buildup_deck(runs=3, steps=4)
+    assert sum(1 for s in slides if s.get("builds_on")) == 9
+
+    running = 0
+    peak = 0
+
+    async def fake_stream(prompt, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.02)
+            yield "explained"
+        finally:
+            running -= 1
+
+    class Store:
+        def get_manifest(self, doc_id):
+            return {"slides": slides}
+
+    monkeypatch.setattr(batch, "stream_expansion", fake_stream)
+    monkeypatch.setattr(buildup, "stream_expansion", fake_stream)
+    monkeypatch.setattr(batch, "get_store", lambda: Store())
+    monkeypatch.setattr(batch, "_semaphores", {})
+    monkeypatch.setenv("BATCH_CONCURRENCY_BENCHTEST", "2")
+    from services import cache
+    monkeypatch.setattr(cache, "_cache", cache.ExpansionCache(str(tmp_path), 64, 1 << 20, 3600))
+
+    async def main():
+        # Starts on the last step of the first build-up, so its earlier
+        # steps are only expanded through with_earlier_steps
+        return [r async for r in batch.expand_batch("doc", start=4, provider="benchtest", include_text=False)]
+
+    records = asyncio.run(asyncio.wait_for(main(), 10))
+    assert records[-1]["failed"] == []
+    assert len(records[-1]["completed"]) == len(slides) - 3
+    assert peak <= 2
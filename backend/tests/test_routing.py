@@ -0,0 +1,15 @@
+from services.routing import Candidate, ProviderRouter
+
+def candidates(*models):
+    return [Candidate("gemini", model, "key", None) for model in models]
+
+def test_unmeasured_backends_keep_the_configured_order():
+    router = ProviderRouter()
+    fast, flash, pro = candidates("fast", "flash", "pro")
+    router._health(fast).record_first_token(0.4)
+    router._health(fast).record_success()
+    # Untried fallbacks don't jump ahead of a healthy, measured first choice
+    assert router.order([fast, flash, pro]) == [fast, flash, pro]
+
+    router._health(fast).record_failure(0.0)
+    assert router.order([fast, flash, pro]) == [flash, pro, fast]
@@ -0,0 +1,96 @@
+import time
+import asyncio
+
+from services import scheduler as scheduler_module
+from services.scheduler import Scheduler, priority
+from services.singleflight import SingleFlight
+
+def drained_lane(scheduler):
+    # One request per 0.1s, none left right now
+    lane = scheduler.lane("openai", "bench", "key")
+    lane.requests.capacity = 1.0
+    lane.requests.level = 0.0
+    lane.requests.rate = 10.0
+    lane.requests.updated = time.monotonic()
+    return lane
+
+async def _queue_batch(scheduler, lane, order):
+    priority.set("batch")
+    await scheduler.acquire(lane, 1, time.monotonic())
+    order.append("batch")
+
+def test_foreground_joiner_raises_queued_flight_priority():
+    async def main():
+        scheduler = Scheduler()
+        flights = SingleFlight()
+        lane = drained_lane(scheduler)
+        order = []
+
+        async def call(label):
+            await scheduler.acquire(lane, 1, time.monotonic())
+            order.append(label)
+            yield label
+
+        async def read(name, label):
+            priority.set(name)
+            return [chunk async for chunk in flights.stream("slide", lambda: call(label))]
+
+        batch = asyncio.create_task(_queue_batch(scheduler, lane, order))
+        prefetch = asyncio.create_task(read("prefetch", "flight"))
+        await asyncio.sleep(0.01)
+        # A reader opens the slide the prefetcher is (still waiting to be) expanding
+        foreground = asyncio.create_task(read("foreground", "unused"))
+        assert await foreground == ["flight"]
+        await asyncio.gather(batch, prefetch)
+        return order
+
+    assert asyncio.run(main()) == ["flight", "batch"]
+
+def test_queued_call_keeps_its_class_without_joiners():
+    async def main():
+        scheduler = Scheduler()
+        flights = SingleFlight()
+        lane = drained_lane(scheduler)
+        order = []
+
+        async def call():
+            await scheduler.acquire(lane, 1, time.monotonic())
+            order.append("flight")
+            yield "flight"
+
+        async def read():
+            priority.set("prefetch")
+            return [chunk async for chunk in flights.stream("slide", call)]
+
+        batch = asyncio.create_task(_queue_batch(scheduler, lane, order))
+        await asyncio.gather(batch, asyncio.create_task(read()))
+        return order
+
+    assert asyncio.run(main()) == ["batch", "flight"]
+
+def test_raised_call_keeps_its_longer_wait_budget(monkeypatch):
+    monkeypatch.setitem(scheduler_module.MAX_WAIT_SECONDS, "prefetch", 1.0)
+    monkeypatch.setitem(scheduler_module.MAX_WAIT_SECONDS, "foreground", 0.2)
+
+    async def main():
+        scheduler = Scheduler()
+        flights = SingleFlight()
+        lane = drained_lane(scheduler)
+        # Next request in 0.4s: past foreground's budget, within prefetch's
+        lane.requests.rate = 2.5
+
+        async def call(label):
+            await scheduler.acquire(lane, 1, time.monotonic())
+            yield label
+
+        async def read(name, label):
+            priority.set(name)
+            return [chunk async for chunk in flights.stream("slide", lambda: call(label))]
+
+        prefetch = asyncio.create_task(read("prefetch", "flight"))
+        await asyncio.sleep(0.3)
+        # The prefetch has already waited longer than a foreground call may
+        foreground = asyncio.create_task(read("foreground", "unused"))
+        return await asyncio.gather(prefetch, foreground)
+
+    assert asyncio.run(main()) == [["flight"], ["flight"]]
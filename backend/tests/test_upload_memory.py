@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+from bench.decks import make_deck
+from bench.upload_memory import measure
+
+# Each size is ingested by a fresh backend (see bench.upload_memory); the
+# spooled, page-range-at-a-time ingest should keep the API process's peak
+# RSS flat while the deck grows eightfold
+PAGES = (20, 160)
+SCAN_KB = 256
+# The larger deck is ~40 MB, so holding it in memory once would fail this
+TOLERANCE_MB = 20
+
+@pytest.mark.slow
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads peak RSS from /proc")
+def test_upload_peak_rss_flat_as_pages_grow(tmp_path):
+    rows = []
+    for pages in PAGES:
+        deck = make_deck(str(tmp_path / f"deck-{pages}.pdf"), pages=pages, scan_kb=SCAN_KB)
+        rows.append(measure(str(tmp_path), deck, pages, workers=2))
+        os.remove(deck)
+
+    assert [row["pages"] for row in rows] == list(PAGES)
+    growth = rows[-1]["api_peak_mb"] - rows[0]["api_peak_mb"]
+    assert growth < TOLERANCE_MB, rows
@@ -33,6 +33,7 @@ export async function POST(req: NextRequest) {
         'Cache-Control': 'no-cache, no-transform',
         'Connection': 'keep-alive',
         'X-Content-Type-Options': 'nosniff',
+        'X-Cache': response.headers.get('X-Cache') || 'MISS',
       },
     });
 
@@ -23,6 +23,7 @@ interface Slide {
   expandedContent?: string;
   annotations?: Annotation[];
   image?: string;
+  image_hash?: string;
 }
 
 export default function Home() {
@@ -32,6 +33,12 @@ export default function Home() {
   const [slides, setSlides] = useState<Slide[]>([]);
   const [pageNumber, setPageNumber] = useState<number>(1);
   const [isLoading, setIsLoading] = useState<boolean>(false);
+  // Server-side deck session issued at the end of ingestion
+  const [deckId, setDeckId] = useState<string | null>(null);
+  const deckIdRef = useRef<string | null>(null);
+  // Ingested document behind the session, to open a new one if it expires
+  const docIdRef = useRef<string | null>(null);
+  const renewingRef = useRef<Promise<string | null> | null>(null);
   
   // Settings State
   const [isSettingsOpen, setIsSettingsOpen] = useState(false);
@@ -61,6 +68,40 @@ export default function Home() {
   const activeRequestRef = useRef<AbortController | null>(null);
   const prefetchRequestRef = useRef<AbortController | null>(null);
 
+  // Sessions expire or get evicted server-side; open a new one on the same
+  // document. Resolves to null (and leaves no session) when that fails, so
+  // callers fall back to sending the full slide context.
+  const renewDeck = (): Promise<string | null> => {
+    if (renewingRef.current) return renewingRef.current;
+    const expired = deckIdRef.current;
+    const renewing = (async () => {
+      try {
+        if (!docIdRef.current) return null;
+        const res = await fetch('/api/v1/decks', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ doc_id: docIdRef.current, course_topic: "General" })
+        });
+        if (!res.ok) return null;
+        const { deck_id } = await res.json();
+        return deck_id || null;
+      } catch (e) {
+        console.error("Failed to renew deck session", e);
+        return null;
+      }
+    })().then((renewed) => {
+      // A new upload may have replaced the session meanwhile
+      if (deckIdRef.current === expired) {
+        deckIdRef.current = renewed;
+        setDeckId(renewed);
+      }
+      renewingRef.current = null;
+      return deckIdRef.current;
+    });
+    renewingRef.current = renewing;
+    return renewing;
+  };
+
   // Helper to generate content for a single slide
   const generateSlideContent = async (
     slide: Slide, 
@@ -72,16 +113,25 @@ export default function Home() {
   ): Promise<string> => {
     let fullContent = "";
     try {
-      const res = await fetch('/api/stream-expand', {
+      const request = () => fetch('/api/stream-expand', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
+        // With a deck session the server assembles the prompt from its own copy of the deck
+        body: JSON.stringify(deckIdRef.current ? {
+          deck_id: deckIdRef.current,
+          slide_number: slide.slide_number,
+          api_key: aiSettings.apiKey,
+          provider: aiSettings.provider,
+          model: aiSettings.model
+        } : {
           slide_content: slide.content,
           slide_number: slide.slide_number,
           prev_context: prev?.content || "",
           next_context: next?.content || "",
           course_topic: "General",
-          slide_image: slideImage,
+          // Ingested slides are referenced by asset hash instead of re-uploading the image
+          image_ref: slide.image_hash || null,
+          slide_image: slide.image_hash ? null : slideImage,
           elements: slide.elements || [],
           api_key: aiSettings.apiKey,
           provider: aiSettings.provider,
@@ -89,7 +139,13 @@ export default function Home() {
         }),
         signal
       });
-      
+
+      let res = await request();
+      if (res.status === 404 && deckIdRef.current) {
+        // Expired session: retry once on a renewed one, or with the full context
+        await renewDeck();
+        res = await request();
+      }
       if (!res.ok) throw new Error("Failed to fetch expansion");
       if (!res.body) throw new Error("No response body");
 
@@ -226,9 +282,13 @@ export default function Home() {
   };
 
   const prefetchNextSlides = async (currentSlideNum: number) => {
+    // With a deck session the server pre-expands upcoming slides itself (and
+    // treats every /expand as a real read), so don't speculate from here
+    if (deckIdRef.current) return;
+
     // Prefetch next 2 slides
     const PREFETCH_COUNT = 2;
-    
+
     // Create a new controller for this batch of prefetches
     const controller = new AbortController();
     prefetchRequestRef.current = controller;
@@ -289,26 +349,77 @@ export default function Home() {
     
     const formData = new FormData();
     formData.append('file', uploadedFile);
+    // Re-uploading a revised deck: the server reuses pages unchanged since the
+    // last version with this file name
+    const previousDocId = localStorage.getItem(`unslide_doc_${uploadedFile.name}`);
+    if (previousDocId) formData.append('previous_doc_id', previousDocId);
 
     try {
-      const res = await fetch('/api/v1/upload/pdf', {
+      const res = await fetch('/api/v1/upload/pdf/stream', {
         method: 'POST',
         body: formData,
       });
 
-      if (!res.ok) throw new Error("Upload failed");
+      if (!res.ok) {
+        // 413 (deck too large) and 503 (server busy) carry a readable detail
+        const body = await res.json().catch(() => null);
+        throw new Error(body?.detail || "Upload failed");
+      }
+      if (!res.body) throw new Error("No response body");
+
+      // NDJSON: one slide record per line as pages finish rendering, then a summary
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      const received: Slide[] = [];
+      let buffer = "";
+      let expansionStarted = false;
+      let done = false;
 
-      const data = await res.json();
-      setSlides(data.slides);
+      setSlides([]);
       setPageNumber(1);
+      deckIdRef.current = null;
+      docIdRef.current = null;
+      setDeckId(null);
+
+      while (!done) {
+        const { value, done: doneReading } = await reader.read();
+        done = doneReading;
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+        const lines = buffer.split("\n");
+        buffer = lines.pop() || "";
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const record = JSON.parse(line);
+          if (record.type === "error") throw new Error(record.detail);
+          if (record.type === "summary") {
+            deckIdRef.current = record.deck_id || null;
+            docIdRef.current = record.doc_id || null;
+            setDeckId(deckIdRef.current);
+            if (record.doc_id) localStorage.setItem(`unslide_doc_${uploadedFile.name}`, record.doc_id);
+            continue;
+          }
+          if (record.type !== "slide") continue;
+
+          const { type, ...slide } = record;
+          received.push(slide);
+          setSlides([...received]);
+
+          // Expand the first slide once its neighbour has arrived
+          if (!expansionStarted && received.length >= 2) {
+            expansionStarted = true;
+            fetchExpansion(received[0], undefined, received[1]);
+          }
+        }
+      }
 
-      // Expand the first slide
-      if (data.slides.length > 0) {
-        await fetchExpansion(data.slides[0], undefined, data.slides[1]);
+      if (!expansionStarted && received.length > 0) {
+        await fetchExpansion(received[0], undefined, received[1]);
       }
     } catch (error) {
       console.error(error);
-      setMarkdownContent("# Error\n\nFailed to upload or process PDF.");
+      const detail = error instanceof Error && error.message !== "Upload failed" ? `\n\n${error.message}` : "";
+      setMarkdownContent(`# Error\n\nFailed to upload or process PDF.${detail}`);
       setIsLoading(false);
     }
   };
@@ -360,6 +471,8 @@ export default function Home() {
         annotations={annotations}
         slides={slides}
         aiSettings={aiSettings}
+        deckId={deckId}
+        onDeckExpired={renewDeck}
         onOpenSettings={() => setIsSettingsOpen(true)}
       />
     </main>
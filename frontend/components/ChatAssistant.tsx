@@ -17,6 +17,9 @@ interface ChatAssistantProps {
   messages?: Message[];
   onMessagesChange?: (messages: Message[] | ((prev: Message[]) => Message[])) => void;
   aiSettings?: { apiKey: string; provider: string; model: string };
+  deckId?: string | null;
+  // Called when the server no longer knows `deckId`; renews the session
+  onDeckExpired?: () => Promise<string | null>;
 }
 
 export default function ChatAssistant({ 
@@ -26,7 +29,9 @@ export default function ChatAssistant({
   className,
   messages: externalMessages,
   onMessagesChange,
-  aiSettings
+  aiSettings,
+  deckId,
+  onDeckExpired
 }: ChatAssistantProps) {
   const [internalMessages, setInternalMessages] = useState<Message[]>([]);
   const messages = externalMessages || internalMessages;
@@ -71,10 +76,18 @@ export default function ChatAssistant({
     setIsLoading(true);
 
     try {
-      const res = await fetch('/api/v1/chat', {
+      const request = (deck: string | null | undefined) => fetch('/api/v1/chat', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
+        // Deck sessions keep the slide text and conversation server-side
+        body: JSON.stringify(deck ? {
+          question: userMessage,
+          deck_id: deck,
+          slide_number: slideNumber,
+          api_key: aiSettings?.apiKey,
+          provider: aiSettings?.provider,
+          model: aiSettings?.model
+        } : {
           question: userMessage,
           slide_content: slideContent,
           slide_number: slideNumber,
@@ -86,6 +99,13 @@ export default function ChatAssistant({
         }),
       });
 
+      let res = await request(deckId);
+      if (res.status === 404 && deckId) {
+        // The session expired along with its copy of the conversation: renew it
+        // for later questions and send this one with the full context
+        await onDeckExpired?.();
+        res = await request(null);
+      }
       if (!res.ok) throw new Error('Failed to fetch');
       if (!res.body) throw new Error('No response body');
       
@@ -17,17 +17,54 @@ interface PDFDownloadButtonProps {
   layout: 'vertical' | 'horizontal';
   title: string;
   fileName: string;
+  deckId?: string | null;
+  provider?: string;
+  model?: string;
 }
 
-const PDFDownloadButton = ({ slides, layout, title, fileName }: PDFDownloadButtonProps) => {
+// Builds the study guide on the server from its own copy of the deck; only
+// the expansion text we hold locally (including edits) is sent along
+const exportOnServer = async (
+  deckId: string,
+  slides: SlideData[],
+  layout: 'vertical' | 'horizontal',
+  title: string,
+  provider?: string,
+  model?: string
+): Promise<Blob> => {
+  const expansions: Record<number, string> = {};
+  for (const slide of slides) {
+    if (slide.expandedContent) expansions[slide.slide_number] = slide.expandedContent;
+  }
+  const res = await fetch('/api/v1/export/pdf', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ deck_id: deckId, layout, title, expansions, provider, model })
+  });
+  if (!res.ok) throw new Error(`Export failed: ${res.status}`);
+  return res.blob();
+};
+
+const PDFDownloadButton = ({ slides, layout, title, fileName, deckId = null, provider, model }: PDFDownloadButtonProps) => {
   const [isGenerating, setIsGenerating] = useState(false);
 
   const handleDownload = async () => {
     try {
       setIsGenerating(true);
-      const blob = await pdf(
-        <PDFDocument slides={slides} layout={layout} title={title} />
-      ).toBlob();
+      let blob: Blob | null = null;
+      if (deckId) {
+        try {
+          blob = await exportOnServer(deckId, slides, layout, title, provider, model);
+        } catch (error) {
+          // e.g. the deck session expired: fall back to rendering in the browser
+          console.warn('Server export failed, rendering locally:', error);
+        }
+      }
+      if (!blob) {
+        blob = await pdf(
+          <PDFDocument slides={slides} layout={layout} title={title} />
+        ).toBlob();
+      }
       
       const url = URL.createObjectURL(blob);
       const link = document.createElement('a');
@@ -61,6 +61,8 @@ interface SplitViewProps {
   annotations?: Annotation[];
   slides?: SlideData[];
   aiSettings?: { apiKey: string; provider: string; model: string };
+  deckId?: string | null;
+  onDeckExpired?: () => Promise<string | null>;
   onOpenSettings?: () => void;
 }
 
@@ -78,6 +80,8 @@ export default function SplitView({
   annotations = [],
   slides = [],
   aiSettings,
+  deckId = null,
+  onDeckExpired,
   onOpenSettings
 }: SplitViewProps) {
   const [numPages, setNumPages] = useState<number>(0);
@@ -622,6 +626,8 @@ export default function SplitView({
                         messages={chatMessages}
                         onMessagesChange={setChatMessages}
                         aiSettings={aiSettings}
+                        deckId={deckId}
+                        onDeckExpired={onDeckExpired}
                     />
                 </div>
                 </div>
@@ -674,6 +680,8 @@ export default function SplitView({
                                     messages={chatMessages}
                                     onMessagesChange={setChatMessages}
                                     aiSettings={aiSettings}
+                                    deckId={deckId}
+                                    onDeckExpired={onDeckExpired}
                                 />
                             )}
                         </div>
@@ -716,6 +724,8 @@ export default function SplitView({
                                     messages={chatMessages}
                                     onMessagesChange={setChatMessages}
                                     aiSettings={aiSettings}
+                                    deckId={deckId}
+                                    onDeckExpired={onDeckExpired}
                                 />
                             )}
                         </div>
@@ -793,6 +803,9 @@ export default function SplitView({
                 layout={exportLayout}
                 title={(file?.name || "Untitled").replace('.pdf', '')}
                 fileName={`${(file?.name || "Untitled").replace('.pdf', '')}_notes.pdf`}
+                deckId={deckId}
+                provider={aiSettings?.provider}
+                model={aiSettings?.model}
               />
             </div>
           </div>